@@ -1,10 +1,12 @@
 from fastapi import FastAPI, Request, Form, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
 from typing import List, Optional
+import os
 import uvicorn
 from db import Database 
+from replication import Primary, Follower
 
 # --- 1. INITIALIZATION ---
 app = FastAPI(
@@ -15,6 +17,20 @@ app = FastAPI(
 db = Database()
 templates = Jinja2Templates(directory="templates")
 
+# Replication: EDSQL_REPLICATE_FROM=host:port runs this server as a read-only
+# follower; EDSQL_REPLICATION_PORT=7070 ships this server's changes to followers.
+REPLICATE_FROM = os.environ.get("EDSQL_REPLICATE_FROM")
+REPLICATION_PORT = os.environ.get("EDSQL_REPLICATION_PORT")
+
+# Memory budget for table pages (paged and partitioned tables) held by this worker
+if os.environ.get("EDSQL_BUFFER_POOL_MB"):
+    db.set_buffer_pool(os.environ["EDSQL_BUFFER_POOL_MB"])
+
+# Deletes leave tombstones that a background thread compacts; EDSQL_AUTOVACUUM=off
+# keeps them until an explicit VACUUM
+if os.environ.get("EDSQL_AUTOVACUUM", "on").lower() == "off":
+    db.set_autovacuum(False)
+
 # --- 2. SETUP DATA (Runs on Startup) ---
 
 # A. Setup "company_db" with NEW FIELDS for the Directory App
@@ -35,13 +51,14 @@ db.create_table(
         "experience": "int",
         "tenure": "int"
     }, 
-    primary_key="id"
+    primary_key="id",
+    auto_increment="id"
 )
 
 # Seed with some initial data (Only if table is empty)
 try:
     t_emp = db.get_table("employees")
-    if len(t_emp.rows) == 0:
+    if len(t_emp.rows) == 0 and not REPLICATE_FROM:
         # id, name, role, salary, contact, address, experience, tenure
         t_emp.insert([101, "Alice Engineer", "Software Dev", 120000, "alice@pesapal.com", "Nairobi, KE", 5, 2])
         t_emp.insert([102, "Bob Manager", "Project Lead", 145000, "bob@pesapal.com", "Mombasa, KE", 8, 4])
@@ -51,6 +68,8 @@ except:
 # B. Setup "api_service_db" for the Swagger API Demo (Legacy)
 db.create_database("api_service_db")
 db.use_database("api_service_db")
+# Demo store: trade durability for write rate (flushed in the background and on exit)
+db.set_durability("batched", interval_ms=500, max_writes=1000)
 db.create_table(
     "api_users", 
     ["id", "name", "email"], 
@@ -59,6 +78,21 @@ db.create_table(
 )
 db.get_table("api_users").create_index("email")
 
+# C. Replication role (followers get their rows from the primary's stream)
+replication = None
+if REPLICATE_FROM:
+    host, _, port = REPLICATE_FROM.rpartition(":")
+    replication = Follower(db, host or "127.0.0.1", port).start()
+elif REPLICATION_PORT:
+    replication = Primary(db, port=int(REPLICATION_PORT)).start()
+
+
+@app.on_event("shutdown")
+def close_replication():
+    """A closed Primary records what it shipped, so the next one can catch followers up"""
+    if replication:
+        replication.close()
+
 
 # --- 3. ROOT REDIRECT ---
 @app.get("/", include_in_schema=False)
@@ -70,10 +104,11 @@ async def root():
 # --- 4. THE MAIN APPLICATION (Pesapal Directory) ---
 
 @app.get("/directory", response_class=HTMLResponse)
-async def employee_directory(request: Request, edit_id: int = None):
+async def employee_directory(request: Request, edit_id: int = None, sort: str = None, desc: bool = False):
     """
     Displays the Employee Directory.
     If 'edit_id' is present (clicked Edit button), it fetches that specific user.
+    'sort' orders the list by a column (?sort=salary&desc=true for highest paid first).
     """
     error_message = None
     employees_data = []
@@ -84,7 +119,7 @@ async def employee_directory(request: Request, edit_id: int = None):
         t = db.get_table("employees")
         
         if t:
-            employees_data = t.rows
+            employees_data = t.select(order_by=[[sort, "DESC" if desc else "ASC"]]) if sort else t.rows
             
             # If user clicked "Edit", find that specific employee to populate the form
             if edit_id:
@@ -141,15 +176,9 @@ async def save_employee(
             
         else:
             # --- CREATE NEW HIRE ---
-            # Generate ID manually (MAX ID + 1)
-            new_id = 1
-            if t.rows:
-                current_ids = [int(r['id'] if isinstance(r, dict) else r[0]) for r in t.rows]
-                if current_ids:
-                    new_id = max(current_ids) + 1
-            
-            print(f"Creating Employee {new_id}...")
-            t.insert([new_id, name, role, salary, contact, address, experience, tenure])
+            # ID comes from the table's AUTO_INCREMENT sequence
+            new_id = t.insert([None, name, role, salary, contact, address, experience, tenure])
+            print(f"Created Employee {new_id}.")
             
     except Exception as e:
         print(f"Failed to save employee: {e}")
@@ -206,6 +235,51 @@ def get_user_by_email(email: str):
         raise HTTPException(status_code=404, detail="User not found")
     return results[0]
 
+@app.get("/api/replication", tags=["Strict API"])
+def replication_status():
+    """Replication role, LSN and follower lag"""
+    return replication.status() if replication else {"role": "standalone"}
+
+@app.get("/api/buffer-pool", tags=["Strict API"])
+def buffer_pool_status():
+    """Budget, resident pages, hit/miss and eviction counters of the page cache"""
+    return db.buffer_pool.stats()
+
+@app.get("/api/vacuum", tags=["Strict API"])
+def vacuum_status():
+    """Background compaction: queued tables, runs and dead rows reclaimed"""
+    return db.autovacuum.stats()
+
+@app.get("/api/durability/{db_name}", tags=["Strict API"])
+def durability_status(db_name: str):
+    """Write policy, unflushed tables and the background flusher's last error"""
+    if db_name not in db.show_databases():
+        raise HTTPException(status_code=404, detail="Database not found")
+    return db.durability(db_name).stats()
+
+# --- 6. STREAMING EXPORT (Backups / ETL) ---
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+@app.get("/api/export/{db_name}/{table_name}", tags=["Export"])
+def export_table(db_name: str, table_name: str, format: str = "ndjson", order_by: str = None):
+    """Streams a table as NDJSON or CSV in chunks (constant memory per request);
+    order_by="salary DESC, name" sorts it (big tables sort through temp files)"""
+    if db_name not in db.show_databases():
+        raise HTTPException(status_code=404, detail="Database not found")
+    db.use_database(db_name)
+    t = db.get_table(table_name)
+    if not t:
+        raise HTTPException(status_code=404, detail="Table not found")
+    try:
+        chunks = t.export(format, order_by=order_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{table_name}.{format}"'}
+    )
+
 if __name__ == "__main__":
     print("-------------------------------------------------------")
     print("   EdSQL Final Server Running")
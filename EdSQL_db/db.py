@@ -1,9 +1,1096 @@
+import atexit
+import bisect
+import csv
+import heapq
+import io
 import json
 import os
+import re
 import shutil
+import tempfile
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+# Tables smaller than this are scanned on the calling thread even in parallel mode.
+# A cached parallel scan costs ~1.6x the serial CPU time plus ~1 ms per query, so
+# it only pays off on more than one CPU and well above 50k rows
+PARALLEL_MIN_ROWS = 100000
+
+PLAN_CACHE_SIZE = 128           # prepared statements kept per Database (LRU)
+
+# Paged tables keep PAGE_ROWS rows per <name>.<pid>.page file; a Database caches
+# pages (and partition segments) in a buffer pool of BUFFER_POOL_MB
+PAGE_ROWS = 1000
+BUFFER_POOL_MB = 256
+
+EXPORT_FORMATS = ("ndjson", "csv")
+DUMP_FOLDER = "_dumps"          # <root>/_dumps holds CLI dumps of non-root users; not a database
+
+# ORDER BY sorts up to this many rows in memory; bigger inputs are sorted in
+# runs spilled to temp files and merged
+SORT_BUFFER_ROWS = 50000
+
+# Deletes leave tombstones; a table is compacted in the background once its dead
+# rows exceed AUTOVACUUM_THRESHOLD + AUTOVACUUM_SCALE * its live rows
+AUTOVACUUM_THRESHOLD = 50
+AUTOVACUUM_SCALE = 0.2
+
+# A thread replaying a replication stream sets replay.active to write to replica tables
+replay = threading.local()
+
+# --- COST MODEL ---
+HISTOGRAM_BUCKETS = 10          # equi-depth buckets kept per column by ANALYZE
+INDEX_MAX_SELECTIVITY = 0.3     # above this fraction a non-covering index lookup loses to a scan
+NESTED_LOOP_MAX = 1000          # joins with |t1| * |t2| up to this skip building a hash table
+# Selectivities assumed for columns that were never analyzed
+_DEFAULT_SELECTIVITY = {"eq": 0.1, "range": 1 / 3, "like": 0.1, "null": 0.05}
+
+# --- WHERE CLAUSES ---
+# A WHERE clause is parsed once into a tuple tree (picklable, so it can be sent
+# to pool workers) and compiled into nested closures for the row loop:
+#   ("cmp", col, op, value)  ("in", col, [values])  ("like", col, pattern)
+#   ("null", col)  ("and", a, b)  ("or", a, b)  ("not", a)
+_TOKEN_RE = re.compile(r"""\s*(?:
+    (?P<str>'(?:[^']|'')*'|"(?:[^"]|"")*") |
+    (?P<op><>|!=|<=|>=|=|<|>|\(|\)|,|\?) |
+    (?P<word>[^\s'"(),=<>!?]+)
+)""", re.X)
+
+
+_SQL_OPS = {"=": "==", "!=": "!=", "<>": "!=", "<": "<", ">": ">", "<=": "<=", ">=": ">="}
+
+class _Param:
+    """A ? placeholder of a prepared statement, bound by position"""
+    __slots__ = ("index",)
+
+    def __init__(self, index):
+        self.index = index
+
+    def __repr__(self):
+        return f"?{self.index + 1}"
+
+def tokenize(sql):
+    """Splits SQL into (kind, text) tokens; quoted strings keep their spaces"""
+    tokens = []
+    pos = 0
+    sql = sql.rstrip()
+    while pos < len(sql):
+        m = _TOKEN_RE.match(sql, pos)
+        if not m or m.end() == pos:
+            raise ValueError(f"Syntax error near '{sql[pos:pos + 10]}'")
+        kind = m.lastgroup
+        text = m.group(kind)
+        if kind == "str":
+            text = text[1:-1].replace(text[0] * 2, text[0])
+        tokens.append((kind, text))
+        pos = m.end()
+    return tokens
+
+class _Parser:
+    """Recursive descent over tokens. WHERE: OR binds loosest, then AND, then NOT"""
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+        self.params = 0     # ? placeholders seen so far
+
+    def peek(self, offset=0):
+        i = self.pos + offset
+        return self.tokens[i] if i < len(self.tokens) else (None, None)
+
+    def keyword(self, *words):
+        kind, text = self.peek()
+        if kind == "word" and text.upper() in words:
+            self.pos += 1
+            return text.upper()
+        return None
+
+    def expect(self, text):
+        if self.peek()[1] != text:
+            raise ValueError(f"Expected '{text}' in WHERE clause.")
+        self.pos += 1
+
+    def value(self):
+        kind, text = self.peek()
+        if kind not in ("str", "word") and text != "?":
+            raise ValueError("Expected a value in WHERE clause.")
+        self.pos += 1
+        if kind == "op":
+            self.params += 1
+            return _Param(self.params - 1)
+        return text
+
+    def literal(self):
+        """A value where the bare word NULL means None (INSERT / SET)"""
+        kind, text = self.peek()
+        if kind == "word" and text.upper() == "NULL":
+            self.pos += 1
+            return None
+        return self.value()
+
+    def values(self):
+        """(v, v, ...) list"""
+        self.expect("(")
+        values = [self.literal()]
+        while self.peek()[1] == ",":
+            self.pos += 1
+            values.append(self.literal())
+        self.expect(")")
+        return values
+
+    def parse(self):
+        tree = self.or_expr()
+        if self.pos < len(self.tokens):
+            raise ValueError(f"Unexpected '{self.peek()[1]}' in WHERE clause.")
+        return tree
+
+    def or_expr(self):
+        tree = self.and_expr()
+        while self.keyword("OR"):
+            tree = ("or", tree, self.and_expr())
+        return tree
+
+    def and_expr(self):
+        tree = self.not_expr()
+        while self.keyword("AND"):
+            tree = ("and", tree, self.not_expr())
+        return tree
+
+    def not_expr(self):
+        if self.keyword("NOT"):
+            return ("not", self.not_expr())
+        if self.peek()[1] == "(" and self.peek()[0] == "op":
+            self.pos += 1
+            tree = self.or_expr()
+            self.expect(")")
+            return tree
+        return self.term()
+
+    def term(self):
+        kind, col = self.peek()
+        if kind != "word":
+            raise ValueError("Expected a column name in WHERE clause.")
+        self.pos += 1
+        if self.keyword("IS"):
+            negate = self.keyword("NOT")
+            if not self.keyword("NULL"):
+                raise ValueError("Expected NULL after IS.")
+            return ("not", ("null", col)) if negate else ("null", col)
+        negate = self.keyword("NOT")
+        if self.keyword("IN"):
+            self.expect("(")
+            values = [self.value()]
+            while self.peek()[1] == ",":
+                self.pos += 1
+                values.append(self.value())
+            self.expect(")")
+            tree = ("in", col, values)
+        elif self.keyword("LIKE"):
+            tree = ("like", col, self.value())
+        elif negate:
+            raise ValueError("Expected IN or LIKE after NOT.")
+        else:
+            kind, op = self.peek()
+            if kind == "op" and op in _SQL_OPS:
+                self.pos += 1
+            else:
+                op = "="   # legacy form: WHERE [col] [val]
+            tree = ("cmp", col, op, self.value())
+        return ("not", tree) if negate else tree
+
+    def ident(self, what="name"):
+        kind, text = self.peek()
+        if kind != "word":
+            raise ValueError(f"Expected a {what}.")
+        self.pos += 1
+        return text
+
+    # --- SELECT ---
+    # SELECT [*|col|FUNC(col|*) (AS alias), ...] FROM t
+    #   ([INNER|LEFT|RIGHT|FULL|CROSS] JOIN t2 ON k1 (=) k2) (WHERE ...) (GROUP BY col)
+    #   (ORDER BY col (ASC|DESC), ...) (LIMIT n)
+    def select(self):
+        if not self.keyword("SELECT"):
+            raise ValueError("Expected SELECT.")
+        plan = {"columns": None, "aggregates": [], "table": None, "join": None,
+                "where": None, "group_by": None, "order_by": None, "limit": None}
+        items = []
+        while True:
+            if self.peek()[1] == "*":
+                self.pos += 1
+            else:
+                name = self.ident("column")
+                if self.peek()[1] == "(":
+                    self.pos += 1
+                    arg = self.ident("column")
+                    self.expect(")")
+                    func = name.upper()
+                    if func not in ("COUNT", "SUM", "AVG", "MIN", "MAX"):
+                        raise ValueError(f"Unknown aggregate '{name}'.")
+                    alias = f"{func.lower()}_{arg}" if arg != "*" else func.lower()
+                    if self.keyword("AS"):
+                        alias = self.ident("alias")
+                    plan["aggregates"].append([func, arg, alias])
+                else:
+                    items.append(name)
+            if self.peek()[1] != ",":
+                break
+            self.pos += 1
+        plan["columns"] = items or None
+        if not self.keyword("FROM"):
+            raise ValueError("Expected FROM.")
+        plan["table"] = self.ident("table")
+        join_type = self.keyword("INNER", "LEFT", "RIGHT", "FULL", "CROSS")
+        if join_type == "FULL":
+            self.keyword("OUTER")
+        if self.keyword("JOIN"):
+            join = {"table": self.ident("table"), "type": join_type or "INNER"}
+            if self.keyword("ON"):
+                join["left_key"] = self.ident("join key")
+                if self.peek()[1] == "=":
+                    self.pos += 1
+                join["right_key"] = self.ident("join key")
+            elif join["type"] != "CROSS":
+                raise ValueError("Expected ON [k1] [k2].")
+            plan["join"] = join
+        elif join_type:
+            raise ValueError("Expected JOIN.")
+        if self.keyword("WHERE"):
+            plan["where"] = self.or_expr()
+        if self.keyword("GROUP"):
+            if not self.keyword("BY"):
+                raise ValueError("Expected GROUP BY.")
+            plan["group_by"] = self.ident("column")
+        if self.keyword("ORDER"):
+            if not self.keyword("BY"):
+                raise ValueError("Expected ORDER BY.")
+            plan["order_by"] = [[self.ident("column"), self.keyword("ASC", "DESC") or "ASC"]]
+            while self.peek()[1] == ",":
+                self.pos += 1
+                plan["order_by"].append([self.ident("column"), self.keyword("ASC", "DESC") or "ASC"])
+        if self.keyword("LIMIT"):
+            limit = self.value()
+            if not isinstance(limit, _Param):
+                if not limit.isdigit():
+                    raise ValueError("LIMIT expects a number.")
+                limit = int(limit)
+            plan["limit"] = limit
+        if self.pos < len(self.tokens):
+            raise ValueError(f"Unexpected '{self.peek()[1]}'.")
+        return plan
+
+    # --- DML (prepared statements) ---
+    #   INSERT INTO t ((col, ...)) VALUES (v, ...)
+    #   UPDATE t SET col = v (, col = v) (WHERE ...)
+    #   DELETE FROM t (WHERE ...)
+    def statement(self):
+        kind, text = self.peek()
+        verb = text.upper() if kind == "word" else None
+        if verb == "SELECT":
+            plan = self.select()
+            plan["kind"] = "select"
+            return plan
+        self.pos += 1
+        if verb == "INSERT":
+            if not self.keyword("INTO"):
+                raise ValueError("Expected INTO.")
+            plan = {"kind": "insert", "table": self.ident("table"), "columns": None}
+            if self.peek() == ("op", "("):
+                self.pos += 1
+                plan["columns"] = [self.ident("column")]
+                while self.peek()[1] == ",":
+                    self.pos += 1
+                    plan["columns"].append(self.ident("column"))
+                self.expect(")")
+            if not self.keyword("VALUES"):
+                raise ValueError("Expected VALUES.")
+            plan["values"] = self.values()
+        elif verb == "UPDATE":
+            plan = {"kind": "update", "table": self.ident("table"), "set": [], "where": None}
+            if not self.keyword("SET"):
+                raise ValueError("Expected SET.")
+            while True:
+                col = self.ident("column")
+                self.expect("=")
+                plan["set"].append([col, self.literal()])
+                if self.peek()[1] != ",":
+                    break
+                self.pos += 1
+            if self.keyword("WHERE"):
+                plan["where"] = self.or_expr()
+        elif verb == "DELETE":
+            if not self.keyword("FROM"):
+                raise ValueError("Expected FROM.")
+            plan = {"kind": "delete", "table": self.ident("table"), "where": None}
+            if self.keyword("WHERE"):
+                plan["where"] = self.or_expr()
+        else:
+            raise ValueError("Expected SELECT, INSERT, UPDATE or DELETE.")
+        if self.pos < len(self.tokens):
+            raise ValueError(f"Unexpected '{self.peek()[1]}'.")
+        return plan
+
+def parse_where(sql):
+    """Parses the text after WHERE into a predicate tree"""
+    parser = _Parser(tokenize(sql))
+    tree = parser.parse()
+    if parser.params:
+        raise ValueError("? parameters need a prepared statement (PREPARE / db.prepare).")
+    return tree
+
+def parse_select(sql):
+    """Parses a SELECT statement into a plan dict (table, join, where, group_by, ...)"""
+    parser = _Parser(tokenize(sql))
+    plan = parser.select()
+    if parser.params:
+        raise ValueError("? parameters need a prepared statement (PREPARE / db.prepare).")
+    return plan
+
+def parse_values(sql):
+    """Parses a literal list: 'quoted text', 42, NULL (EXECUTE arguments)"""
+    parser = _Parser(tokenize(f"({sql})"))
+    values = parser.values()
+    if parser.params or parser.pos < len(parser.tokens):
+        raise ValueError("Arguments must be literal values.")
+    return values
+
+def bind(tree, args):
+    """The WHERE tree with every ? replaced by its argument"""
+    if tree is None:
+        return None
+    kind = tree[0]
+    if kind in ("and", "or"):
+        return (kind, bind(tree[1], args), bind(tree[2], args))
+    if kind == "not":
+        return ("not", bind(tree[1], args))
+    if kind == "cmp":
+        return ("cmp", tree[1], tree[2], _arg(tree[3], args))
+    if kind == "in":
+        return ("in", tree[1], [_arg(v, args) for v in tree[2]])
+    if kind == "like":
+        return ("like", tree[1], _arg(tree[2], args))
+    return tree
+
+def _arg(value, args):
+    return args[value.index] if isinstance(value, _Param) else value
+
+def where_columns(tree):
+    if tree is None:
+        return set()
+    if tree[0] in ("and", "or"):
+        return where_columns(tree[1]) | where_columns(tree[2])
+    if tree[0] == "not":
+        return where_columns(tree[1])
+    return {tree[1]}
+
+def equality_terms(tree):
+    """{col: value} for the col = value terms AND-ed at the top of the tree"""
+    if tree is None:
+        return {}
+    if tree[0] == "cmp" and tree[2] == "=":
+        return {tree[1]: tree[3]}
+    if tree[0] == "and":
+        return {**equality_terms(tree[2]), **equality_terms(tree[1])}
+    return {}
+
+class _NoValue:
+    """Stands in for a stored value that cannot be converted; never matches"""
+    __eq__ = __ne__ = __lt__ = __le__ = __gt__ = __ge__ = lambda self, other: False
+    __hash__ = object.__hash__
+
+_NO_VALUE = _NoValue()
+
+def _converter(target):
+    def convert(value):
+        try:
+            return target(value)
+        except (TypeError, ValueError):
+            return _NO_VALUE
+    return convert
+
+_TYPES = {"int": int, "float": float, "str": str}
+
+def _coerce(value, col, types):
+    """(target type, value) with the constant converted to the column's declared type"""
+    target = _TYPES.get(types.get(col), str)
+    try:
+        return target, target(value)
+    except (TypeError, ValueError):
+        return str, str(value)
+
+def equality_keys(tree, types):
+    """{col: index key} for the top-level equalities; constants take the column's
+    declared type first, so '05' probes an int index as 5, as the scan compares"""
+    return {col: str(_coerce(val, col, types)[1]) for col, val in equality_terms(tree).items()}
+
+def _like_matcher(pattern):
+    pattern = "".join(".*" if ch == "%" else "." if ch == "_" else re.escape(ch) for ch in str(pattern))
+    return re.compile(pattern + r"\Z", re.S).match
+
+def _predicate_source(tree, types, env):
+    """Python expression for a predicate tree; constants are bound into env.
+    ? parameters leave a slot in env["_slots"] that _bind_env fills per execution."""
+    kind = tree[0]
+    if kind in ("and", "or"):
+        return f"({_predicate_source(tree[1], types, env)} {kind} {_predicate_source(tree[2], types, env)})"
+    if kind == "not":
+        return f"(not {_predicate_source(tree[1], types, env)})"
+    col = repr(tree[1])
+    if kind == "null":
+        return f"(row.get({col}) is None)"
+    n = len(env)
+    v, c = f"_v{n}", f"_c{n}"
+    if kind == "like":
+        if isinstance(tree[2], _Param):
+            env[c] = None  # placeholder keeps the _v/_c numbering unique
+            env.setdefault("_slots", []).append((n, tree))
+        else:
+            env[c] = _like_matcher(tree[2])
+        return f"(({v} := row.get({col})) is not None and {c}(str({v})) is not None)"
+    target = _TYPES.get(types.get(tree[1]), str)
+    env[f"_t{n}"] = target
+    env[f"_to{n}"] = str if target is str else _converter(target)
+    value = f"({v} if type({v}) is _t{n} else _to{n}({v}))"
+    if kind == "in":
+        if any(isinstance(x, _Param) for x in tree[2]):
+            env[c] = None
+            env.setdefault("_slots", []).append((n, tree))
+        else:
+            consts = [_coerce(x, tree[1], types) for x in tree[2]]
+            env[c] = {const for t, const in consts if t is target}
+        return f"(({v} := row.get({col})) is not None and {value} in {c})"
+    if isinstance(tree[3], _Param):
+        env[c] = None
+        env.setdefault("_slots", []).append((n, tree))
+        t = target
+    else:
+        t, env[c] = _coerce(tree[3], tree[1], types)
+    if t is not target:
+        # Constant is not a valid value of the column type: compare as text
+        env[f"_t{n}"], env[f"_to{n}"] = str, str
+    if tree[2] == "=":
+        # Fast path: stored value already has the column type
+        return f"(({v} := row.get({col})) == {c} or type({v}) is not _t{n} and {v} is not None and _to{n}({v}) == {c})"
+    return f"(({v} := row.get({col})) is not None and {value} {_SQL_OPS[tree[2]]} {c})"
+
+def compile_predicate(tree, types=None):
+    """Compiles a predicate tree into one generated function over a row dict.
+    Constants are converted to the column type once; row values are only
+    converted when their stored type differs (rows written as text by older versions)."""
+    if tree is None:
+        return lambda row: True
+    env = {}
+    return eval(f"lambda row: {_predicate_source(tree, types or {}, env)}", env)
+
+def compile_filter(tree, types=None):
+    """Like compile_predicate, but the loop over rows is generated too (skipping tombstones)"""
+    if tree is None:
+        return lambda rows: [row for row in rows if row is not None]
+    env = {}
+    return eval(f"lambda rows: [row for row in rows if row is not None and ({_predicate_source(tree, types or {}, env)})]", env)
+
+def compile_template(tree, types=None, loop=False):
+    """(code, env) for a tree that may hold ? parameters; see instantiate()"""
+    env = {}
+    source = _predicate_source(tree, types or {}, env) if tree is not None else "True"
+    text = f"lambda rows: [row for row in rows if row is not None and ({source})]" if loop else f"lambda row: {source}"
+    return compile(text, "<where>", "eval"), env
+
+def instantiate(template, args, types=None):
+    """Predicate (or filter) of a compiled template with the arguments bound"""
+    code, env = template
+    return eval(code, _bind_env(env, args, types or {}) if "_slots" in env else env)
+
+def _bind_env(env, args, types):
+    env = dict(env)
+    for n, node in env["_slots"]:
+        kind, col = node[0], node[1]
+        if kind == "like":
+            env[f"_c{n}"] = _like_matcher(_arg(node[2], args))
+        elif kind == "in":
+            consts = [_coerce(_arg(x, args), col, types) for x in node[2]]
+            env[f"_c{n}"] = {const for t, const in consts if t is env[f"_t{n}"]}
+        else:
+            t, env[f"_c{n}"] = _coerce(_arg(node[3], args), col, types)
+            if t is not env[f"_t{n}"]:
+                # Argument is not a valid value of the column type: compare as text
+                env[f"_t{n}"], env[f"_to{n}"] = str, str
+    return env
+
+# --- SORTING (ORDER BY) ---
+# Index key of NULL. str(None) would file it with the string "None"; this is a
+# string too (index files are JSON), but one no CLI or SQL literal can produce
+_NULL_KEY = "\x00NULL"
+
+def _index_key(value):
+    return _NULL_KEY if value is None else str(value)
+
+def _sort_key(kind, desc=False):
+    """Typed sort key of one column: values compare as the declared type,
+    unconvertible values sort after them and NULLs sort last (also when the
+    key is reversed for DESC)"""
+    target = _TYPES.get(kind, str)
+    bad, null = (-1, -2) if desc else (1, 2)
+    def key(value):
+        if value is None:
+            return (null, 0)
+        try:
+            return (0, target(value))
+        except (TypeError, ValueError):
+            return (bad, str(value))
+    return key
+
+class _Desc:
+    """Inverts a sort key (DESC terms of a mixed ASC/DESC ORDER BY)"""
+    __slots__ = ("key",)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+def order_terms(order_by, columns=None):
+    """[(col, descending), ...] from "col DESC, col2", [[col, "DESC"], ...] or a column name"""
+    if not order_by:
+        return []
+    if isinstance(order_by, str):
+        order_by = [term.split() for term in order_by.split(",")]
+    terms = []
+    for term in order_by:
+        col, direction = (term, "ASC") if isinstance(term, str) else (term[0], term[1] if len(term) > 1 else "ASC")
+        if direction.upper() not in ("ASC", "DESC"):
+            raise ValueError(f"Unknown sort direction '{direction}'.")
+        if columns is not None and col not in columns:
+            raise ValueError(f"Unknown column '{col}' in ORDER BY.")
+        terms.append((col, direction.upper() == "DESC"))
+    return terms
+
+def _row_order(order, types):
+    """(key, reverse) for sorted()/heapq; mixed directions wrap the DESC terms"""
+    keys = [(col, _sort_key(types.get(col), desc), desc) for col, desc in order]
+    reverse = all(desc for _, _, desc in keys)
+    if reverse or not any(desc for _, _, desc in keys):
+        return (lambda row: tuple(k(row.get(col)) for col, k, _ in keys)), reverse
+    return (lambda row: tuple(_Desc(k(row.get(col))) if desc else k(row.get(col)) for col, k, desc in keys)), False
+
+def order_rows(rows, order, types=None, limit=None, buffer_rows=SORT_BUFFER_ROWS):
+    """Iterator over rows in ORDER BY order ([(col, descending), ...]).
+    With a LIMIT only the best rows are kept (bounded heap); without one, inputs
+    over buffer_rows are sorted externally. No order: LIMIT just stops early."""
+    if not order:
+        return iter(rows) if limit is None else islice(rows, limit)
+    key, reverse = _row_order(order, types or {})
+    if limit is not None and limit <= buffer_rows:
+        pick = heapq.nlargest if reverse else heapq.nsmallest
+        return iter(pick(limit, rows, key=key))
+    ordered = _external_sort(iter(rows), key, reverse, buffer_rows)
+    return ordered if limit is None else islice(ordered, limit)
+
+def _external_sort(rows, key, reverse, buffer_rows):
+    """Sorts in memory when the input fits in buffer_rows; otherwise writes
+    sorted runs of buffer_rows to temp files (NDJSON) and merges them"""
+    runs = []
+    try:
+        while True:
+            chunk = list(islice(rows, buffer_rows))
+            chunk.sort(key=key, reverse=reverse)
+            if not runs and len(chunk) < buffer_rows:
+                yield from chunk
+                return
+            if not chunk:
+                break
+            run = tempfile.TemporaryFile("w+", encoding="utf-8")
+            run.writelines(json.dumps(row) + "\n" for row in chunk)
+            run.seek(0)
+            runs.append(run)
+        yield from heapq.merge(*[map(json.loads, run) for run in runs], key=key, reverse=reverse)
+    finally:
+        for run in runs:
+            run.close()
+
+# --- PARALLEL WORKERS (module level so the process pool can import them) ---
+# Decoded chunks / hash tables cached per worker process, keyed by shared block
+_CHUNK_CACHE = {}
+_BUILD_CACHE = {}
+_FILTER_CACHE = {}      # compiled WHERE trees
+_WORKER_CACHE_BLOCKS = 4
+
+def _share_chunks(chunks):
+    """Encodes each chunk once into a shared memory block instead of pickling rows per task"""
+    payloads = [json.dumps(chunk, separators=(",", ":")).encode() for chunk in chunks]
+    shm = shared_memory.SharedMemory(create=True, size=max(1, sum(len(p) for p in payloads)))
+    spans = []
+    offset = 0
+    for p in payloads:
+        shm.buf[offset:offset + len(p)] = p
+        spans.append((offset, len(p)))
+        offset += len(p)
+    return shm, spans
+
+def _read_chunk(shm_name, offset, length):
+    chunks = _CHUNK_CACHE.get(shm_name)
+    if chunks is None:
+        if len(_CHUNK_CACHE) >= _WORKER_CACHE_BLOCKS:
+            _CHUNK_CACHE.pop(next(iter(_CHUNK_CACHE)))
+        chunks = _CHUNK_CACHE[shm_name] = {}
+    if offset not in chunks:
+        shm = shared_memory.SharedMemory(name=shm_name)
+        try:
+            chunks[offset] = json.loads(bytes(shm.buf[offset:offset + length]))
+        finally:
+            shm.close()
+    return chunks[offset]
+
+def _scan_chunk(shm_name, offset, length, where, types):
+    """Returns positions (within the chunk) of rows matching the WHERE tree"""
+    rows = _read_chunk(shm_name, offset, length)
+    key = repr((where, types))
+    positions = _FILTER_CACHE.get(key)
+    if positions is None:
+        # The loop is generated too, as in compile_filter (a call per row costs as much as the test)
+        env = {}
+        source = _predicate_source(where, types or {}, env) if where is not None else "True"
+        positions = eval(f"lambda rows: [i for i, row in enumerate(rows) if {source}]", env)
+        if len(_FILTER_CACHE) >= PLAN_CACHE_SIZE:
+            _FILTER_CACHE.pop(next(iter(_FILTER_CACHE)))
+        _FILTER_CACHE[key] = positions
+    return positions(rows)
+
+def _probe_chunk(build_name, build_spans, key2, shm_name, offset, length, key1):
+    """Probes a chunk of the outer table against the (per-worker cached) hash of the inner one"""
+    build = _BUILD_CACHE.get((build_name, key2))
+    if build is None:
+        build = {}
+        j = 0
+        for off, ln in build_spans:
+            for r2 in _read_chunk(build_name, off, ln):
+                build.setdefault(str(r2.get(key2)), []).append(j)
+                j += 1
+        if len(_BUILD_CACHE) >= _WORKER_CACHE_BLOCKS:
+            _BUILD_CACHE.pop(next(iter(_BUILD_CACHE)))
+        _BUILD_CACHE[(build_name, key2)] = build
+    rows = _read_chunk(shm_name, offset, length)
+    matches = []
+    for i, r1 in enumerate(rows):
+        js = build.get(str(r1.get(key1)))
+        if js:
+            matches.append((i, js))
+    return matches
+
+def _usable_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+class ParallelExecutor:
+    """Chunked scans and hash-join probes across a process pool (one per session).
+
+    A table is encoded into shared memory once per version and reused by later
+    queries; workers decode each chunk once and keep it until the block changes.
+    Encoding costs far more than a serial scan, so a version is only shared once
+    it is queried a second time: tables that keep changing are scanned serially.
+    """
+    def __init__(self, workers=1, min_rows=PARALLEL_MIN_ROWS):
+        self.workers = max(1, int(workers))
+        self.min_rows = min_rows
+        self.cpus = _usable_cpus()
+        self._pool = None
+        self._shared = {}   # table file -> (version, shm, spans, chunk_size, rows encoded)
+        self._seen = {}     # table file -> version queried last (not shared yet)
+        atexit.register(self.shutdown)
+
+    def possible(self):
+        """Whether workers and CPUs allow any parallel query (check before counting rows)"""
+        return self.workers >= 2 and self.cpus >= 2
+
+    def enabled(self, row_count, *tables):
+        """Whether a query over row_count rows (of tables, if given) should go parallel"""
+        if not self.possible() or row_count < self.min_rows:
+            return False
+        return all([self._reusable(t) for t in tables])
+
+    def _reusable(self, table):
+        cached = self._shared.get(table.filename)
+        if cached and cached[0] == table.version:
+            return True
+        seen = self._seen.get(table.filename) == table.version
+        self._seen[table.filename] = table.version
+        return seen
+
+    def set_workers(self, workers):
+        workers = max(1, int(workers))
+        if workers != self.workers:
+            self.shutdown()
+            self.workers = workers
+
+    def shutdown(self):
+        if self._pool:
+            self._pool.shutdown()
+            self._pool = None
+        for key in list(self._shared):
+            self._release(key)
+
+    def _release(self, key):
+        shm = self._shared.pop(key)[1]
+        shm.close()
+        shm.unlink()
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def _share(self, table):
+        """Shared-memory copy of a table, split into a few chunks per worker.
+        Also returns the rows it encodes: worker positions index into them."""
+        key = table.filename
+        cached = self._shared.get(key)
+        if cached and cached[0] == table.version:
+            return cached[1:]
+        if cached:
+            self._release(key)
+        rows = table.rows
+        size = max(1, -(-len(rows) // (self.workers * 4)))
+        shm, spans = _share_chunks([rows[i:i + size] for i in range(0, len(rows), size)])
+        self._shared[key] = (table.version, shm, spans, size, rows)
+        return shm, spans, size, rows
+
+    def scan(self, table, where, types=None):
+        shm, spans, size, rows = self._share(table)
+        pool = self._get_pool()
+        futures = [pool.submit(_scan_chunk, shm.name, off, ln, where, types) for off, ln in spans]
+        results = []
+        for n, future in enumerate(futures):
+            base = n * size
+            results.extend(rows[base + i] for i in future.result())
+        return results
+
+    def hash_join(self, t1, t2, key1, key2):
+        """Returns ({i: [j, ...]} for every row of t1 that has matches in t2, rows1, rows2)"""
+        shm2, spans2, _, rows2 = self._share(t2)
+        shm1, spans1, size, rows1 = self._share(t1)
+        pool = self._get_pool()
+        futures = [pool.submit(_probe_chunk, shm2.name, spans2, key2, shm1.name, off, ln, key1) for off, ln in spans1]
+        matches = {}
+        for n, future in enumerate(futures):
+            base = n * size
+            for i, js in future.result():
+                matches[base + i] = js
+        return matches, rows1, rows2
+
+# --- DURABILITY ---
+DURABILITY_MODES = ("strict", "batched", "memory")
+
+def _write_json(path, data, sync=False, indent=4):
+    """Replaces path atomically (temp file + rename); sync=True also fsyncs it"""
+    tmp = path + ".tmp"
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=indent)
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+class Durability:
+    """Write policy of one database.
+
+    strict  - every commit is written and fsynced before the write returns
+    batched - commits only mark the table dirty; a background thread flushes
+              dirty tables every interval_ms or as soon as max_writes pile up
+    memory  - dirty tables are written only on checkpoint() or at shutdown
+
+    deferred (any mode) holds every commit like memory does until the flag is
+    cleared; the script runner's --batch mode uses it.
+    """
+    def __init__(self, mode="strict", interval_ms=200, max_writes=1000):
+        if mode not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode '{mode}' (use {', '.join(DURABILITY_MODES)}).")
+        self.mode = mode
+        self.interval_ms = max(1, int(interval_ms))
+        self.max_writes = max(1, int(max_writes))
+        self.dirty = {}             # filename -> table with unflushed commits
+        self.pending = 0            # commits since the last flush
+        self.deferred = False       # hold every commit until checkpoint() (script --batch)
+        self.flushes = 0            # background checkpoints run
+        self.error = None           # last error of a background checkpoint (tables stay dirty)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = None
+        if mode == "batched":
+            self._thread = threading.Thread(target=self._run, name="edsql-flusher", daemon=True)
+            self._thread.start()
+        if mode != "strict":
+            atexit.register(self.close)
+
+    def settings(self):
+        return {"mode": self.mode, "interval_ms": self.interval_ms, "max_writes": self.max_writes}
+
+    def stats(self):
+        with self._lock:
+            return {**self.settings(), "dirty": len(self.dirty), "pending": self.pending,
+                    "flushes": self.flushes, "error": self.error}
+
+    def commit(self, table):
+        if (self.mode == "strict" and not self.deferred) or self._closed:
+            table.flush(sync=True)
+            return
+        with self._lock:
+            self.dirty[table.filename] = table
+            self.pending += 1
+            full = self.pending >= self.max_writes
+        if full and self.mode == "batched" and not self.deferred:
+            self._wake.set()
+
+    def checkpoint(self):
+        """Writes (and fsyncs) every dirty table; returns how many were flushed"""
+        with self._lock:
+            batch = [(t, t.version) for t in self.dirty.values()]
+            self.pending = 0
+        for t, version in batch:
+            t.flush(sync=True)
+            with self._lock:
+                # Tables written to again during the flush stay dirty
+                if self.dirty.get(t.filename) is t and t.version == version:
+                    del self.dirty[t.filename]
+        return len(batch)
+
+    def forget(self, table):
+        with self._lock:
+            self.dirty.pop(table.filename, None)
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.interval_ms / 1000.0)
+            self._wake.clear()
+            if not self._closed and not self.deferred:
+                try:
+                    self.checkpoint()
+                    self.flushes += 1
+                except Exception as e:
+                    # e.g. a full disk: report it and retry next round (the
+                    # tables that failed stay dirty) instead of losing the thread
+                    self.error = f"{type(e).__name__}: {e}"
+
+    def close(self, flush=True):
+        """Stops the flusher and (by default) writes what is still dirty"""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        if flush:
+            self.checkpoint()
+        else:
+            self.dirty.clear()
+
+# --- BUFFER POOL ---
+class BufferPool:
+    """LRU cache of the loaded pages (paged tables) and segments (partitioned
+    tables) of a Database, bounded by an estimated memory budget.
+
+    Tables report every page they use. At the end of each table operation
+    evict() drops least recently used pages until the estimate fits the
+    budget again; a dirty page's table is flushed first (write-back). Pages of
+    a table another thread is writing are skipped. The indexes of paged tables
+    stay resident but are charged too, leaving less room for pages.
+    """
+    def __init__(self, budget_mb=BUFFER_POOL_MB):
+        self.budget = 0
+        self.resize(budget_mb)
+        self.frames = OrderedDict()     # (id(table), sid) -> [table, sid, estimated bytes]
+        self.pinned = {}                # id(table) -> [table, bytes] of resident paged-table indexes
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writebacks = 0
+        self._lock = threading.RLock()
+
+    def resize(self, budget_mb):
+        if float(budget_mb) <= 0:
+            raise ValueError("Buffer pool budget must be positive.")
+        self.budget = int(float(budget_mb) * 1024 * 1024)
+
+    def access(self, table, sid, loaded=False):
+        """Marks a resident page as most recently used (loaded=True: just read from disk)"""
+        key = (id(table), sid)
+        size = len(table.segments.get(sid, ())) * table.row_bytes
+        with self._lock:
+            frame = self.frames.get(key)
+            if frame is None:
+                frame = self.frames[key] = [table, sid, 0]
+            else:
+                self.frames.move_to_end(key)
+            if loaded:
+                self.misses += 1
+            else:
+                self.hits += 1
+            self.used += size - frame[2]
+            frame[2] = size
+
+    def pin(self, table, size):
+        """Charges memory that cannot be evicted (a paged table's index) against the budget"""
+        with self._lock:
+            entry = self.pinned.setdefault(id(table), [table, 0])
+            self.used += size - entry[1]
+            entry[1] = size
+
+    def evict(self):
+        """Drops least recently used pages until the pool fits its budget; returns how many"""
+        with self._lock:
+            dropped = 0
+            for key in list(self.frames):
+                if self.used <= self.budget:
+                    break
+                table, sid, size = self.frames[key]
+                if not table._lock.acquire(blocking=False):
+                    continue  # a writer on another thread owns this table
+                try:
+                    if sid in table._dirty_segments:
+                        table.flush()
+                        self.writebacks += 1
+                    table.segments.pop(sid, None)
+                finally:
+                    table._lock.release()
+                del self.frames[key]
+                self.used -= size
+                dropped += 1
+            self.evictions += dropped
+            return dropped
+
+    def discard(self, table=None, folder=None):
+        """Forgets the pages of a dropped table (or of every table in folder) without writing them"""
+        with self._lock:
+            for key, (t, sid, size) in list(self.frames.items()):
+                if t is table or (folder and t.folder == folder):
+                    del self.frames[key]
+                    self.used -= size
+            for key, (t, size) in list(self.pinned.items()):
+                if t is table or (folder and t.folder == folder):
+                    del self.pinned[key]
+                    self.used -= size
+
+    def stats(self):
+        with self._lock:
+            return {
+                "budget_mb": round(self.budget / 1048576, 2),
+                "used_mb": round(self.used / 1048576, 2),
+                "pages": len(self.frames),
+                "index_mb": round(sum(size for _, size in self.pinned.values()) / 1048576, 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "writebacks": self.writebacks,
+            }
+
+# --- VACUUM ---
+class AutoVacuum:
+    """Background compaction of the tables of a Database.
+
+    Deletes only tombstone a row, so every delete that leaves a table over the
+    dead-row limit (see Table.needs_vacuum) queues it here, and a daemon thread
+    runs its VACUUM: live rows are rewritten densely and indexes rebuilt in one
+    pass under the table's write lock.
+    """
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.pending = OrderedDict()    # filename -> table waiting for compaction
+        self.running = None             # table being compacted
+        self.runs = 0
+        self.reclaimed = 0              # dead slots removed so far
+        self.error = None
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._thread = None
+        self._stop = None
+
+    def request(self, table):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.pending[table.filename] = table
+            if self._thread is None:
+                self._stop = threading.Event()
+                self._thread = threading.Thread(target=self._run, args=(self._stop,), name="edsql-autovacuum",
+                                                daemon=True)
+                self._thread.start()
+            self._changed.notify_all()
+
+    def forget(self, table=None, folder=None):
+        """Drops queued work for a dropped table (or every table in folder)"""
+        with self._lock:
+            for key, t in list(self.pending.items()):
+                if t is table or (folder and t.folder == folder):
+                    del self.pending[key]
+
+    def _run(self, stop):
+        while True:
+            with self._lock:
+                self._changed.wait_for(lambda: self.pending or stop.is_set())
+                if stop.is_set():
+                    return
+                _, self.running = self.pending.popitem(last=False)
+            try:
+                reclaimed = self.running.vacuum()
+            except (OSError, ValueError) as e:
+                reclaimed, self.error = 0, str(e)
+            with self._lock:
+                self.runs += 1
+                self.reclaimed += reclaimed
+                self.running = None
+                self._changed.notify_all()
+
+    def wait(self, timeout=5.0):
+        """Blocks until every queued table is compacted; returns False on timeout"""
+        with self._lock:
+            return self._changed.wait_for(lambda: not self.pending and self.running is None, timeout)
+
+    def stats(self):
+        with self._lock:
+            return {"enabled": self.enabled, "pending": len(self.pending), "runs": self.runs,
+                    "reclaimed": self.reclaimed, "error": self.error}
+
+    def close(self):
+        """Finishes the table being compacted and stops the thread; queued tables
+        keep their tombstones until the next request starts a new one"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread:
+                self._stop.set()
+                self._changed.notify_all()
+        if thread and thread is not threading.current_thread():
+            thread.join()
+
+class _PageView:
+    """Read-only positional view of a paged table: view[pos] loads only the page
+    holding pos (None for a deleted slot), iterating streams the live rows page by page"""
+    def __init__(self, table):
+        self.table = table
+
+    def __len__(self):
+        return self.table.paging["pages"] * self.table.paging["page_rows"]
+
+    def __getitem__(self, pos):
+        page = self.table._segment(pos // self.table.paging["page_rows"])
+        slot = pos % self.table.paging["page_rows"]
+        return page[slot] if slot < len(page) else None
+
+    def __iter__(self):
+        return self.table.scan()
 
 class Table:
-    def __init__(self, name, columns, types=None, primary_key=None, foreign_keys=None, folder="."):
+    def __init__(self, name, columns, types=None, primary_key=None, foreign_keys=None, folder=".", partition=None,
+                 auto_increment=None, page_rows=None):
         self.name = name
         self.columns = columns
         self.types = types or {}
@@ -12,9 +1099,71 @@ class Table:
         self.foreign_keys = foreign_keys or {} 
         self.rows = []
         self.indexes = {} 
+        self.index_defs = {}        # composite / covering: name -> {"columns": [...], "include": [...]}
+        self._key_order = {}        # index name -> its leading keys in sorted order (ORDER BY through an index)
+        self.sort_buffer_rows = SORT_BUFFER_ROWS
         self.folder = folder
         self.filename = os.path.join(folder, f"{name}.json")
+        # Partitioning: {"column": pk, "method": "hash", "count": N}
+        #           or {"column": pk, "method": "range", "bounds": [b1, b2, ...]}
+        # For partitioned tables <name>.json is only a manifest; rows live in
+        # <name>.<sid>.seg files and each segment keeps its own local indexes.
+        self.partition = self._normalize_partition(partition, primary_key)
+        # Paging: {"page_rows": N, "pages": P, "live": L}. Rows live in <name>.<pid>.page
+        # files in insertion order; a deleted row leaves a None slot so positions
+        # (pid * page_rows + slot) stay stable and one table-wide index can point
+        # into any page. It is stored split by page (<name>.<pid>.idx holds the
+        # entries of that page's rows), so a commit rewrites only the touched pages.
+        self.paging = self._normalize_paging(page_rows, primary_key, partition)
+        self.segments = {}          # sid -> rows (only segments/pages loaded so far)
+        self.segment_indexes = {}   # sid -> {col: {val: [pos]}}
+        self._dirty_segments = set()
+        self._index_bytes = {}      # pid -> size of its stored index part (charged to the pool)
+        self.executor = None        # ParallelExecutor attached by Database
+        self.pool = None            # BufferPool attached by Database (None = keep every loaded segment)
+        self.row_bytes = 100        # estimated memory per row, measured as segments load
+        self.listeners = []         # callables(table, op, old_row, new_row) fired after each write
+        self.read_only = False      # materialized views are only written by their maintainer
+        self.view_state = None      # maintenance state of a materialized view, committed with its rows
+        self.vacuumer = None        # AutoVacuum attached by Database (None = compact only on vacuum())
+        self.version = 0            # bumped on every save (invalidates shared copies)
+        self.durability = None      # Durability policy attached by Database (None = plain write)
+        self.stats = None           # ANALYZE output, persisted in <name>.stats
+        self.schema_version = 0     # bumped when indexes/sequence/stats change (replans prepared statements)
+        # AUTO_INCREMENT sequence: {"column": col, "next": n}, persisted in the manifest
+        self.auto_increment = None
+        self._lock = threading.RLock()
         self.load()
+        if self.primary_key and self.primary_key not in self.indexes:
+            # PK checks, updates and deletes find rows through this index (partitioned
+            # tables keep it per segment); tables saved without it get it here
+            self.indexes[self.primary_key] = {}
+            if not self.partition:
+                self._rebuild_indexes()
+            if self.partition or self.paging:
+                self.save()
+        if not self.partition and self._legacy_null_keys():
+            # Saved when NULLs were filed under "None", the key of the string "None"
+            self._rebuild_indexes()
+            if self.paging:
+                self.save()
+        if auto_increment and not self.auto_increment:
+            self.enable_auto_increment(auto_increment)
+
+    @property
+    def rows(self):
+        if not self.partition and not self.paging:
+            # A snapshot: deletes tombstone slots of _rows in place
+            return [row for row in self._rows if row is not None]
+        # Partitioned and paged tables materialize every segment (use select/scan instead)
+        return [row for sid in self.segment_ids() for row in self._segment(sid) if row is not None]
+
+    @rows.setter
+    def rows(self, value):
+        # A deleted row leaves a None slot (tombstone) until VACUUM, so the
+        # positions held by indexes stay valid
+        self._rows = value
+        self._dead = value.count(None)
 
     def load(self):
         if os.path.exists(self.filename):
@@ -25,73 +1174,784 @@ class Table:
                     self.types = data.get('types', {})
                     self.primary_key = data.get('primary_key', None)
                     self.foreign_keys = data.get('foreign_keys', {})
+                    self.partition = data.get('partition', None)
+                    self.paging = data.get('paging', None)
                     self.rows = data.get('rows', [])
                     self.indexes = data.get('indexes', {})
+                    self.index_defs = data.get('index_defs', {})
+                    self.auto_increment = data.get('auto_increment', None)
+                    self.view_state = data.get('view', None)
+                if self.paging:
+                    self._load_page_indexes()
+                if os.path.exists(self._stats_file()):
+                    with open(self._stats_file(), 'r') as f:
+                        self.stats = json.load(f)
             except json.JSONDecodeError:
                 print(f"⚠️ {self.filename} corrupted.")
         else:
             self.save()
 
     def save(self):
+        """Commits a change: the durability policy decides when it reaches disk"""
+        self.version += 1
+        if self.durability:
+            self.durability.commit(self)
+        else:
+            self.flush()
+
+    def flush(self, sync=False):
+        """Writes the manifest/rows and any dirty segments"""
+        with self._lock:
+            self._flush(sync)
+
+    def _flush(self, sync):
         data = {
             "columns": self.columns,
             "types": self.types,
             "primary_key": self.primary_key,
             "foreign_keys": self.foreign_keys,
-            "rows": self.rows,
-            "indexes": self.indexes
+            "index_defs": self.index_defs,
+            "auto_increment": self.auto_increment,
         }
+        if self.partition or self.paging:
+            # Manifest only: rows live in segments/pages, index data in .idx files
+            data["partition"] = self.partition
+            data["paging"] = self.paging
+            data["rows"] = []
+            data["indexes"] = {col: {} for col in self.indexes}
+        else:
+            data["rows"] = self._rows
+            data["indexes"] = self.indexes
+        if self.view_state is not None:
+            data["view"] = self.view_state
         try:
-            with open(self.filename, 'w') as f:
-                json.dump(data, f, indent=4)
+            _write_json(self.filename, data, sync)
+            self._save_segments(sync)
         except PermissionError:
             pass
 
+    def schema(self):
+        """Definition of the table without its rows (dumps and replication)"""
+        return {
+            "columns": self.columns, "types": self.types, "primary_key": self.primary_key,
+            "foreign_keys": self.foreign_keys, "partition": self.partition, "paging": self.paging,
+            "index_defs": self.index_defs, "indexes": list(self.indexes),
+            "auto_increment": self.auto_increment,
+        }
+
+    # --- SEGMENTS (PARTITIONING) ---
+    def _normalize_partition(self, partition, primary_key):
+        if not partition:
+            return None
+        if not primary_key:
+            raise ValueError("Partitioning requires a primary key.")
+        method = partition.get("method", "hash").lower()
+        if method == "hash":
+            count = int(partition.get("count", 4))
+            if count < 1:
+                raise ValueError("Partition count must be at least 1.")
+            return {"column": primary_key, "method": "hash", "count": count}
+        if method == "range":
+            bounds = sorted(self._partition_key(b, primary_key) for b in partition.get("bounds", []))
+            return {"column": primary_key, "method": "range", "bounds": bounds}
+        raise ValueError(f"Unknown partition method '{method}'.")
+
+    def _partition_key(self, value, column=None):
+        expected = self.types.get(column or self.partition["column"])
+        if expected == 'int':
+            return int(value)
+        if expected == 'float':
+            return float(value)
+        return str(value)
+
+    def _normalize_paging(self, page_rows, primary_key, partition):
+        if not page_rows:
+            return None
+        if not primary_key:
+            raise ValueError("Paged tables require a primary key.")
+        if partition:
+            raise ValueError("A table is either partitioned or paged, not both.")
+        if not str(page_rows).isdigit() or int(page_rows) < 1:
+            raise ValueError("Rows per page must be a positive number.")
+        return {"page_rows": int(page_rows), "pages": 0, "live": 0, "dead": 0}
+
+    def segment_ids(self):
+        if self.paging:
+            return list(range(self.paging["pages"]))
+        if self.partition["method"] == "range":
+            return list(range(len(self.partition["bounds"]) + 1))
+        return list(range(self.partition["count"]))
+
+    def segment_for(self, value):
+        """Maps a partition key value to the segment that owns it"""
+        key = self._partition_key(value)
+        if self.partition["method"] == "range":
+            return bisect.bisect_right(self.partition["bounds"], key)
+        # crc32 is stable across processes (unlike hash())
+        return zlib.crc32(str(key).encode()) % self.partition["count"]
+
+    def _segment_file(self, sid, ext=None):
+        return os.path.join(self.folder, f"{self.name}.{sid}.{ext or ('page' if self.paging else 'seg')}")
+
+    def _load_page_indexes(self):
+        """Assembles the table-wide index of a paged table from its per-page parts"""
+        self.indexes = {name: {} for name in self.indexes}
+        self._index_bytes = {}
+        for pid in self.segment_ids():
+            path = self._segment_file(pid, "idx")
+            if not os.path.exists(path):
+                continue
+            with open(path, 'r') as f:
+                text = f.read()
+            self._index_bytes[pid] = len(text)
+            part = json.loads(text)
+            for name, node in self.indexes.items():
+                _merge_index(node, part.get(name, {}))
+
+    def _save_page_index(self, pid, sync):
+        """Writes the index entries of one (resident) page's rows"""
+        indexes = {name: {} for name in self.indexes}
+        base = pid * self.paging["page_rows"]
+        for slot, row in enumerate(self.segments[pid]):
+            if row is not None:
+                self._add_entries(indexes, row, base + slot)
+        path = self._segment_file(pid, "idx")
+        _write_json(path, indexes, sync, indent=None)
+        self._index_bytes[pid] = os.path.getsize(path)
+
+    def _segment(self, sid):
+        """Loads a segment's (or page's) rows on first use"""
+        rows = self.segments.get(sid)
+        loaded = rows is None
+        if loaded:
+            rows = []
+            path = self._segment_file(sid)
+            if os.path.exists(path):
+                with open(path, 'r') as f:
+                    text = f.read()
+                rows = json.loads(text).get('rows', [])
+                if rows:
+                    self.row_bytes = max(1, len(text) // len(rows))
+            self.segments[sid] = rows
+        if self.pool:
+            self.pool.access(self, sid, loaded)
+        return rows
+
+    def _release_pages(self):
+        """End of an operation: the buffer pool may evict (never halfway through a write)"""
+        if self.pool:
+            if self.paging:
+                # The index stays resident, so its memory only leaves less room for pages
+                self.pool.pin(self, sum(self._index_bytes.values()))
+            self.pool.evict()
+
+    def _segment_index(self, sid):
+        """Loads a segment's local indexes (kept apart from rows so lookups stay cheap)"""
+        if sid not in self.segment_indexes:
+            indexes = {}
+            path = self._segment_file(sid, "idx")
+            if os.path.exists(path):
+                with open(path, 'r') as f:
+                    indexes = json.load(f)
+            if any(col not in indexes for col in self.indexes) and os.path.exists(self._segment_file(sid)):
+                # Written before one of the indexes existed (e.g. the per-segment PK index)
+                self._reindex_segment(sid)
+                return self.segment_indexes[sid]
+            for col in self.indexes:
+                indexes.setdefault(col, {})
+            self.segment_indexes[sid] = indexes
+        return self.segment_indexes[sid]
+
+    def _reindex_segment(self, sid):
+        indexes = {col: {} for col in self.indexes}
+        for pos, row in enumerate(self._segment(sid)):
+            if row is not None:
+                self._index_row(indexes, row, pos)
+        self.segment_indexes[sid] = indexes
+        self._dirty_segments.add(sid)
+
+    def _save_segments(self, sync=False):
+        """Rewrites only the segments (or pages) touched since the last save"""
+        for sid in sorted(self._dirty_segments):
+            if self.paging:
+                _write_json(self._segment_file(sid), {"rows": self.segments[sid]}, sync, indent=None)
+                self._save_page_index(sid, sync)
+                continue
+            _write_json(self._segment_file(sid), {"rows": self.segments[sid]}, sync)
+            if self.indexes:
+                _write_json(self._segment_file(sid, "idx"), self._segment_index(sid), sync, indent=None)
+        self._dirty_segments = set()
+
+    def storage_files(self):
+        """Every file backing this table (manifest first)"""
+        files = [self.filename]
+        if os.path.exists(self._stats_file()):
+            files.append(self._stats_file())
+        for sid in self.segment_ids() if self.partition or self.paging else []:
+            for ext in (None, "idx"):
+                path = self._segment_file(sid, ext)
+                if os.path.exists(path):
+                    files.append(path)
+        return files
+
     # --- INDEXING ---
-    def create_index(self, column_name):
-        if column_name not in self.columns:
+    # An index is a nested dict with one level per indexed column, keyed by
+    # str(value). Leaves hold row positions; covering indexes (INCLUDE ...) store
+    # [pos, [values of indexed + included columns]] so lookups can skip the rows.
+    def index_columns(self, name):
+        return self.index_defs.get(name, {}).get("columns", [name])
+
+    def _index_entry(self, name, row, pos):
+        spec = self.index_defs.get(name, {})
+        if spec.get("include"):
+            return [pos, [row.get(c) for c in spec["columns"] + spec["include"]]]
+        return pos
+
+    def _index_row(self, indexes, row, pos):
+        if indexes is self.indexes:
+            for name, cached in self._key_order.items():
+                key = _index_key(row.get(self.index_columns(name)[0]))
+                if name in indexes and key not in indexes[name]:
+                    # New leading key: slotted into the cached ORDER BY key lists
+                    for desc, keys in cached.items():
+                        bisect.insort(keys, key, key=self._key_sorter(name, desc))
+        self._add_entries(indexes, row, pos)
+
+    def _add_entries(self, indexes, row, pos):
+        for name, node in indexes.items():
+            cols = self.index_columns(name)
+            for col in cols[:-1]:
+                node = node.setdefault(_index_key(row.get(col)), {})
+            val = _index_key(row.get(cols[-1]))
+            if val not in node:
+                node[val] = []
+            node[val].append(self._index_entry(name, row, pos))
+
+    def _unindex_row(self, indexes, row, pos):
+        for name, node in indexes.items():
+            for col in self.index_columns(name):
+                node = node.get(_index_key(row.get(col)), {})
+            if isinstance(node, list):
+                node[:] = [e for e in node if (e[0] if isinstance(e, list) else e) != pos]
+
+    def _legacy_null_keys(self):
+        """Whether an index still files NULL leading values under "None" (see _NULL_KEY)"""
+        rows = _PageView(self) if self.paging else self._rows
+        for name, node in self.indexes.items():
+            cols = self.index_columns(name)
+            for e in self._index_probe(node, ["None"], len(cols)):
+                row = rows[e[0] if isinstance(e, list) else e]
+                if row is not None and row.get(cols[0]) is None:
+                    return True
+        return False
+
+    def _rebuild_indexes(self):
+        self.indexes = {name: {} for name in self.indexes}
+        self._key_order = {}
+        if not self.paging:
+            for pos, row in enumerate(self._rows):
+                if row is not None:
+                    self._index_row(self.indexes, row, pos)
+            return
+        size = self.paging["page_rows"]
+        for pid in self.segment_ids():
+            for slot, row in enumerate(self._segment(pid)):
+                if row is not None:
+                    self._index_row(self.indexes, row, pid * size + slot)
+            self._dirty_segments.add(pid)  # its stored index part changes too
+
+    def create_index(self, column_name, include=None):
+        """Indexes one column or an ordered tuple of columns ("role,tenure").
+        Columns listed in include are stored in the index to make it covering."""
+        cols = column_name.split(",") if isinstance(column_name, str) else list(column_name)
+        include = [c for c in (include or []) if c not in cols]
+        if not cols or any(c not in self.columns for c in cols + include):
             return
-        self.indexes[column_name] = {}
-        for idx, row in enumerate(self.rows):
-            val = str(row.get(column_name))
-            if val not in self.indexes[column_name]:
-                self.indexes[column_name][val] = []
-            self.indexes[column_name][val].append(idx)
+        name = ",".join(cols)
+        if len(cols) > 1 or include:
+            self.index_defs[name] = {"columns": cols, "include": include}
+        else:
+            self.index_defs.pop(name, None)
+        self.indexes[name] = {}
+        if self.partition:
+            for sid in self.segment_ids():
+                self._reindex_segment(sid)
+        else:
+            self._rebuild_indexes()
+        self.schema_version += 1
         self.save()
+        self._notify("create_index", None, {"columns": cols, "include": include})
+
+    def _pick_index(self, where, needed=None):
+        """Longest usable prefix of leading columns wins; covering indexes break ties"""
+        best, best_prefix, best_covering = None, 0, False
+        needed = needed or set(self.columns)
+        for name in self.indexes:
+            cols = self.index_columns(name)
+            prefix = 0
+            while prefix < len(cols) and cols[prefix] in where:
+                prefix += 1
+            include = self.index_defs.get(name, {}).get("include", [])
+            covering = bool(include) and needed <= set(cols) | set(include)
+            if prefix and (prefix, covering) > (best_prefix, best_covering):
+                best, best_prefix, best_covering = name, prefix, covering
+        return best, best_prefix, best_covering
+
+    def _index_probe(self, node, keys, depth):
+        """Descends the given key prefix and returns every leaf entry below it"""
+        for key in keys:
+            node = node.get(key)
+            if node is None:
+                return []
+        entries = [node]
+        for _ in range(depth - len(keys)):
+            entries = [child for n in entries for child in n.values()]
+        return [e for leaf in entries for e in leaf]
+
+    def _storage_units(self, where):
+        """(load_rows, indexes) per storage unit, pruned by PK on partitioned tables"""
+        if self.paging:
+            return [(lambda: _PageView(self), self.indexes)]
+        if not self.partition:
+            # One snapshot: VACUUM swaps rows and indexes together under the write lock
+            with self._lock:
+                rows, indexes = self._rows, self.indexes
+            return [(lambda: rows, indexes)]
+        pk = self.partition["column"]
+        if pk in where:
+            try:
+                sids = [self.segment_for(where[pk])]
+            except ValueError:
+                return []
+        else:
+            sids = self.segment_ids()
+        return [(lambda sid=sid: self._segment(sid), self._segment_index(sid)) for sid in sids]
+
+    def _access_path(self, equalities, needed=None):
+        """Index (name, prefix, covering) or (None, 0, False) when a scan is cheaper.
+        Without ANALYZE stats any usable index is taken."""
+        name, prefix, covering = self._pick_index(equalities, needed)
+        if name and not covering and self.stats:
+            fraction = 1.0
+            for col in self.index_columns(name)[:prefix]:
+                fraction *= self.selectivity(("cmp", col, "=", equalities[col]))
+            if fraction > INDEX_MAX_SELECTIVITY:
+                return None, 0, False
+        return name, prefix, covering
+
+    def _where_tree(self, where):
+        if where is None or isinstance(where, tuple):
+            return where
+        if isinstance(where, str):
+            return parse_where(where)
+        tree = None
+        for col, val in where.items():
+            term = ("cmp", col, "=", val)
+            tree = ("and", tree, term) if tree else term
+        return tree
+
+    def select(self, where=None, columns=None, order_by=None, limit=None):
+        """Rows matching where, projected to columns.
+        where is a WHERE clause (text or parsed tree) or a {col: value} dict.
+        Equalities use the longest composite-index prefix; covering indexes never touch the rows.
+        order_by is "col DESC, col2" or [[col, "ASC"|"DESC"], ...]; limit stops early."""
+        tree = self._where_tree(where)
+        order = order_terms(order_by, self.columns)
+        equalities = equality_keys(tree, self.types)
+        needed = set(columns or self.columns) | where_columns(tree) | {col for col, _ in order}
+        access = self._access_path(equalities, needed)
+        return self._run_select(tree, columns, equalities, access, order=order, limit=limit)
+
+    def _run_select(self, tree, columns, equalities, access, predicate=None, scan=None, order=None, limit=None):
+        """Executes a planned select; prepared statements pass their bound predicate/scan"""
+        if order or limit is not None:
+            results = list(self._ordered(tree, equalities, access, predicate, order, limit))
+            self._release_pages()
+            if columns:
+                return [{c: row.get(c) for c in columns} for row in results]
+            return results
+        name, prefix, covering = access
+        pruned = self.partition and self.partition["column"] in equalities
+        # cardinality() may load every segment of an unanalyzed partitioned table:
+        # only count when the executor could go parallel at all
+        if name is None and not pruned and not self.paging and self.executor and self.executor.possible() \
+                and self.executor.enabled(self.cardinality(), self):
+            results = self.executor.scan(self, tree, self.types)
+        else:
+            # Compile only what the access path needs
+            if name is None:
+                scan = scan or compile_filter(tree, self.types)
+            else:
+                predicate = predicate or compile_predicate(tree, self.types)
+            results = []
+            for load_rows, indexes in self._storage_units(equalities):
+                if name is None:
+                    results.extend(scan(load_rows()))
+                    continue
+                cols = self.index_columns(name)
+                entries = self._index_probe(indexes.get(name, {}), [equalities[c] for c in cols[:prefix]], len(cols))
+                if covering:
+                    names = cols + self.index_defs[name]["include"]
+                    candidates = (dict(zip(names, e[1])) for e in entries)
+                else:
+                    rows = load_rows() if entries else []
+                    positions = (e[0] if isinstance(e, list) else e for e in entries)
+                    candidates = (rows[i] for i in positions if i < len(rows))
+                results.extend(row for row in candidates if row is not None and predicate(row))
+        self._release_pages()
+        if columns:
+            return [{c: row.get(c) for c in columns} for row in results]
+        return results
+
+    def stream(self, where=None, order_by=None, limit=None):
+        """Iterates matching rows in order without building a result list
+        (sorts bigger than sort_buffer_rows spill to temp files)"""
+        tree = self._where_tree(where)
+        equalities = equality_keys(tree, self.types)
+        access = self._access_path(equalities)
+        return self._ordered(tree, equalities, access, None, order_terms(order_by, self.columns), limit)
+
+    # --- ORDER BY ---
+    def _ordered(self, tree, equalities, access, predicate, order, limit):
+        """Rows matching tree in order: walks an index led by the first ORDER BY
+        column when one exists (no sort, LIMIT stops the walk), else sorts what
+        the access path returns (top-K heap with LIMIT)"""
+        predicate = predicate or compile_predicate(tree, self.types)
+        index = self._order_index(order, access)
+        if index:
+            return islice(self._index_order(index, predicate, order), limit)
+        if access[0] is None:
+            rows = (row for row in self.scan() if predicate(row))
+        else:
+            rows = self._run_select(tree, None, equalities, access, predicate)
+        return order_rows(rows, order, self.types, limit, self.sort_buffer_rows)
+
+    def _order_index(self, order, access):
+        """Index whose leading column is the first ORDER BY column (table-wide indexes only)"""
+        if not order or access[0] is not None or self.partition:
+            return None
+        names = [name for name in self.indexes if self.index_columns(name)[0] == order[0][0]]
+        return min(names, key=lambda name: len(self.index_columns(name)), default=None)
+
+    def _sorted_keys(self, name, desc=False):
+        """Leading keys of an index in ORDER BY order, cached per direction
+        (writes slot new keys in, see _index_row)"""
+        cached = self._key_order.setdefault(name, {})
+        if desc not in cached:
+            cached[desc] = sorted(self.indexes[name], key=self._key_sorter(name, desc))
+        return cached[desc]
+
+    def _key_sorter(self, name, desc):
+        """Sort key of an index's leading keys (ascending in ORDER BY order)"""
+        key = _sort_key(self.types.get(self.index_columns(name)[0]), desc)
+        if desc:
+            return lambda k: _Desc(key(None if k == _NULL_KEY else k))
+        return lambda k: key(None if k == _NULL_KEY else k)
+
+    def _index_order(self, name, predicate, order):
+        cols = self.index_columns(name)
+        with self._lock:
+            rows, index = (_PageView(self) if self.paging else self._rows), self.indexes[name]
+            # A copy: writers insert keys into the cached list while this walks
+            keys = list(self._sorted_keys(name, order[0][1]))
+        for key in keys:
+            entries = self._index_probe(index, [key], len(cols))
+            group = [row for row in (rows[e[0] if isinstance(e, list) else e] for e in entries)
+                     if row is not None and predicate(row)]
+            if len(order) > 1 and len(group) > 1:
+                group = order_rows(group, order[1:], self.types)
+            yield from group
 
     def select_where(self, column, value):
         """O(1) Lookup if indexed, otherwise O(N)"""
-        value = str(value)
-        # Use Index if available
-        if column in self.indexes:
-            row_indices = self.indexes[column].get(value, [])
-            return [self.rows[i] for i in row_indices if i < len(self.rows)]
-        # Fallback to Linear Search
-        return [row for row in self.rows if str(row.get(column)) == value]
+        # Index led by this column, PK segment pruning, or a typed scan (split
+        # across the process pool on big tables): the paths select takes
+        return self.select({column: value})
+
+    # --- STATISTICS (ANALYZE) ---
+    def _stats_file(self):
+        return os.path.join(self.folder, f"{self.name}.stats")
+
+    def _stat_value(self, col, value):
+        """value in the column's type (None if it does not convert)"""
+        try:
+            return _TYPES.get(self.types.get(col), str)(value)
+        except (TypeError, ValueError):
+            return None
+
+    def analyze(self, buckets=HISTOGRAM_BUCKETS):
+        """Collects row count and per-column distinct count, null fraction, min/max,
+        most common values and an equi-depth histogram; saved to <name>.stats"""
+        count = 0
+        nulls = dict.fromkeys(self.columns, 0)
+        values = {col: [] for col in self.columns}
+        for row in self.scan():
+            count += 1
+            for col in self.columns:
+                value = self._stat_value(col, row.get(col)) if row.get(col) is not None else None
+                if value is None:
+                    nulls[col] += 1
+                else:
+                    values[col].append(value)
+        columns = {}
+        for col in self.columns:
+            vals = sorted(values[col])
+            columns[col] = {
+                "distinct": len(set(vals)),
+                "null_frac": nulls[col] / count if count else 0.0,
+                "min": vals[0] if vals else None,
+                "max": vals[-1] if vals else None,
+                # [value, fraction of rows] for repeated values (catches skew the histogram hides)
+                "common": [[v, n / count] for v, n in Counter(vals).most_common(buckets) if n > 1],
+                # Upper bound of each bucket but the last (each holds ~1/buckets of the rows)
+                "histogram": [vals[i * len(vals) // buckets] for i in range(1, buckets)] if vals else [],
+            }
+        self.stats = {"row_count": count, "analyzed": time.strftime("%Y-%m-%d %H:%M:%S"), "columns": columns}
+        self.schema_version += 1
+        _write_json(self._stats_file(), self.stats)
+        return self.stats
+
+    def cardinality(self):
+        """Row count: exact for in-memory and paged tables, from ANALYZE for partitioned ones"""
+        if self.paging:
+            return self.paging["live"]
+        if not self.partition:
+            return len(self._rows) - self._dead
+        if self.stats:
+            return self.stats["row_count"]
+        return len(self.rows)
+
+    def selectivity(self, tree):
+        """Estimated fraction of rows matching a WHERE tree"""
+        if tree is None:
+            return 1.0
+        kind = tree[0]
+        if kind == "and":
+            return self.selectivity(tree[1]) * self.selectivity(tree[2])
+        if kind == "or":
+            a, b = self.selectivity(tree[1]), self.selectivity(tree[2])
+            return a + b - a * b
+        if kind == "not":
+            return 1.0 - self.selectivity(tree[1])
+        stats = self.stats["columns"].get(tree[1]) if self.stats else None
+        if kind == "null":
+            return stats["null_frac"] if stats else _DEFAULT_SELECTIVITY["null"]
+        if kind == "like":
+            return _DEFAULT_SELECTIVITY["like"]
+        if kind == "in":
+            return min(1.0, sum(self._eq_selectivity(stats, tree[1], v) for v in tree[2]))
+        op = tree[2]
+        if op == "=":
+            return self._eq_selectivity(stats, tree[1], tree[3])
+        if op in ("!=", "<>"):
+            not_null = 1.0 - stats["null_frac"] if stats else 1.0
+            return max(0.0, not_null - self._eq_selectivity(stats, tree[1], tree[3]))
+        return self._range_selectivity(stats, tree[1], op, tree[3])
+
+    def _eq_selectivity(self, stats, col, raw):
+        value = self._stat_value(col, raw)
+        if not stats or value is None or stats["min"] is None:
+            return _DEFAULT_SELECTIVITY["eq"]
+        try:
+            if value < stats["min"] or value > stats["max"]:
+                return 0.0
+        except TypeError:
+            return _DEFAULT_SELECTIVITY["eq"]
+        common = stats.get("common", [])
+        for v, fraction in common:
+            if v == value:
+                return fraction
+        rest = 1.0 - stats["null_frac"] - sum(fraction for _, fraction in common)
+        return max(0.0, rest) / max(1, stats["distinct"] - len(common))
+
+    def _range_selectivity(self, stats, col, op, raw):
+        value = self._stat_value(col, raw)
+        if not stats or value is None or stats["min"] is None:
+            return _DEFAULT_SELECTIVITY["range"]
+        try:
+            # Fraction of non-null values below value (bucket-level resolution)
+            inclusive = op in ("<=", ">")
+            if value < stats["min"] or (value == stats["min"] and not inclusive):
+                below = 0.0
+            elif value > stats["max"] or (value == stats["max"] and inclusive):
+                below = 1.0
+            else:
+                hist = stats["histogram"]
+                pos = (bisect.bisect_right if inclusive else bisect.bisect_left)(hist, value)
+                edges = [stats["min"]] + hist + [stats["max"]]
+                lo, hi = edges[pos], edges[pos + 1]
+                # Interpolate inside the bucket for numbers, assume its middle otherwise
+                within = 0.5
+                if isinstance(value, (int, float)) and hi > lo:
+                    within = min(1.0, max(0.0, (value - lo) / (hi - lo)))
+                below = (pos + within) / (len(hist) + 1)
+        except TypeError:
+            return _DEFAULT_SELECTIVITY["range"]
+        fraction = below if op in ("<", "<=") else 1.0 - below
+        return fraction * (1.0 - stats["null_frac"])
+
+    def explain(self, where=None, columns=None, order_by=None, limit=None):
+        """The access path select() would take, with cardinality estimates"""
+        tree = self._where_tree(where)
+        order = order_terms(order_by, self.columns)
+        equalities = equality_keys(tree, self.types)
+        needed = set(columns or self.columns) | where_columns(tree) | {col for col, _ in order}
+        name, prefix, covering = self._access_path(equalities, needed)
+        rows = self.cardinality()
+        pruned = bool(self.partition) and self.partition["column"] in equalities
+        if name:
+            access = "covering index" if covering else "index"
+        elif not pruned and self.executor and self.executor.enabled(rows):
+            access = "parallel scan"
+        else:
+            access = "scan"
+        fraction = self.selectivity(tree)
+        sort = None
+        if order:
+            index = self._order_index(order, (name, prefix, covering))
+            if index:
+                sort = f"index {index} (no sort)"
+            elif limit is not None and limit <= self.sort_buffer_rows:
+                sort = f"top-{limit} heap"
+            else:
+                sort = "external merge sort" if rows * fraction > self.sort_buffer_rows else "in-memory sort"
+        return {
+            "table": self.name,
+            "access": access,
+            "index": name,
+            "index_prefix": self.index_columns(name)[:prefix] if name else [],
+            "segments": len(self._storage_units(equalities)) if self.partition else 1,
+            "pages": self.paging["pages"] if self.paging else None,
+            "rows": rows,
+            "selectivity": round(fraction, 4),
+            "estimated_rows": round(rows * fraction),
+            "order": sort,
+            "limit": limit,
+            "analyzed": self.stats is not None,
+        }
+
+    # --- STREAMING EXPORT ---
+    def scan(self):
+        """Iterates rows without materializing the table (segments/pages stream one at a time)"""
+        if not self.partition and not self.paging:
+            # Checked per row: a delete may tombstone a slot while this runs
+            for row in self._rows:
+                if row is not None:
+                    yield row
+            return
+        for sid in self.segment_ids():
+            resident = sid in self.segments
+            for row in self._segment(sid):
+                if row is not None:
+                    yield row
+            if self.pool:
+                self._release_pages()
+            elif not resident and sid not in self._dirty_segments:
+                self.segments.pop(sid, None)  # only keep segments that were already cached
+
+    def export(self, fmt="ndjson", chunk_rows=500, order_by=None):
+        """Returns a generator of NDJSON or CSV text chunks (chunk_rows rows each)"""
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format '{fmt}' (use {', '.join(EXPORT_FORMATS)}).")
+        rows = self.stream(order_by=order_by) if order_by else self.scan()
+        return self._export_chunks(fmt, max(1, int(chunk_rows)), rows)
+
+    def _export_chunks(self, fmt, chunk_rows, rows):
+        buf = io.StringIO()
+        writer = csv.writer(buf) if fmt == "csv" else None
+        if writer:
+            writer.writerow(self.columns)
+        for n, row in enumerate(rows, 1):
+            if writer:
+                writer.writerow(["" if row.get(c) is None else row.get(c) for c in self.columns])
+            else:
+                buf.write(json.dumps(row) + "\n")
+            if n % chunk_rows == 0:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        if buf.tell():
+            yield buf.getvalue()
+
+    # --- SEQUENCES (AUTO_INCREMENT) ---
+    def enable_auto_increment(self, column):
+        """Turns column into a sequence; existing rows are scanned once to seed it"""
+        if column not in self.columns:
+            raise ValueError(f"Unknown column '{column}'.")
+        if self.types.get(column, 'int') != 'int':
+            raise ValueError("AUTO_INCREMENT column must be INT.")
+        current = [int(r[column]) for r in self.scan() if r.get(column) is not None]
+        self.auto_increment = {"column": column, "next": max(current, default=0) + 1}
+        self.schema_version += 1
+        self.save()
+
+    def reserve_ids(self, count=1):
+        """Reserves a block of count ids in O(1) and returns them as a range"""
+        if not self.auto_increment:
+            raise ValueError(f"Table '{self.name}' has no AUTO_INCREMENT column.")
+        with self._lock:
+            start = self.auto_increment["next"]
+            self.auto_increment["next"] = start + count
+            if count > 1:
+                self.save()  # single inserts persist the counter with the row
+        return range(start, start + count)
 
     # --- CRUD & VALIDATION ---
     def validate_data(self, row_data):
+        """Checks values against the column types and returns them converted
+        (the CLI passes every value as text; stored rows keep the declared type)"""
+        typed = {}
         for col, val in row_data.items():
             expected = self.types.get(col)
-            # Basic type checking (improved to handle negative numbers)
-            if expected == 'int' and not str(val).replace('-','').isdigit():
-                 raise ValueError(f"Column '{col}' expects INT.")
-            elif expected == 'float':
+            if val is not None and expected in _TYPES:  # NULL is valid for any type
                 try:
-                    float(val)
-                except:
-                    raise ValueError(f"Column '{col}' expects FLOAT.")
+                    # Basic type checking (improved to handle negative numbers)
+                    if expected == 'int' and not str(val).replace('-','').isdigit():
+                        raise ValueError
+                    val = _TYPES[expected](val)
+                except ValueError:
+                    raise ValueError(f"Column '{col}' expects {expected.upper()}.")
+            typed[col] = val
+        return typed
+
+    def _check_writable(self):
+        if self.read_only and not getattr(replay, "active", False):
+            raise ValueError(f"Table '{self.name}' is read-only.")
+
+    def _notify(self, op, old, new):
+        for listener in self.listeners:
+            listener(self, op, old, new)
 
     def insert(self, values):
+        """Inserts a row; returns the generated key on AUTO_INCREMENT tables, else True"""
+        self._check_writable()
+        with self._lock:
+            generated = None
+            if self.auto_increment:
+                # The sequence column may be omitted or passed as None
+                values = list(values)
+                pos = self.columns.index(self.auto_increment["column"])
+                if len(values) == len(self.columns) - 1:
+                    values.insert(pos, None)
+                if len(values) == len(self.columns):
+                    if values[pos] in (None, ""):
+                        generated = values[pos] = self.reserve_ids(1)[0]
+                    elif str(values[pos]).lstrip('-').isdigit():
+                        # Explicit ids move the sequence past them
+                        seq = self.auto_increment
+                        seq["next"] = max(seq["next"], int(values[pos]) + 1)
+            result = self._insert(values)
+        self._release_pages()
+        return result if generated is None else generated
+
+    def _insert(self, values):
         if len(values) != len(self.columns):
             raise ValueError("Column count mismatch")
-        row = dict(zip(self.columns, values))
-        
-        self.validate_data(row)
+        row = self.validate_data(dict(zip(self.columns, values)))
         
         # --- FOREIGN KEY CHECK (Advanced Normalization Logic) ---
-        
-        if self.foreign_keys:
+        # (replicas skip it: the primary checked, and a snapshot may ship a child before its parent)
+        if self.foreign_keys and not getattr(replay, "active", False):
             for col, parent_table_name in self.foreign_keys.items():
                 val = str(row.get(col))
                 # Construct path to parent table
@@ -101,73 +1961,866 @@ class Table:
                     raise ValueError(f"Parent table '{parent_table_name}' does not exist.")
                 
                 # We must load the parent table to check if ID exists
-                with open(parent_file, 'r') as f:
-                    p_data = json.load(f)
-                    p_pk = p_data.get('primary_key')
-                    # Collect all valid IDs from parent
-                    existing_ids = [str(r.get(p_pk)) for r in p_data.get('rows', [])]
+                # (partitioned parents only load the segment owning the ID;
+                # parents with unflushed commits are read from memory)
+                parent = self.durability and self.durability.dirty.get(parent_file)
+                if not parent:
+                    parent = Table(parent_table_name, [], folder=self.folder)
                     
-                if val not in existing_ids:
+                if not parent.select_where(parent.primary_key, val):
                     # REJECT the insert if FK is invalid
                     raise ValueError(f"Foreign Key Constraint Failed: Value '{val}' not found in '{parent_table_name}'.")
         # --------------------------------------------
 
+        if self.partition:
+            return self._insert_segment(row)
+        if self.paging:
+            return self._insert_page(row)
+
         # Check Primary Key
         if self.primary_key:
             pk_val = str(row[self.primary_key])
-            for r in self.rows:
-                if str(r.get(self.primary_key)) == pk_val:
-                    raise ValueError(f"Duplicate PK: {pk_val}")
+            if self._row_position(pk_val) is not None:
+                raise ValueError(f"Duplicate PK: {pk_val}")
 
-        self.rows.append(row)
+        self._rows.append(row)
         
         # Update Indexes
-        new_row_idx = len(self.rows) - 1
-        for col_name in self.indexes:
-            val = str(row.get(col_name))
-            if val not in self.indexes[col_name]:
-                self.indexes[col_name][val] = []
-            self.indexes[col_name][val].append(new_row_idx)
+        new_row_idx = len(self._rows) - 1
+        self._index_row(self.indexes, row, new_row_idx)
 
         self.save()
+        self._notify("insert", None, row)
         return True
 
+    def _insert_segment(self, row):
+        # The owning segment's PK index finds duplicates; only that segment is rewritten
+        pk_val = str(row[self.primary_key])
+        sid = self.segment_for(pk_val)
+        indexes = self._segment_index(sid)
+        if indexes[self.primary_key].get(pk_val):
+            raise ValueError(f"Duplicate PK: {pk_val}")
+        rows = self._segment(sid)
+        rows.append(row)
+        self._index_row(indexes, row, len(rows) - 1)
+        self._dirty_segments.add(sid)
+        self.save()
+        self._notify("insert", None, row)
+        return True
+
+    def _insert_page(self, row):
+        # The PK index finds duplicates; the row is appended to the last page (or a new one)
+        pk_val = str(row[self.primary_key])
+        if self.indexes[self.primary_key].get(pk_val):
+            raise ValueError(f"Duplicate PK: {pk_val}")
+        size = self.paging["page_rows"]
+        pid = max(self.paging["pages"] - 1, 0)
+        if pid < self.paging["pages"] and len(self._segment(pid)) >= size:
+            pid += 1
+        page = self._segment(pid)
+        self.paging["pages"] = max(self.paging["pages"], pid + 1)
+        page.append(row)
+        self.paging["live"] += 1
+        self._index_row(self.indexes, row, pid * size + len(page) - 1)
+        self._dirty_segments.add(pid)
+        self.save()
+        self._notify("insert", None, row)
+        return True
+
+    def _pk_key(self, pk_val):
+        """Index key of a PK value given in any form ('07' finds the int PK 7)"""
+        return str(_coerce(pk_val, self.primary_key, self.types)[1])
+
+    def _row_position(self, pk_val):
+        """Slot of the live row with this PK: through the PK index (every table with
+        a primary key keeps one), else by scanning the in-memory rows"""
+        entries = self.indexes.get(self.primary_key)
+        if entries is not None:
+            entries = entries.get(pk_val)
+            if not entries:
+                return None
+            return entries[0][0] if isinstance(entries[0], list) else entries[0]
+        for pos, row in enumerate(self._rows):
+            if row is not None and str(row.get(self.primary_key)) == pk_val:
+                return pos
+        return None
+
+    def _segment_slot(self, pk_val):
+        """(segment, slot) of a live row of a partitioned table"""
+        try:
+            sid = self.segment_for(pk_val)
+        except ValueError:
+            return None, None  # not a key of this table's type: no row has it
+        entries = self._segment_index(sid)[self.primary_key].get(pk_val)
+        if not entries:
+            return None, None
+        return sid, entries[0][0] if isinstance(entries[0], list) else entries[0]
+
+    def _page_slot(self, pk_val):
+        """(page, slot) of a live row of a paged table"""
+        pos = self._row_position(pk_val)
+        if pos is None:
+            return None, None
+        return divmod(pos, self.paging["page_rows"])
+
     def update(self, pk_val, new_data):
-        pk_val = str(pk_val)
-        updated = False
-        for i, row in enumerate(self.rows):
-            if str(row.get(self.primary_key)) == pk_val:
-                row.update(new_data)
-                updated = True
-                break
-        
-        if updated:
-            self.save()
-            return True
-        return False
+        self._check_writable()
+        new_data = self.validate_data(new_data)
+        with self._lock:
+            result = self._update(self._pk_key(pk_val), new_data)
+        self._release_pages()
+        return result
+
+    def _update(self, pk_val, new_data):
+        if self.partition:
+            return self._update_segment(pk_val, new_data)
+        if self.paging:
+            return self._update_page(pk_val, new_data)
+        pos = self._row_position(pk_val)
+        if pos is None:
+            return False
+        row = self._rows[pos]
+        old = dict(row)
+        # Move the row's index entries to its new key values
+        self._unindex_row(self.indexes, row, pos)
+        row.update(new_data)
+        self._index_row(self.indexes, row, pos)
+        self.save()
+        self._notify("update", old, row)
+        return True
+
+    def _update_segment(self, pk_val, new_data):
+        sid, slot = self._segment_slot(pk_val)
+        if sid is None:
+            return False
+        new_sid = self.segment_for(new_data.get(self.primary_key, pk_val))
+        indexes, rows = self._segment_index(sid), self._segment(sid)
+        row = rows[slot]
+        old = dict(row)
+        self._unindex_row(indexes, row, slot)
+        row.update(new_data)
+        if new_sid == sid:
+            self._index_row(indexes, row, slot)
+        else:
+            # PK moved to another range/bucket: the row is appended there and
+            # leaves a tombstone here
+            rows[slot] = None
+            self.partition["dead"] = self.partition.get("dead", 0) + 1
+            target_indexes, target = self._segment_index(new_sid), self._segment(new_sid)
+            target.append(row)
+            self._index_row(target_indexes, row, len(target) - 1)
+            self._dirty_segments.add(new_sid)
+        self._dirty_segments.add(sid)
+        self.save()
+        self._notify("update", old, row)
+        return True
+
+    def _update_page(self, pk_val, new_data):
+        pid, slot = self._page_slot(pk_val)
+        if pid is None:
+            return False
+        row = self._segment(pid)[slot]
+        old = dict(row)
+        pos = pid * self.paging["page_rows"] + slot
+        self._unindex_row(self.indexes, row, pos)
+        row.update(new_data)
+        self._index_row(self.indexes, row, pos)
+        self._dirty_segments.add(pid)
+        self.save()
+        self._notify("update", old, row)
+        return True
 
     def delete(self, pk_val):
-        initial = len(self.rows)
-        # Filter rows
-        self.rows = [r for r in self.rows if str(r.get(self.primary_key)) != str(pk_val)]
-        
-        if len(self.rows) < initial:
-            # Rebuild indexes entirely to stay safe (Lazy approach)
-            self.indexes = {} 
-            self.save()
-            return True
-        return False
+        self._check_writable()
+        with self._lock:
+            result = self._delete(self._pk_key(pk_val))
+        self._release_pages()
+        # Paged and partitioned tables are compacted only by an explicit VACUUM: it
+        # moves rows within their files, which readers going one unit at a time cannot snapshot
+        if result and self.vacuumer and not self.paging and not self.partition and self.needs_vacuum():
+            self.vacuumer.request(self)
+        return result
+
+    def _delete(self, pk_val):
+        if self.partition:
+            return self._delete_segment(pk_val)
+        if self.paging:
+            return self._delete_page(pk_val)
+        # Tombstone: the slot becomes None so the other positions (and indexes) stay valid
+        pos = self._row_position(pk_val)
+        if pos is None:
+            return False
+        row = self._rows[pos]
+        self._unindex_row(self.indexes, row, pos)
+        self._rows[pos] = None
+        self._dead += 1
+        self.save()
+        self._notify("delete", row, None)
+        return True
+
+    def _delete_segment(self, pk_val):
+        # The slot becomes None so the segment's index positions stay valid
+        sid, slot = self._segment_slot(pk_val)
+        if sid is None:
+            return False
+        rows = self._segment(sid)
+        row = rows[slot]
+        self._unindex_row(self._segment_index(sid), row, slot)
+        rows[slot] = None
+        self.partition["dead"] = self.partition.get("dead", 0) + 1
+        self._dirty_segments.add(sid)
+        self.save()
+        self._notify("delete", row, None)
+        return True
+
+    def _delete_page(self, pk_val):
+        # The slot becomes None so the positions of the other rows stay valid
+        pid, slot = self._page_slot(pk_val)
+        if pid is None:
+            return False
+        page = self._segment(pid)
+        row = page[slot]
+        self._unindex_row(self.indexes, row, pid * self.paging["page_rows"] + slot)
+        page[slot] = None
+        self.paging["live"] -= 1
+        self.paging["dead"] = self.paging.get("dead", 0) + 1
+        self._dirty_segments.add(pid)
+        self.save()
+        self._notify("delete", row, None)
+        return True
+
+    # --- VACUUM ---
+    def tombstones(self):
+        """Deleted slots not reclaimed yet"""
+        if self.paging or self.partition:
+            return (self.paging or self.partition).get("dead", 0)
+        return self._dead
+
+    def needs_vacuum(self):
+        dead = self.tombstones()
+        return dead > 0 and dead > AUTOVACUUM_THRESHOLD + AUTOVACUUM_SCALE * self.cardinality()
+
+    def vacuum(self):
+        """Reclaims tombstones: live rows are rewritten densely and every index is
+        rebuilt in one pass. Returns how many dead slots were removed."""
+        with self._lock:
+            if not self.tombstones():
+                return 0
+            if self.paging:
+                reclaimed = self._vacuum_pages()
+            elif self.partition:
+                reclaimed = self._vacuum_segments()
+            else:
+                reclaimed = self._dead
+                rows = [row for row in self._rows if row is not None]
+                lineage = (self.view_state or {}).get("lineage")
+                if lineage and len(lineage) == len(self._rows):
+                    # A view's lineage runs parallel to its rows
+                    self.view_state["lineage"] = [k for k, row in zip(lineage, self._rows) if row is not None]
+                indexes = {name: {} for name in self.indexes}
+                for pos, row in enumerate(rows):
+                    self._index_row(indexes, row, pos)
+                # Built off to the side and swapped in at once (readers take no lock)
+                self._rows, self.indexes, self._dead, self._key_order = rows, indexes, 0, {}
+                self.save()
+        self._release_pages()
+        return reclaimed
+
+    def _vacuum_segments(self):
+        # Each segment keeps its own positions: only those with tombstones are rewritten
+        reclaimed = self.partition.get("dead", 0)
+        for sid in self.segment_ids():
+            rows = self._segment(sid)
+            if any(row is None for row in rows):
+                self.segments[sid] = [row for row in rows if row is not None]
+                self._reindex_segment(sid)
+        self.partition["dead"] = 0
+        self.save()
+        return reclaimed
+
+    def _vacuum_pages(self):
+        size = self.paging["page_rows"]
+        reclaimed, before = self.paging.get("dead", 0), self.paging["pages"]
+        live = list(self.scan())
+        if self.pool:
+            self.pool.discard(self)
+        self.segments = {pid: live[start:start + size] for pid, start in enumerate(range(0, len(live), size))}
+        self._dirty_segments = set(self.segments)
+        self.paging.update(pages=len(self.segments), live=len(live), dead=0)
+        self._rebuild_indexes()
+        # Written through rather than committed: the page files past the new
+        # last page are removed right away
+        self.version += 1
+        self._flush(True)
+        for pid in range(self.paging["pages"], before):
+            self._index_bytes.pop(pid, None)
+            for path in (self._segment_file(pid), self._segment_file(pid, "idx")):
+                if os.path.exists(path):
+                    os.remove(path)
+        return reclaimed
+
+def _merge_index(node, part):
+    """Adds the entries of an index part (same nesting) into node"""
+    for key, child in part.items():
+        if isinstance(child, list):
+            node.setdefault(key, []).extend(child)
+        else:
+            _merge_index(node.setdefault(key, {}), child)
+
+def _row_key(table, row):
+    """Identity of a base row for view lineage (PK, or the whole row without one)"""
+    if table.primary_key:
+        return str(row.get(table.primary_key))
+    return json.dumps(row, sort_keys=True, default=str)
+
+class MaterializedView:
+    """A stored query result kept current from its base tables' write deltas.
+
+    Rows live in a regular (read-only) Table, so reading a view costs the same
+    as reading a table. Its maintenance state is per-row lineage (base row
+    keys) or per-group aggregate state. Filters, INNER joins and GROUP BY rollups are maintained incrementally;
+    outer joins and aggregates over joins fall back to a full REFRESH.
+
+    <name>.mv only marks the view and holds its query; lineage and groups are
+    committed with the view table's rows (one atomic write, through the
+    database's durability policy). Changed rows are found through maps of
+    lineage key / group key -> row position, removed rows leave tombstones and
+    view indexes are updated entry by entry.
+    """
+    def __init__(self, db, name, query=None):
+        self.db = db
+        self.name = name
+        self.folder = db.get_db_path()
+        self.state_file = os.path.join(self.folder, f"{name}.mv")
+        self.table = None
+        self._keyed = None          # lineage list the position maps were built from
+        self._lineage_pos = None    # per base table (two for joins): lineage key -> [view positions]
+        self._grouped = None        # row list the group map was built from
+        self._group_pos = None      # group key -> view position
+        if query is None:
+            with open(self.state_file, 'r') as f:
+                marker = json.load(f)
+            self._open_table()
+            # Views saved before the state moved into the table kept it in .mv
+            self.state = self.table.view_state or {"lineage": [], "groups": {}, **marker}
+            self.table.view_state = self.state
+        else:
+            self.state = {"query": query, "lineage": [], "groups": {}}
+        self.plan = parse_select(self.state["query"])
+        plan = self.plan
+        if plan["order_by"] or plan["limit"] is not None:
+            raise ValueError("ORDER BY / LIMIT are not supported in materialized views.")
+        self.bases = [plan["table"]] + ([plan["join"]["table"]] if plan["join"] else [])
+        self.aggregate = bool(plan["aggregates"]) or plan["group_by"] is not None
+        if self.aggregate and any(c != plan["group_by"] for c in plan["columns"] or []):
+            raise ValueError("Only the GROUP BY column may be selected next to aggregates.")
+        self.incremental = not (plan["join"] and (self.aggregate or plan["join"]["type"] != "INNER"
+                                                  or plan["table"] == plan["join"]["table"]))
+        # Distinct aggregate input columns, and those needing MIN/MAX
+        self._inputs = list(dict.fromkeys(c for _, c, _ in plan["aggregates"] if c != "*"))
+        self._extremes = {c for f, c, _ in plan["aggregates"] if f in ("MIN", "MAX")}
+        self.predicate = None
+        self._types = None
+
+    def _open_table(self):
+        self.table = Table(self.name, [], folder=self.folder)
+        self.table.read_only = True
+        self.table.durability = self.db.durability()
+
+    def _base_table(self, name):
+        if self.db.get_db_path() == self.folder:
+            return self.db.get_table(name)
+        return Table(name, [], folder=self.folder)
+
+    def _compile(self, types):
+        if self.predicate is None:
+            self.predicate = compile_predicate(self.plan["where"], types)
+        return self.predicate
+
+    def _project(self, row):
+        cols = self.plan["columns"]
+        return {c: row.get(c) for c in cols} if cols else row
+
+    def _save(self):
+        """Commits a full recompute (indexes rebuilt from scratch)"""
+        self.table._rebuild_indexes()
+        self.table.view_state = self.state
+        if not os.path.exists(self.state_file):
+            _write_json(self.state_file, {"query": self.state["query"]}, sync=True)
+        self.table.save()
+
+    def _commit(self):
+        """Commits an incremental change, compacting tombstones once there are many"""
+        if self.table.needs_vacuum():
+            self.table.vacuum()
+        else:
+            self.table.save()
+
+    # --- FULL RECOMPUTE ---
+    def refresh(self):
+        plan = self.plan
+        t1 = self._base_table(plan["table"])
+        if not t1:
+            raise ValueError(f"Table '{plan['table']}' not found.")
+        types = dict(t1.types)
+        columns = list(t1.columns)
+        if plan["join"]:
+            t2 = self._base_table(plan["join"]["table"])
+            if not t2:
+                raise ValueError(f"Table '{plan['join']['table']}' not found.")
+            types.update(t2.types)
+            columns += [c for c in t2.columns if c not in columns]
+            pairs = self._join_pairs(t1, t2)
+        else:
+            pairs = [(row, _row_key(t1, row)) for row in t1.rows]
+        self.predicate = None
+        predicate = self._compile(types)
+        matched = [(row, lineage) for row, lineage in pairs if predicate(row)]
+
+        self.state["lineage"], self.state["groups"] = [], {}
+        self._types = types
+        if self.aggregate:
+            for row, _ in matched:
+                self._fold(row, 1)
+            rows = [self._group_row(g) for g in self.state["groups"].values()]
+            columns, types = self._aggregate_schema(types)
+        else:
+            rows = [self._project(row) for row, _ in matched]
+            self.state["lineage"] = [lineage for _, lineage in matched]
+            if plan["columns"]:
+                columns = plan["columns"]
+            types = {c: types[c] for c in columns if c in types}
+
+        if self.table is None:
+            self._open_table()
+        self.table.columns, self.table.types = columns, types
+        self.table.rows = rows
+        self._save()
+
+    def _join_pairs(self, t1, t2):
+        join = self.plan["join"]
+        rows1, rows2 = t1.rows, t2.rows
+        empty1 = {c: None for c in t1.columns}
+        empty2 = {c: None for c in t2.columns}
+        build = {}
+        if join["type"] != "CROSS":
+            for j, r2 in enumerate(rows2):
+                build.setdefault(str(r2.get(join["right_key"])), []).append(j)
+        pairs, matched2 = [], set()
+        for r1 in rows1:
+            js = range(len(rows2)) if join["type"] == "CROSS" else build.get(str(r1.get(join["left_key"])), [])
+            for j in js:
+                pairs.append(({**r1, **rows2[j]}, [_row_key(t1, r1), _row_key(t2, rows2[j])]))
+                matched2.add(j)
+            if not js and join["type"] in ("LEFT", "FULL"):
+                pairs.append(({**r1, **empty2}, [_row_key(t1, r1), None]))
+        if join["type"] in ("RIGHT", "FULL"):
+            for j, r2 in enumerate(rows2):
+                if j not in matched2:
+                    pairs.append(({**empty1, **r2}, [None, _row_key(t2, r2)]))
+        return pairs
+
+    # --- INCREMENTAL MAINTENANCE ---
+    def on_change(self, table, op, old, new):
+        """Listener registered on each base table"""
+        if op not in ("insert", "update", "delete"):
+            return
+        if not self.incremental:
+            self.refresh()
+            return
+        self._compile(self._base_types())
+        with self.table._lock:
+            if self.aggregate:
+                self._apply_aggregate(old, new)
+            elif self.plan["join"]:
+                self._apply_join(table, old, new)
+            else:
+                self._apply_filter(table, old, new)
+            self._commit()
+
+    def _base_types(self):
+        """Declared types of the base rows (merged for joins)"""
+        if self._types is None:
+            self._types = {}
+            for name in self.bases:
+                t = self._base_table(name)
+                if t:
+                    self._types.update(t.types)
+        return self._types
+
+    def _apply_filter(self, table, old, new):
+        found = self._positions()[0].get(_row_key(table, old)) if old is not None else None
+        pos = found[0] if found else None
+        if new is not None and self.predicate(new):
+            key = _row_key(table, new)
+            if pos is not None and self.state["lineage"][pos] == key:
+                self._replace_row(pos, self._project(new))  # updates keep their place
+                return
+            if pos is not None:
+                self._remove(pos)
+            self._add(self._project(new), key)
+        elif pos is not None:
+            self._remove(pos)
+
+    def _apply_join(self, table, old, new):
+        join = self.plan["join"]
+        left = table.name == self.plan["table"]
+        side = 0 if left else 1
+        if old is not None:
+            for pos in list(self._positions()[side].get(_row_key(table, old), [])):
+                self._remove(pos)
+        if new is not None:
+            other = self._base_table(join["table"] if left else self.plan["table"])
+            mine, theirs = (join["left_key"], join["right_key"]) if left else (join["right_key"], join["left_key"])
+            for match in other.select_where(theirs, new.get(mine)):
+                r1, r2 = (new, match) if left else (match, new)
+                merged = {**r1, **r2}
+                if self.predicate(merged):
+                    keys = [_row_key(table, new), _row_key(other, match)]
+                    self._add(self._project(merged), keys if left else keys[::-1])
+
+    def _apply_aggregate(self, old, new):
+        touched, stale = set(), set()
+        if old is not None and self.predicate(old):
+            touched.add(self._fold(old, -1, stale))
+        if new is not None and self.predicate(new):
+            touched.add(self._fold(new, 1))
+        # Recomputed only after both folds: the base table already holds the new
+        # row, so folding it in again would count an updated extreme twice
+        for key in stale:
+            if key in self.state["groups"]:
+                self._recompute_group(key, self.state["groups"][key]["value"])
+        for key in touched:
+            self._write_group(key)
+
+    # --- GROUP STATE ---
+    def _aggregate_schema(self, types):
+        g = self.plan["group_by"]
+        columns = [g] if g else []
+        out = {g: types[g]} if g in types else {}
+        for func, col, alias in self.plan["aggregates"]:
+            columns.append(alias)
+            if func == "COUNT":
+                out[alias] = "int"
+            elif func == "AVG":
+                out[alias] = "float"
+            elif func == "SUM":
+                out[alias] = "int" if types.get(col) == "int" else "float"
+            elif col in types:
+                out[alias] = types[col]
+        return columns, out
+
+    def _value(self, col, value):
+        target = _TYPES.get(self._base_types().get(col))
+        if value is None or target is None:
+            return value
+        try:
+            return target(value)
+        except (TypeError, ValueError):
+            return None
+
+    def _fold(self, row, sign, stale=None):
+        """Adds (sign=1) or removes (sign=-1) a base row from its group; returns the group key.
+        Groups that lost a MIN/MAX are added to stale (recomputed right away without one)"""
+        g = self.plan["group_by"]
+        key = str(row.get(g)) if g else ""
+        groups = self.state["groups"]
+        grp = groups.get(key)
+        if grp is None:
+            grp = groups[key] = {"value": row.get(g) if g else None, "count": 0,
+                                 "counts": {}, "sums": {}, "mins": {}, "maxs": {}}
+        grp["count"] += sign
+        extreme = False
+        for col in self._inputs:
+            v = self._value(col, row.get(col))
+            if v is None:
+                continue
+            grp["counts"][col] = grp["counts"].get(col, 0) + sign
+            if isinstance(v, (int, float)):
+                grp["sums"][col] = grp["sums"].get(col, 0) + sign * v
+            if col not in self._extremes:
+                continue
+            if sign > 0:
+                lo, hi = grp["mins"].get(col), grp["maxs"].get(col)
+                grp["mins"][col] = v if lo is None or v < lo else lo
+                grp["maxs"][col] = v if hi is None or v > hi else hi
+            elif v == grp["mins"].get(col) or v == grp["maxs"].get(col):
+                extreme = True   # removed an extreme: MIN/MAX need the group's rows
+        if grp["count"] <= 0:
+            del groups[key]
+        elif extreme:
+            if stale is None:
+                self._recompute_group(key, grp["value"])
+            else:
+                stale.add(key)
+        return key
+
+    def _recompute_group(self, key, value):
+        g = self.plan["group_by"]
+        tree = self.plan["where"]
+        if g:
+            term = ("null", g) if value is None else ("cmp", g, "=", value)
+            tree = ("and", tree, term) if tree else term
+        del self.state["groups"][key]
+        for row in self._base_table(self.plan["table"]).select(tree):
+            self._fold(row, 1)
+
+    def _group_row(self, grp):
+        g = self.plan["group_by"]
+        row = {g: grp["value"]} if g else {}
+        for func, col, alias in self.plan["aggregates"]:
+            if func == "COUNT":
+                row[alias] = grp["count"] if col == "*" else grp["counts"].get(col, 0)
+            elif func == "SUM":
+                row[alias] = grp["sums"].get(col, 0)
+            elif func == "AVG":
+                n = grp["counts"].get(col, 0)
+                row[alias] = grp["sums"].get(col, 0) / n if n else None
+            else:
+                row[alias] = (grp["mins"] if func == "MIN" else grp["maxs"]).get(col)
+        return row
+
+    def _write_group(self, key):
+        positions = self._group_positions()
+        pos = positions.get(key)
+        grp = self.state["groups"].get(key)
+        if grp is None:
+            if pos is not None:
+                self._remove_row(pos)
+                del positions[key]
+        elif pos is None:
+            positions[key] = self._append_row(self._group_row(grp))
+        else:
+            self._replace_row(pos, self._group_row(grp))
+
+    # --- VIEW ROWS ---
+    def _positions(self):
+        """lineage key -> view positions, one map per base table; rebuilt when a
+        REFRESH or VACUUM replaced the lineage list"""
+        lineage = self.state["lineage"]
+        if self._keyed is not lineage:
+            join = bool(self.plan["join"])
+            maps = [{}, {}] if join else [{}]
+            for pos, keys in enumerate(lineage):
+                for side, key in enumerate(keys if join else [keys]) if keys is not None else ():
+                    if key is not None:
+                        maps[side].setdefault(key, []).append(pos)
+            self._keyed, self._lineage_pos = lineage, maps
+        return self._lineage_pos
+
+    def _group_positions(self):
+        rows = self.table._rows
+        if self._grouped is not rows:
+            g = self.plan["group_by"]
+            self._group_pos = {(str(r.get(g)) if g else ""): pos for pos, r in enumerate(rows) if r is not None}
+            self._grouped = rows
+        return self._group_pos
+
+    def _add(self, row, keys):
+        maps = self._positions()
+        pos = self._append_row(row)
+        self.state["lineage"].append(keys)
+        for side, key in enumerate(keys if self.plan["join"] else [keys]):
+            maps[side].setdefault(key, []).append(pos)
+
+    def _remove(self, pos):
+        maps = self._positions()
+        keys = self.state["lineage"][pos]
+        self.state["lineage"][pos] = None
+        for side, key in enumerate(keys if self.plan["join"] else [keys]):
+            maps[side][key].remove(pos)
+            if not maps[side][key]:
+                del maps[side][key]
+        self._remove_row(pos)
+
+    def _append_row(self, row):
+        t = self.table
+        t._rows.append(row)
+        t._index_row(t.indexes, row, len(t._rows) - 1)
+        return len(t._rows) - 1
+
+    def _replace_row(self, pos, row):
+        t = self.table
+        t._unindex_row(t.indexes, t._rows[pos], pos)
+        t._rows[pos] = row
+        t._index_row(t.indexes, row, pos)
+
+    def _remove_row(self, pos):
+        t = self.table
+        t._unindex_row(t.indexes, t._rows[pos], pos)
+        t._rows[pos] = None
+        t._dead += 1
+
+class PreparedStatement:
+    """A parsed SELECT/INSERT/UPDATE/DELETE with ? placeholders.
+    The resolved plan (table, access path, compiled WHERE) is reused until the
+    database or table schema version moves (CREATE/DROP, CREATE_INDEX, ANALYZE)."""
+    def __init__(self, db, sql):
+        self.db = db
+        self.sql = sql
+        self.db_name = db.current_db
+        parser = _Parser(tokenize(sql))
+        self.statement = parser.statement()
+        self.kind = self.statement["kind"]
+        self.params = parser.params
+        if self.kind == "select" and (self.statement["aggregates"] or self.statement["group_by"]):
+            raise ValueError("Aggregates are only supported in materialized views.")
+        self.plan = None
+        self.versions = None
+        self.replans = 0
+
+    def _resolve(self):
+        db, stmt = self.db, self.statement
+        t = db.get_table(stmt["table"])
+        if not t:
+            raise ValueError(f"Table '{stmt['table']}' not found.")
+        join = stmt.get("join")
+        t2 = db.get_table(join["table"]) if join else None
+        if join and not t2:
+            raise ValueError(f"Table '{join['table']}' not found.")
+        versions = (db.schema_version, id(t), t.schema_version, id(t2), t2.schema_version if t2 else 0)
+        if self.plan and self.versions == versions:
+            return self.plan
+        tree = stmt.get("where")
+        types = {**t2.types, **t.types} if t2 else t.types
+        plan = {"table": t, "join": t2, "types": types, "access": (None, 0, False)}
+        if self.kind != "insert":
+            plan["order"] = order_terms(stmt.get("order_by"), t.columns + (t2.columns if t2 else []))
+            if not t2:
+                # Generic plan: the access path depends on which columns are bound, not the values
+                needed = set(stmt.get("columns") or t.columns) | where_columns(tree) | {c for c, _ in plan["order"]}
+                plan["access"] = t._access_path(equality_terms(tree), needed)
+            plan["predicate"] = compile_template(tree, types)
+            plan["scan"] = compile_template(tree, types, loop=True)
+        self.plan, self.versions = plan, versions
+        self.replans += 1
+        return plan
+
+    def execute(self, *args):
+        """SELECT -> rows, INSERT -> generated key (or True), UPDATE/DELETE -> rows affected"""
+        if len(args) != self.params:
+            raise ValueError(f"Expected {self.params} parameter(s), got {len(args)}.")
+        db = self.db
+        if db.current_db == self.db_name:
+            return self._execute(args)
+        with db.lock:
+            previous = db.current_db
+            db.use_database(self.db_name)
+            try:
+                return self._execute(args)
+            finally:
+                db.use_database(previous)
+
+    def _execute(self, args):
+        plan = self._resolve()
+        stmt, t = self.statement, plan["table"]
+        if self.kind == "insert":
+            values = [_arg(v, args) for v in stmt["values"]]
+            if stmt["columns"]:
+                if len(values) != len(stmt["columns"]):
+                    raise ValueError("Column count mismatch")
+                unknown = [c for c in stmt["columns"] if c not in t.columns]
+                if unknown:
+                    raise ValueError(f"Unknown column '{unknown[0]}'.")
+                row = dict(zip(stmt["columns"], values))
+                values = [row.get(c) for c in t.columns]
+            return t.insert(values)
+        tree = bind(stmt["where"], args)
+        limit = _arg(stmt.get("limit"), args)
+        if limit is not None and not str(limit).isdigit():
+            raise ValueError("LIMIT expects a number.")
+        limit = None if limit is None else int(limit)
+        if plan["join"]:
+            join = stmt["join"]
+            rows = self.db.join(stmt["table"], join["table"], join.get("left_key"), join.get("right_key"), join["type"])
+            rows = instantiate(plan["scan"], args, plan["types"])(rows)
+            if plan["order"] or limit is not None:
+                rows = list(order_rows(rows, plan["order"], plan["types"], limit))
+        else:
+            equalities = equality_keys(tree, t.types)
+            rows = t._run_select(tree, None, equalities, plan["access"],
+                                 instantiate(plan["predicate"], args, t.types),
+                                 instantiate(plan["scan"], args, t.types), plan["order"], limit)
+        if self.kind == "select":
+            columns = stmt["columns"]
+            return [{c: row.get(c) for c in columns} for row in rows] if columns else rows
+        if not t.primary_key:
+            raise ValueError(f"Table '{t.name}' has no primary key.")
+        keys = [row.get(t.primary_key) for row in rows]
+        if self.kind == "delete":
+            return sum(1 for key in keys if t.delete(key))
+        changes = {col: _arg(v, args) for col, v in stmt["set"]}
+        return sum(1 for key in keys if t.update(key, changes))
+
+def _hash_join(rows1, rows2, key1, key2, build_left=False):
+    """{i: [j, ...]} matches of rows1 against rows2, hashing the build side"""
+    matches = {}
+    if build_left:
+        build = {}
+        for i, r1 in enumerate(rows1):
+            build.setdefault(str(r1.get(key1)), []).append(i)
+        for j, r2 in enumerate(rows2):
+            for i in build.get(str(r2.get(key2)), ()):
+                matches.setdefault(i, []).append(j)
+    else:
+        build = {}
+        for j, r2 in enumerate(rows2):
+            build.setdefault(str(r2.get(key2)), []).append(j)
+        for i, r1 in enumerate(rows1):
+            js = build.get(str(r1.get(key1)))
+            if js:
+                matches[i] = js
+    return matches
 
 class Database:
     def __init__(self, root_folder="data"):
         self.root_folder = root_folder
-        self.current_db = "default_db"
-        self.tables = {}
+        # The selected database is per thread (CLI, each API request, replication);
+        # every thread shares the loaded tables through catalogs
+        self._session = threading.local()
+        self.catalogs = {}          # db name -> [tables, views (loaded lazily)]
+        self.executor = ParallelExecutor()
+        self.buffer_pool = BufferPool()
+        self.autovacuum = AutoVacuum()
+        self.durabilities = {}      # db name -> Durability
+        self.listeners = []         # callables(table, op, old, new) for every change (replication)
+        self.read_only = False      # replicas only change through the replication stream
+        self.deferred = False       # every database holds its writes until checkpoint() (defer_writes)
+        self.lock = threading.RLock()
+        self.schema_version = 0     # bumped by CREATE/DROP TABLE and views (replans prepared statements)
+        self.plan_cache = OrderedDict()  # (db, sql) -> PreparedStatement, least recently used first
+        self.plan_cache_hits = 0
+        self.plan_cache_misses = 0
         if not os.path.exists(self.root_folder):
             os.makedirs(self.root_folder)
         self.create_database("default_db")
         self.ensure_system_tables()
 
+    @property
+    def current_db(self):
+        return getattr(self._session, "db", "default_db")
+
+    @current_db.setter
+    def current_db(self, db_name):
+        self._session.db = db_name
+
+    def _catalog(self, db_name=None):
+        return self.catalogs.setdefault(db_name or self.current_db, [{}, None])
+
+    @property
+    def tables(self):
+        """Loaded tables of the current database"""
+        return self._catalog()[0]
+
+    @property
+    def views(self):
+        """Materialized views of the current database (None until loaded)"""
+        return self._catalog()[1]
+
+    @views.setter
+    def views(self, views):
+        self._catalog()[1] = views
+
     def ensure_system_tables(self):
         self.users_file = os.path.join(self.root_folder, "users.json")
         if not os.path.exists(self.users_file):
@@ -202,6 +2855,65 @@ class Database:
             return users[username]["role"]
         return None
 
+    # --- SESSION SETTINGS ---
+    def set_buffer_pool(self, budget_mb):
+        """Memory budget (MB) for the cached pages/segments of every table"""
+        self.buffer_pool.resize(budget_mb)
+        self.buffer_pool.evict()
+        return self.buffer_pool
+
+    def set_autovacuum(self, enabled):
+        """Turns background compaction of tables with many deleted rows on or off"""
+        self.autovacuum.enabled = bool(enabled)
+        return self.autovacuum
+
+    def set_parallelism(self, workers):
+        """Degree of parallelism for large scans and joins (1 = serial)"""
+        self.executor.set_workers(workers)
+
+    def durability(self, db_name=None):
+        """Durability policy of a database (settings persist in durability.cfg)"""
+        db_name = db_name or self.current_db
+        if db_name not in self.durabilities:
+            settings = {}
+            cfg = os.path.join(self.root_folder, db_name, "durability.cfg")
+            if os.path.exists(cfg):
+                with open(cfg, 'r') as f:
+                    settings = json.load(f)
+            self.durabilities[db_name] = Durability(**settings)
+            self.durabilities[db_name].deferred = self.deferred
+        return self.durabilities[db_name]
+
+    def set_durability(self, mode, interval_ms=200, max_writes=1000):
+        """strict | batched | memory for the current database"""
+        new = Durability(mode, interval_ms, max_writes)
+        new.deferred = self.deferred
+        old = self.durability()
+        old.close()
+        self.durabilities[self.current_db] = new
+        with open(os.path.join(self.get_db_path(), "durability.cfg"), 'w') as f:
+            json.dump(new.settings(), f)
+        for t in self.tables.values():
+            t.durability = new
+        return new
+
+    def checkpoint(self):
+        """Flushes dirty tables of every database; returns how many were written"""
+        return sum(d.checkpoint() for d in self.durabilities.values())
+
+    def defer_writes(self, deferred=True):
+        """Holds the writes of every database in memory until checkpoint(), whatever
+        its durability mode (bulk scripts); turning it off flushes what is pending"""
+        self.deferred = deferred
+        for d in self.durabilities.values():
+            d.deferred = deferred
+        return 0 if deferred else self.checkpoint()
+
+    def close(self):
+        self.autovacuum.close()
+        for d in self.durabilities.values():
+            d.close()
+
     # --- DB MANAGEMENT ---
     def create_database(self, db_name):
         path = os.path.join(self.root_folder, db_name)
@@ -211,48 +2923,322 @@ class Database:
     def drop_database(self, db_name):
         path = os.path.join(self.root_folder, db_name)
         if os.path.exists(path):
+            if db_name in self.durabilities:
+                self.durabilities.pop(db_name).close(flush=False)
+            self.catalogs.pop(db_name, None)
+            self.buffer_pool.discard(folder=path)
+            self.autovacuum.forget(folder=path)
+            for key in [k for k in self.plan_cache if k[0] == db_name]:
+                del self.plan_cache[key]
             shutil.rmtree(path)
-            if self.current_db == db_name: self.current_db = "default_db"
+            if self.current_db == db_name:
+                self.current_db = "default_db"
 
     def use_database(self, db_name):
         path = os.path.join(self.root_folder, db_name)
-        if os.path.exists(path):
+        if os.path.exists(path) and db_name != DUMP_FOLDER:
+            # Loaded tables stay cached per database, so switching back is free
             self.current_db = db_name
-            self.tables = {}
+
+    def dump(self, target=None, db_name=None):
+        """Writes a consistent snapshot of every table as <table>.ndjson plus manifest.json.
+
+        Writers hold their table's lock, so taking every lock first means no
+        write lands halfway through the dump (base tables before views, in the
+        order view maintenance takes them).
+        """
+        previous = self.current_db
+        if db_name and db_name != previous:
+            if not os.path.exists(os.path.join(self.root_folder, db_name)):
+                raise ValueError(f"Database '{db_name}' not found.")
+            self.use_database(db_name)
+        try:
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            target = target or f"dump_{self.current_db}_{stamp}"
+            os.makedirs(target, exist_ok=True)
+            views = self._views()
+            names = sorted(self.show_tables(), key=lambda n: (n in views, n))
+            tables = [self.get_table(n) for n in names]
+            manifest = {"database": self.current_db, "created": stamp, "tables": {}}
+            for t in tables:
+                t._lock.acquire()
+            try:
+                for t in tables:
+                    count = 0
+                    with open(os.path.join(target, f"{t.name}.ndjson"), 'w') as f:
+                        for chunk in t.export("ndjson"):
+                            f.write(chunk)
+                            count += chunk.count("\n")
+                    manifest["tables"][t.name] = {
+                        **t.schema(),
+                        "view": views[t.name].state["query"] if t.name in views else None,
+                        "rows": count,
+                    }
+            finally:
+                for t in tables:
+                    t._lock.release()
+            _write_json(os.path.join(target, "manifest.json"), manifest, sync=True)
+            manifest["path"] = target
+            return manifest
+        finally:
+            if self.current_db != previous:
+                self.use_database(previous)
+
+    def dump_path(self, name):
+        """<root>/_dumps/<name>; rejects names that would write outside it"""
+        base = os.path.abspath(os.path.join(self.root_folder, DUMP_FOLDER))
+        path = os.path.abspath(os.path.join(base, name))
+        if path == base or os.path.commonpath([base, path]) != base:
+            raise ValueError(f"Dump target must be a folder inside '{os.path.join(self.root_folder, DUMP_FOLDER)}'.")
+        return path
 
     def get_db_path(self):
         return os.path.join(self.root_folder, self.current_db)
 
     def show_databases(self):
-        return [d for d in os.listdir(self.root_folder) if os.path.isdir(os.path.join(self.root_folder, d))]
+        return [d for d in os.listdir(self.root_folder)
+                if d != DUMP_FOLDER and os.path.isdir(os.path.join(self.root_folder, d))]
 
-    def create_table(self, name, columns, types=None, primary_key=None):
+    def create_table(self, name, columns, types=None, primary_key=None, partition=None, auto_increment=None,
+                     page_rows=None):
         path = self.get_db_path()
-        t = Table(name, columns, types, primary_key, folder=path)
-        self.tables[name] = t
+        new = not os.path.exists(os.path.join(path, f"{name}.json"))
+        if new:
+            self._check_writable()
+        t = Table(name, columns, types, primary_key, folder=path, partition=partition,
+                  auto_increment=auto_increment, page_rows=page_rows)
+        self._register(t)
+        self.schema_version += 1
+        if new:
+            self._publish(t, "create_table", None, t.schema())
         return t
 
     def get_table(self, name):
+        self._views()
         if name in self.tables: return self.tables[name]
-        path = self.get_db_path()
-        if os.path.exists(os.path.join(path, f"{name}.json")):
-            t = Table(name, [], folder=path)
-            self.tables[name] = t
-            return t
+        with self.lock:
+            # Threads share loaded tables, so only one of them may load a given table
+            if name in self.tables: return self.tables[name]
+            path = self.get_db_path()
+            filename = os.path.join(path, f"{name}.json")
+            if os.path.exists(filename):
+                # Tables with unflushed commits are newer in memory than on disk
+                t = self.durability().dirty.get(filename) or Table(name, [], folder=path)
+                return self._register(t)
         return None
 
+    def _register(self, t):
+        """Wires a loaded table into this database (executor, durability, listeners)"""
+        t.executor = self.executor
+        t.pool = self.buffer_pool
+        t.vacuumer = self.autovacuum
+        t.durability = self.durability()
+        t.read_only = t.read_only or self.read_only
+        self._attach_views(t)
+        for listener in self.listeners:
+            if listener not in t.listeners:
+                t.listeners.append(listener)
+        self.tables[t.name] = t
+        return t
+
     def drop_table(self, name):
-        path = os.path.join(self.get_db_path(), f"{name}.json")
-        if os.path.exists(path):
-            os.remove(path)
+        t = self.get_table(name)
+        if t:
+            self._check_writable()
+            self.schema_version += 1
+            self._publish(t, "drop_table", None, None)
+            self.durability().forget(t)
+            self.buffer_pool.discard(t)
+            self.autovacuum.forget(t)
+            for path in t.storage_files():
+                if os.path.exists(path): os.remove(path)
             if name in self.tables: del self.tables[name]
+            view = self._views().pop(name, None)
+            if view:
+                os.remove(view.state_file)
+                for base in self.tables.values():
+                    if view.on_change in base.listeners: base.listeners.remove(view.on_change)
             return True
         return False
 
+    # --- MATERIALIZED VIEWS ---
+    def _views(self):
+        """Views of the current database, loaded on first use"""
+        if self.views is None:
+            with self.lock:
+                if self.views is None:
+                    views = {}
+                    path = self.get_db_path()
+                    for f in sorted(os.listdir(path)) if os.path.exists(path) else []:
+                        if f.endswith(".mv"):
+                            view = MaterializedView(self, f[:-3])
+                            views[view.name] = view
+                            self.tables[view.name] = view.table
+                    self.views = views
+        return self.views
+
+    def _attach_views(self, t):
+        for view in self._views().values():
+            if t.name in view.bases and view.on_change not in t.listeners:
+                t.listeners.append(view.on_change)
+
+    def create_materialized_view(self, name, query):
+        """CREATE MATERIALIZED VIEW name AS query; stored (and read) like a table"""
+        self._check_writable()
+        if self.get_table(name):
+            raise ValueError(f"Table '{name}' already exists.")
+        view = MaterializedView(self, name, query)
+        view.refresh()
+        self.views[name] = view
+        self.tables[name] = view.table
+        for t in list(self.tables.values()):
+            self._attach_views(t)
+        self.schema_version += 1
+        self._publish(view.table, "create_view", None, {"query": query})
+        return view.table
+
+    def materialized_views(self):
+        """{name: query} for the views of the current database"""
+        return {name: view.state["query"] for name, view in self._views().items()}
+
+    def refresh_materialized_view(self, name):
+        view = self._views().get(name)
+        if not view:
+            raise ValueError(f"Materialized view '{name}' not found.")
+        view.refresh()
+
     def show_tables(self):
         path = self.get_db_path()
         return [f[:-5] for f in os.listdir(path) if f.endswith('.json')]
 
+    # --- PREPARED STATEMENTS ---
+    def prepare(self, sql):
+        """Parsed statement from the plan cache (LRU of PLAN_CACHE_SIZE statements)"""
+        key = (self.current_db, sql.strip())
+        return self._cached_plan(key) or self._cache_plan(key, PreparedStatement(self, key[1]))
+
+    def execute(self, sql, *args):
+        """Runs one statement; ? placeholders take args. Only parameterized statements
+        enter the plan cache: one with inline literals rarely repeats, and caching
+        it would evict named PREPAREs."""
+        key = (self.current_db, sql.strip())
+        stmt = self._cached_plan(key)
+        if not stmt:
+            stmt = PreparedStatement(self, key[1])
+            if stmt.params:
+                self._cache_plan(key, stmt)
+        return stmt.execute(*args)
+
+    def _cached_plan(self, key):
+        with self.lock:
+            stmt = self.plan_cache.get(key)
+            if stmt:
+                self.plan_cache.move_to_end(key)
+                self.plan_cache_hits += 1
+            else:
+                self.plan_cache_misses += 1
+            return stmt
+
+    def _cache_plan(self, key, stmt):
+        with self.lock:
+            self.plan_cache[key] = stmt
+            while len(self.plan_cache) > PLAN_CACHE_SIZE:
+                self.plan_cache.popitem(last=False)
+        return stmt
+
+    # --- CHANGE STREAM ---
+    def add_listener(self, listener):
+        """listener(table, op, old, new) fires for every row change and DDL in every database.
+        op is insert/update/delete, create_index, or create_table/drop_table/create_view."""
+        self.listeners.append(listener)
+        for tables, views in list(self.catalogs.values()):
+            for t in tables.values():
+                if t.name not in (views or {}) and listener not in t.listeners:
+                    t.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+        for tables, _ in list(self.catalogs.values()):
+            for t in tables.values():
+                if listener in t.listeners:
+                    t.listeners.remove(listener)
+
+    def _publish(self, t, op, old, new):
+        for listener in self.listeners:
+            listener(t, op, old, new)
+
+    def _check_writable(self):
+        if self.read_only and not getattr(replay, "active", False):
+            raise ValueError("Database is a read-only replica.")
+
+    # --- STATISTICS & PLANNING ---
+    def analyze(self, name=None):
+        """ANALYZE one table (or every table of the current database)"""
+        stats = {}
+        for table_name in [name] if name else sorted(self.show_tables()):
+            t = self.get_table(table_name)
+            if not t:
+                raise ValueError(f"Table '{table_name}' not found.")
+            stats[table_name] = t.analyze()
+        return stats
+
+    def vacuum(self, name=None):
+        """VACUUM one table (or every table of the current database); {table: slots reclaimed}"""
+        reclaimed = {}
+        for table_name in [name] if name else sorted(self.show_tables()):
+            t = self.get_table(table_name)
+            if not t:
+                raise ValueError(f"Table '{table_name}' not found.")
+            reclaimed[table_name] = t.vacuum()
+        return reclaimed
+
+    def plan_join(self, t1, t2, key1, key2, join_type="INNER"):
+        """Join algorithm, build/probe sides and estimated output rows"""
+        n1, n2 = t1.cardinality(), t2.cardinality()
+        def distinct(t, key, n):
+            col = t.stats["columns"].get(key) if t.stats else None
+            return col["distinct"] if col else n  # unanalyzed keys are assumed unique
+        if join_type == "CROSS":
+            algorithm, estimated = "nested_loop", n1 * n2
+        else:
+            estimated = n1 * n2 / max(1, distinct(t1, key1, n1), distinct(t2, key2, n2))
+            if join_type in ("LEFT", "FULL", "OUTER"):
+                estimated = max(estimated, n1)
+            if join_type in ("RIGHT", "FULL", "OUTER"):
+                estimated = max(estimated, n2)
+            if self.executor.enabled(n1 + n2):
+                algorithm = "parallel_hash"
+            elif n1 * n2 <= NESTED_LOOP_MAX:
+                algorithm = "nested_loop"
+            else:
+                algorithm = "hash"
+        # Hash joins build on the smaller input (the parallel one always hashes t2)
+        build = "left" if algorithm == "hash" and n1 < n2 else "right"
+        return {
+            "algorithm": algorithm,
+            "type": join_type,
+            "build": t1.name if build == "left" else t2.name,
+            "build_side": build,
+            "probe": t2.name if build == "left" else t1.name,
+            "rows": [n1, n2],
+            "estimated_rows": round(estimated),
+        }
+
+    def explain(self, sql):
+        """EXPLAIN SELECT ...: access path or join plan with cardinality estimates"""
+        plan = parse_select(sql)
+        t1 = self.get_table(plan["table"])
+        if not t1:
+            raise ValueError(f"Table '{plan['table']}' not found.")
+        join = plan["join"]
+        if not join:
+            return t1.explain(plan["where"], plan["columns"], plan["order_by"], plan["limit"])
+        t2 = self.get_table(join["table"])
+        if not t2:
+            raise ValueError(f"Table '{join['table']}' not found.")
+        return self.plan_join(t1, t2, join.get("left_key"), join.get("right_key"), join["type"])
+
     # --- ADVANCED JOINS ---
     def join(self, t1_name, t2_name, key1, key2, join_type="INNER"):
         
@@ -268,17 +3254,40 @@ class Database:
         t1_matched_indices = set()
         t2_matched_indices = set()
 
+        rows1, rows2 = t1.rows, t2.rows
+
         # 1. CROSS JOIN
         if join_type == "CROSS":
-            for r1 in t1.rows:
-                for r2 in t2.rows:
+            for r1 in rows1:
+                for r2 in rows2:
                     results.append({**r1, **r2})
             return results
 
         # 2. INNER, LEFT, RIGHT, FULL
-        for i, r1 in enumerate(t1.rows):
+        plan = self.plan_join(t1, t2, key1, key2, join_type)
+        if plan["algorithm"] != "nested_loop":
+            if plan["algorithm"] == "parallel_hash" and self.executor.enabled(len(rows1) + len(rows2), t1, t2):
+                # Parallel hash join: probe chunks of t1 against a hash of t2
+                matches, rows1, rows2 = self.executor.hash_join(t1, t2, key1, key2)
+            else:
+                matches = _hash_join(rows1, rows2, key1, key2, plan["build_side"] == "left")
+            for i, r1 in enumerate(rows1):
+                js = matches.get(i)
+                if js:
+                    for j in js:
+                        results.append({**r1, **rows2[j]})
+                        t2_matched_indices.add(j)
+                elif join_type in ["LEFT", "FULL", "OUTER"]:
+                    results.append({**r1, **t2_cols_empty})
+            if join_type in ["RIGHT", "FULL", "OUTER"]:
+                for j, r2 in enumerate(rows2):
+                    if j not in t2_matched_indices:
+                        results.append({**t1_cols_empty, **r2})
+            return results
+
+        for i, r1 in enumerate(rows1):
             match_found = False
-            for j, r2 in enumerate(t2.rows):
+            for j, r2 in enumerate(rows2):
                 val1 = str(r1.get(key1))
                 val2 = str(r2.get(key2))
                 
@@ -294,7 +3303,7 @@ class Database:
 
         # Right/Full Join Logic: Find rows in t2 that were never matched
         if join_type in ["RIGHT", "FULL", "OUTER"]:
-            for j, r2 in enumerate(t2.rows):
+            for j, r2 in enumerate(rows2):
                 if j not in t2_matched_indices:
                     results.append({**t1_cols_empty, **r2})
 
@@ -1,15 +1,20 @@
+import argparse
+import os
+import re
 import sys
 import getpass
 import time
-from db import Database
+from db import Database, parse_values, PAGE_ROWS
+from replication import Primary, Follower, DEFAULT_PORT
 
 # --- PERMISSIONS CONFIG ---
 # Define what commands each role can execute
+# SET changes server-wide settings (durability, buffer pool, autovacuum); SET_PARALLEL is per session
 PERMS = {
     "root": ["ALL"],
-    "rw_delete": ["SELECT", "INSERT", "UPDATE", "DELETE", "USE", "SHOW", "HELP", "EXIT"],
-    "rw": ["SELECT", "INSERT", "UPDATE", "USE", "SHOW", "HELP", "EXIT"],
-    "read_only": ["SELECT", "USE", "SHOW", "HELP", "EXIT"]
+    "rw_delete": ["SELECT", "INSERT", "UPDATE", "DELETE", "USE", "SHOW", "SET", "SET_PARALLEL", "REFRESH", "CHECKPOINT", "VACUUM", "DUMP", "ANALYZE", "EXPLAIN", "PREPARE", "EXECUTE", "DEALLOCATE", "HELP", "EXIT"],
+    "rw": ["SELECT", "INSERT", "UPDATE", "USE", "SHOW", "SET", "SET_PARALLEL", "REFRESH", "CHECKPOINT", "VACUUM", "DUMP", "ANALYZE", "EXPLAIN", "PREPARE", "EXECUTE", "DEALLOCATE", "HELP", "EXIT"],
+    "read_only": ["SELECT", "USE", "SHOW", "SET_PARALLEL", "EXPLAIN", "PREPARE", "EXECUTE", "DEALLOCATE", "HELP", "EXIT"]
 }
 
 def check(role, cmd):
@@ -47,8 +52,593 @@ def print_table(rows):
         vals = [str(row.get(h, "NULL")).ljust(widths[h]) for h in headers]
         print(" | ".join(vals))
     print(f"\n({len(rows)} row(s) returned)")
+# --- SESSION ---
+class Session:
+    """A logged-in user plus per-connection state"""
+    def __init__(self, db, user, role, timing=True):
+        self.db = db
+        self.user = user
+        self.role = role
+        self.timing = timing        # per-statement timings (scripts print one total instead)
+        self.replication = None     # Primary or Follower once started
+        self.prepared = {}          # PREPARE name -> statement text (plans live in db.plan_cache)
+
+def run_command(session, line):
+    """Executes one command line; returns False once the session is over (EXIT)"""
+    db = session.db
+    parts = line.split()
+    cmd = parts[0].upper()
+
+    # --- EXIT ---
+    if cmd == "EXIT":
+        print("=" * 42)
+        print("******** GOODBYE FROM EdSQL **************")
+        print("   👋 EdSQL v5.0 (Enterprise CLI)         ")
+        print("   Hoping We'll See You Soon! 🤗")
+        print("=" * 42)
+        if session.replication:
+            session.replication.close()
+        db.close()  # flush tables still pending under batched/memory durability
+        return False
+
+    # --- HELP ---
+    elif cmd == "HELP":
+        print("-" * 60)
+        print(" SYSTEM:   CREATE/DROP USER [name] [pass] [role] (Root Only)")
+        print(" DB:       CREATE/DROP DATABASE [name], USE [name], SHOW DATABASES")
+        print("           DUMP DATABASE ([name]) (TO [folder]) (NDJSON snapshot + manifest; non-root: inside <root>/_dumps)")
+        print(" TABLE:    CREATE TABLE [name] [col:type,col:type]")
+        print("           (id:int:auto = AUTO_INCREMENT primary key)")
+        print("           (... PARTITION BY HASH [n] | PARTITION BY RANGE [b1,b2])")
+        print("           (... PAGED ([rows per page]) = page files read through the buffer pool)")
+        print("           DROP TABLE [name], SHOW TABLES")
+        print(" VIEW:     CREATE MATERIALIZED VIEW [name] AS [SELECT ...]")
+        print("           (SELECT g, COUNT(*), SUM(c), AVG(c), MIN(c), MAX(c) FROM t GROUP BY g)")
+        print("           REFRESH MATERIALIZED VIEW [name], DROP TABLE [name]")
+        print(" DATA:     INSERT INTO [table] [val1,val2] (omit/NULL the auto id)")
+        print("           UPDATE [table] [pk] [col:val]")
+        print("           DELETE FROM [table] [pk]")
+        print("           INSERT INTO [table] ((cols)) VALUES ('a, b', 2, NULL)")
+        print("           UPDATE [table] SET [col] = [val], ... (WHERE [condition])")
+        print("           DELETE FROM [table] WHERE [condition]")
+        print(" PREPARE:  PREPARE [name] AS [SELECT/INSERT/UPDATE/DELETE with ? params]")
+        print("           EXECUTE [name](val, ...), DEALLOCATE [name]")
+        print(" INDEX:    CREATE_INDEX [table] [col1,col2] (INCLUDE [col,...])")
+        print(" QUERY:    SELECT [*|col,col] FROM [t1] (WHERE [condition])")
+        print("           e.g. WHERE salary >= 100000 AND (role = 'Dev' OR name LIKE 'A%')")
+        print("           operators: = != < > <= >= IN (..) LIKE IS (NOT) NULL AND OR NOT")
+        print("           (ORDER BY [col] (ASC|DESC), ...) (LIMIT [n])")
+        print(" JOIN:     SELECT * FROM [t1] [LEFT/RIGHT/CROSS] JOIN [t2] ON [k1] [k2]")
+        print(" PLAN:     ANALYZE ([table]) (collect stats), EXPLAIN [SELECT ...]")
+        print(" REPLICA:  START REPLICATION ([port]) (serve followers, Root Only)")
+        print("           REPLICATE FROM [host:port] (become a read-only follower, Root Only)")
+        print("           SHOW REPLICATION (LSN / lag)")
+        print(" SESSION:  SET PARALLEL [n] (worker processes for big scans/joins)")
+        print("           SET DURABILITY [strict|batched|memory] ([ms] [writes]), CHECKPOINT, SHOW DURABILITY")
+        print("           SET BUFFER POOL [MB], SHOW BUFFER POOL (cached pages / hits / evictions)")
+        print(" VACUUM:   VACUUM ([table]) (reclaim deleted rows, rebuild indexes)")
+        print("           SET AUTOVACUUM [ON|OFF], SHOW VACUUM (background compaction)")
+        print("-" * 60)
+        return True
+
+    # --- PERMISSION CHECK ---
+    # Some commands are Root-only regardless of the PERMS list
+    root_only_cmds = ["CREATE_USER", "DROP_USER", "CREATE_DATABASE", "DROP_DATABASE",
+                      "START_REPLICATION", "REPLICATE"]
+
+    # Construct specific action key for granular checks
+    action_key = cmd
+    if len(parts) > 1:
+        if cmd == "CREATE" and parts[1].upper() == "USER": action_key = "CREATE_USER"
+        if cmd == "DROP" and parts[1].upper() == "USER": action_key = "DROP_USER"
+        if cmd == "CREATE" and parts[1].upper() == "DATABASE": action_key = "CREATE_DATABASE"
+        if cmd == "DROP" and parts[1].upper() == "DATABASE": action_key = "DROP_DATABASE"
+        if cmd == "START" and parts[1].upper() == "REPLICATION": action_key = "START_REPLICATION"
+        if cmd == "SET" and parts[1].upper() == "PARALLEL": action_key = "SET_PARALLEL"
+
+    if action_key in root_only_cmds and session.role != "root":
+        print("❌ Permission Denied: Root access required.")
+        return True
+
+    if not (check(session.role, cmd) or check(session.role, action_key)):
+        print(f"❌ Permission Denied: Role '{session.role}' cannot perform '{cmd}'.")
+        return True
+
+    # --- EXECUTE COMMANDS ---
+
+    # 1. USER MANAGEMENT
+    if action_key == "CREATE_USER":
+        # CREATE USER bob pass123 read_only
+        try:
+            db.create_user(parts[2], parts[3], parts[4])
+            print(f"User '{parts[2]}' created.")
+        except IndexError: print("Usage: CREATE USER [name] [pass] [role]")
+        except ValueError as e: print(f"Error: {e}")
+
+    elif action_key == "DROP_USER":
+        try:
+            db.drop_user(parts[2])
+            print(f"User '{parts[2]}' deleted.")
+        except ValueError as e: print(f"Error: {e}")
+
+    # 2. DATABASE MANAGEMENT
+    elif action_key == "CREATE_DATABASE":
+        db.create_database(parts[2])
+        print(f"Database '{parts[2]}' created.")
+
+    elif action_key == "DROP_DATABASE":
+        db.drop_database(parts[2])
+        print(f"Database '{parts[2]}' dropped.")
+
+    elif cmd == "USE":
+        db.use_database(parts[1])
+
+    elif action_key == "START_REPLICATION":
+        # START REPLICATION 7070
+        if session.replication:
+            print("Replication already running.")
+            return True
+        try:
+            session.replication = Primary(db, port=int(parts[2]) if len(parts) > 2 else DEFAULT_PORT).start()
+            print(f"Primary serving followers on port {session.replication.port} (LSN {session.replication.lsn}).")
+        except (ValueError, OSError) as e:
+            print(f"Error: {e}")
+
+    elif action_key == "REPLICATE":
+        # REPLICATE FROM 127.0.0.1:7070
+        if session.replication:
+            print("Replication already running.")
+            return True
+        if len(parts) < 3 or parts[1].upper() != "FROM":
+            print("Usage: REPLICATE FROM [host:port]")
+            return True
+        host, _, port = parts[2].rpartition(":")
+        try:
+            session.replication = Follower(db, host or "127.0.0.1", port or DEFAULT_PORT).start()
+            print(f"Following {session.replication.host}:{session.replication.port} (read-only from LSN {session.replication.applied_lsn}).")
+        except ValueError:
+            print("Usage: REPLICATE FROM [host:port]")
+
+    elif cmd == "SHOW" and len(parts) > 1:
+        if parts[1].upper() == "REPLICATION":
+            if not session.replication:
+                print("Replication is not running.")
+            for key, value in (session.replication.status().items() if session.replication else []):
+                print(f" {key:<13} {value}")
+        elif parts[1].upper() == "BUFFER":
+            for key, value in db.buffer_pool.stats().items():
+                print(f" {key:<13} {value}")
+        elif parts[1].upper() == "VACUUM":
+            for key, value in db.autovacuum.stats().items():
+                print(f" {key:<13} {value}")
+        elif parts[1].upper() == "DURABILITY":
+            for key, value in db.durability().stats().items():
+                print(f" {key:<13} {value}")
+        elif parts[1].upper() == "DATABASES":
+            dbs = db.show_databases()
+            print("\nDatabases:")
+            for d in dbs: print(f" - {d}")
+        elif parts[1].upper() == "TABLES":
+            tbls = db.show_tables()
+            print(f"\nTables in {db.current_db}:")
+            if not tbls: print(" (empty)")
+            for t in tbls: print(f" - {t}")
+
+    elif cmd == "SET" and len(parts) > 3 and parts[1].upper() == "BUFFER" and parts[2].upper() == "POOL":
+        # SET BUFFER POOL 64  (MB of table pages kept in memory)
+        try:
+            db.set_buffer_pool(parts[3])
+            print(f"Buffer pool set to {parts[3]} MB.")
+        except ValueError as e:
+            print(f"Error: {e}")
+
+    elif cmd == "SET" and len(parts) > 2 and parts[1].upper() == "AUTOVACUUM":
+        # SET AUTOVACUUM OFF  (deleted rows stay until VACUUM)
+        if parts[2].upper() not in ("ON", "OFF"):
+            print("Usage: SET AUTOVACUUM [ON|OFF]")
+        else:
+            db.set_autovacuum(parts[2].upper() == "ON")
+            print(f"Autovacuum {parts[2].lower()}.")
+
+    elif cmd == "SET" and len(parts) > 2 and parts[1].upper() == "PARALLEL":
+        try:
+            db.set_parallelism(int(parts[2]))
+            print(f"Parallelism set to {db.executor.workers} worker(s).")
+        except ValueError:
+            print("Usage: SET PARALLEL [n]")
+
+    elif cmd == "SET" and len(parts) > 2 and parts[1].upper() == "DURABILITY":
+        # SET DURABILITY batched 200 1000  (flush every 200 ms or 1000 writes)
+        try:
+            d = db.set_durability(parts[2].lower(), *[int(p) for p in parts[3:5]])
+            if d.mode == "batched":
+                print(f"Durability of '{db.current_db}' set to batched ({d.interval_ms} ms / {d.max_writes} writes).")
+            else:
+                print(f"Durability of '{db.current_db}' set to {d.mode}.")
+        except ValueError as e:
+            print(f"Error: {e}")
+
+    elif cmd == "DUMP" and len(parts) > 1 and parts[1].upper() == "DATABASE":
+        # DUMP DATABASE company_db TO backups/company
+        rest = parts[2:]
+        target = None
+        if len(rest) >= 2 and rest[-2].upper() == "TO":
+            target = rest[-1]
+            rest = rest[:-2]
+        try:
+            if session.role != "root":
+                # Only root may write a dump anywhere; other roles dump below <root>/_dumps
+                stamp = time.strftime("%Y%m%d-%H%M%S")
+                target = db.dump_path(target or f"dump_{rest[0] if rest else db.current_db}_{stamp}")
+            manifest = db.dump(target, rest[0] if rest else None)
+            total = sum(t["rows"] for t in manifest["tables"].values())
+            print(f"Dumped {len(manifest['tables'])} table(s), {total} row(s) to '{manifest['path']}'.")
+        except (ValueError, OSError) as e:
+            print(f"Error: {e}")
+
+    elif cmd == "ANALYZE":
+        # ANALYZE employees  (no table = every table in the database)
+        try:
+            stats = db.analyze(parts[1] if len(parts) > 1 else None)
+            for name, s in stats.items():
+                print(f"Analyzed '{name}': {s['row_count']} row(s).")
+        except ValueError as e:
+            print(f"Error: {e}")
+
+    elif cmd == "EXPLAIN":
+        # EXPLAIN SELECT * FROM employees WHERE salary > 100000
+        try:
+            plan = db.explain(line.split(None, 1)[1] if len(parts) > 1 else "")
+            print("-" * 40)
+            for key, value in plan.items():
+                print(f" {key:<15} {value}")
+            print("-" * 40)
+        except ValueError as e:
+            print(f"Error: {e}")
+
+    elif cmd == "CHECKPOINT":
+        print(f"Checkpoint complete ({db.checkpoint()} table(s) flushed).")
+
+    elif cmd == "VACUUM":
+        # VACUUM employees  (no table = every table in the database)
+        try:
+            for name, reclaimed in db.vacuum(parts[1] if len(parts) > 1 else None).items():
+                print(f"Vacuumed '{name}': {reclaimed} dead row(s) reclaimed.")
+        except ValueError as e:
+            print(f"Error: {e}")
+
+    # 3. TABLE MANAGEMENT
+    elif cmd == "CREATE" and len(parts) > 1 and parts[1].upper() == "MATERIALIZED":
+        # CREATE MATERIALIZED VIEW dept_pay AS SELECT dept_id, SUM(salary) FROM employees GROUP BY dept_id
+        m = re.match(r"CREATE\s+MATERIALIZED\s+VIEW\s+(\S+)\s+AS\s+(.+)$", line, re.I)
+        if not m:
+            print("Usage: CREATE MATERIALIZED VIEW [name] AS [SELECT ...]")
+            return True
+        try:
+            db.create_materialized_view(m.group(1), m.group(2))
+            print(f"Materialized view '{m.group(1)}' created.")
+        except ValueError as e:
+            print(f"Error: {e}")
+
+    elif cmd == "REFRESH":
+        # REFRESH MATERIALIZED VIEW dept_pay
+        if len(parts) < 4:
+            print("Usage: REFRESH MATERIALIZED VIEW [name]")
+            return True
+        try:
+            db.refresh_materialized_view(parts[3])
+            print(f"Materialized view '{parts[3]}' refreshed.")
+        except ValueError as e:
+            print(f"Error: {e}")
+
+    elif cmd == "CREATE" and parts[1].upper() == "TABLE":
+        # CREATE TABLE users id:int,name:str  (id:int:auto for AUTO_INCREMENT)
+        if len(parts) < 4:
+            print("Usage: CREATE TABLE [name] [col:type,...]")
+            return True
+        name = parts[2]
+        col_defs = parts[3].split(",")
+        cols = []
+        types = {}
+        auto = None
+        for c in col_defs:
+            if ":" in c:
+                cn, ct = c.split(":", 1)
+                if ct.lower().endswith(":auto"):
+                    ct = ct[:-5]
+                    auto = cn
+                cols.append(cn)
+                types[cn] = ct
+            else:
+                cols.append(c)
+        # Optional: PARTITION BY HASH [n] | PARTITION BY RANGE [b1,b2,...]
+        partition = None
+        page_rows = None
+        if len(parts) >= 5 and parts[4].upper() == "PAGED":
+            # Optional: PAGED [rows per page]
+            page_rows = parts[5] if len(parts) > 5 else PAGE_ROWS
+        if len(parts) >= 7 and parts[4].upper() == "PARTITION" and parts[5].upper() == "BY":
+            method = parts[6].upper()
+            arg = parts[7] if len(parts) > 7 else ""
+            if method == "HASH":
+                partition = {"method": "hash", "count": arg or 4}
+            elif method == "RANGE":
+                partition = {"method": "range", "bounds": [b for b in arg.split(",") if b]}
+        try:
+            db.create_table(name, cols, types, primary_key=cols[0], partition=partition,
+                            auto_increment=auto, page_rows=page_rows)
+            print(f"Table '{name}' created.")
+        except ValueError as e:
+            print(f"Error: {e}")
+
+    elif cmd == "DROP" and parts[1].upper() == "TABLE":
+        if db.drop_table(parts[2]):
+            print("Table dropped.")
+        else:
+            print("Table not found.")
+
+    elif cmd == "CREATE_INDEX":
+        # CREATE_INDEX employees role,tenure (INCLUDE name)
+        if len(parts) < 3:
+            print("Usage: CREATE_INDEX [table] [col1,col2] (INCLUDE [col,...])")
+            return True
+        t = db.get_table(parts[1])
+        if t:
+            include = parts[4].split(",") if len(parts) > 4 and parts[3].upper() == "INCLUDE" else None
+            t.create_index(parts[2], include)
+            if parts[2] in t.indexes:
+                print(f"Index on '{parts[2]}' created.")
+            else:
+                print("Index failed (unknown column).")
+        else:
+            print("Table not found.")
+
+    # 4. DATA MANIPULATION
+    elif cmd == "PREPARE":
+        # PREPARE by_dept AS SELECT * FROM employees WHERE dept_id = ?
+        m = re.match(r"PREPARE\s+(\w+)\s+AS\s+(.+)$", line, re.I)
+        if not m:
+            print("Usage: PREPARE [name] AS [statement]")
+            return True
+        try:
+            stmt = db.prepare(m.group(2))
+            session.prepared[m.group(1)] = m.group(2)
+            print(f"Prepared '{m.group(1)}' ({stmt.kind.upper()}, {stmt.params} parameter(s)).")
+        except ValueError as e:
+            print(f"Error: {e}")
+
+    elif cmd == "EXECUTE":
+        # EXECUTE by_dept(2)
+        m = re.match(r"EXECUTE\s+(\w+)\s*(?:\((.*)\))?\s*$", line, re.I)
+        if not m or m.group(1) not in session.prepared:
+            print("Usage: EXECUTE [name](val, ...) (PREPARE it first)")
+            return True
+        start_time = time.time()
+        try:
+            stmt = db.prepare(session.prepared[m.group(1)])
+            if not check(session.role, stmt.kind.upper()):
+                print(f"❌ Permission Denied: Role '{session.role}' cannot perform '{stmt.kind.upper()}'.")
+                return True
+            result = stmt.execute(*(parse_values(m.group(2)) if m.group(2) and m.group(2).strip() else []))
+            if stmt.kind == "select":
+                print_table(result)
+            elif stmt.kind == "insert":
+                print("Row inserted." if result is True else f"Row inserted (key={result}).")
+            else:
+                print(f"{result} row(s) {stmt.kind}d.")
+        except ValueError as e:
+            print(f"Error: {e}")
+        if session.timing:
+            print(f"⏱️ Time: {(time.time() - start_time):.5f}s")
+
+    elif cmd == "DEALLOCATE":
+        if len(parts) > 1 and session.prepared.pop(parts[-1], None):
+            print(f"Deallocated '{parts[-1]}'.")
+        else:
+            print("Prepared statement not found.")
+
+    elif (cmd == "INSERT" and re.search(r"\sVALUES\s*\(", line, re.I)) or \
+            (cmd == "UPDATE" and len(parts) > 2 and parts[2].upper() == "SET") or \
+            (cmd == "DELETE" and len(parts) > 3 and parts[3].upper() == "WHERE"):
+        # SQL forms go through the parser (quoted values may hold spaces and commas)
+        try:
+            result = db.execute(line)
+            if cmd == "INSERT":
+                print("Row inserted." if result is True else f"Row inserted (key={result}).")
+            else:
+                print(f"{result} row(s) {cmd.lower()}d.")
+        except ValueError as e:
+            print(f"Error: {e}")
+
+    elif cmd == "INSERT" and parts[1].upper() == "INTO":
+        # INSERT INTO users 1,Bob
+        if len(parts) < 4:
+            print("Usage: INSERT INTO [table] [val,val]")
+            return True
+        t = db.get_table(parts[2])
+        if t:
+            vals = [None if v.strip().upper() == "NULL" else v.strip() for v in parts[3].split(",")]
+            try:
+                key = t.insert(vals)
+                if t.auto_increment and key is not True:
+                    print(f"Row inserted ({t.auto_increment['column']}={key}).")
+                else:
+                    print("Row inserted.")
+            except Exception as e:
+                print(f"❌ Insert Error: {e}")
+        else:
+            print("Table not found.")
+
+    elif cmd == "UPDATE":
+        # UPDATE users 1 role:admin
+        if len(parts) < 4:
+            print("Usage: UPDATE [table] [pk] [col:val]")
+            return True
+        t = db.get_table(parts[1])
+        pk = parts[2]
+        if ":" not in parts[3]:
+            print("Error: Use col:val format")
+            return True
+        col, val = parts[3].split(":", 1)
+        try:
+            if t and t.update(pk, {col: val}):
+                print("Row updated.")
+            else:
+                print("Update failed (ID not found).")
+        except ValueError as e:
+            print(f"Error: {e}")
+
+    elif cmd == "DELETE" and parts[1].upper() == "FROM":
+        # DELETE FROM users 1
+        t = db.get_table(parts[2])
+        try:
+            if t and t.delete(parts[3]):
+                print("Row deleted.")
+            else:
+                print("Delete failed.")
+        except ValueError as e:
+            print(f"Error: {e}")
+
+    # 5. QUERYING & JOINS
+    elif cmd == "SELECT":
+        start_time = time.time()
+
+        # --- ORDER BY / LIMIT (parsed SQL, joins included) ---
+        if re.search(r"\s(ORDER\s+BY|LIMIT)\s", line, re.I):
+            try:
+                print_table(db.execute(line))
+            except ValueError as e:
+                print(f"Error: {e}")
+
+        # --- JOIN LOGIC ---
+        elif "JOIN" in parts:
+            try:
+                # Syntax: SELECT * FROM t1 LEFT JOIN t2 ON k1 k2
+                join_idx = parts.index("JOIN")
+                on_idx = parts.index("ON")
+
+                t1 = parts[3]
+                t2 = parts[join_idx + 1]
+                k1 = parts[on_idx + 1]
+                k2 = parts[on_idx + 2]
+
+                # Detect Join Type
+                j_type = "INNER"
+                prev = parts[join_idx - 1].upper()
+                if prev in ["LEFT", "RIGHT", "FULL", "CROSS"]:
+                    j_type = prev
+                elif parts[join_idx - 2].upper() == "FULL" and prev == "OUTER":
+                     j_type = "FULL"
+
+                results = db.join(t1, t2, k1, k2, j_type)
+                print_table(results)
+
+            except ValueError:
+                print("Syntax Error. Use: SELECT * FROM t1 [TYPE] JOIN t2 ON k1 k2")
+            except Exception as e:
+                print(f"Join Error: {e}")
+
+        # --- STANDARD SELECT ---
+        else:
+            t_name = parts[3]
+            t = db.get_table(t_name)
+            if t:
+                # SELECT col1,col2 FROM ... projects (covering indexes skip the rows)
+                columns = None if parts[1] == "*" else parts[1].split(",")
+                if "WHERE" in parts:
+                    try:
+                        # =, !=, <, >, <=, >=, IN, LIKE, IS NULL, AND/OR/NOT ('quoted values' may hold spaces)
+                        where = line[re.search(r"\sWHERE\s", line).end():]
+                        print_table(t.select(where, columns))
+                    except ValueError as e:
+                        print(f"Error parsing WHERE: {e}")
+                elif columns:
+                    print_table(t.select(None, columns))
+                else:
+                    print_table(t.rows)
+            else:
+                print(f"Table '{t_name}' not found.")
+
+        if session.timing:
+            print(f"⏱️ Time: {(time.time() - start_time):.5f}s")
+
+    else:
+        print("Unknown command.")
+
+    return True
+
+def run_script(session, lines, batch=None):
+    """Runs commands from a script, one per line ('--' comments, optional trailing ';').
+
+    batch=None persists every statement as the database's durability mode says;
+    batch=0 defers all writes to the end of the script, batch=N checkpoints every
+    N statements. Returns the number of statements executed.
+    """
+    db = session.db
+    count = 0
+    start_time = time.time()
+    if batch is not None:
+        db.defer_writes()
+    try:
+        for raw in lines:
+            line = raw.strip().rstrip(";").strip()
+            if not line or line.startswith("--"):
+                continue
+            print(f"\n{session.user}@{db.current_db}> {line}")
+            count += 1
+            if not run_command(session, line):
+                break
+            if batch and count % batch == 0:
+                db.checkpoint()
+    finally:
+        if batch is not None:
+            db.defer_writes(False)
+    elapsed = time.time() - start_time
+    print(f"\n✅ Script complete: {count} statement(s) in {elapsed:.3f}s "
+          f"({elapsed * 1000 / max(count, 1):.2f}ms per statement{', batched' if batch is not None else ''}).")
+    return count
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="EdSQL command line (interactive unless --file is given)")
+    parser.add_argument("--file", "-f", help="run commands from a script ('-' reads stdin)")
+    parser.add_argument("--user", "-u", default=os.environ.get("EDSQL_USER"), help="login user (default $EDSQL_USER)")
+    parser.add_argument("--password", "-p", default=os.environ.get("EDSQL_PASSWORD"),
+                        help="password (default $EDSQL_PASSWORD)")
+    parser.add_argument("--batch", nargs="?", type=int, const=0, metavar="N",
+                        help="defer persistence until the end of the script (or every N statements)")
+    args = parser.parse_args(argv)
+    if args.batch is not None and not args.file:
+        parser.error("--batch needs --file")
+    if args.batch is not None and args.batch < 0:
+        parser.error("--batch N must be positive")
+    return args
+
+def script_main(args):
+    """Non-interactive mode: credentials from flags/env, commands from --file"""
+    if not args.user or args.password is None:
+        print("❌ Script mode needs --user/--password (or EDSQL_USER/EDSQL_PASSWORD).", file=sys.stderr)
+        return 2
+    db = Database()
+    role = db.authenticate(args.user, args.password)
+    if not role:
+        print(f"❌ Login Failed for '{args.user}'.", file=sys.stderr)
+        return 1
+    session = Session(db, args.user, role, timing=False)
+    if args.file == "-":
+        run_script(session, sys.stdin, args.batch)
+    else:
+        with open(args.file, 'r', encoding='utf-8') as f:
+            run_script(session, f, args.batch)
+    if session.replication:
+        session.replication.close()
+    db.close()
+    return 0
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.file:
+        return script_main(args)
 
-def main():
     print("==========================================")
     print("********** WELCOME TO EdSQL **************")
     print("   🔐 EdSQL v5.0 (Enterprise CLI)         ")
@@ -58,18 +648,16 @@ def main():
     db = Database()
     
     # --- 1. LOGIN LOOP ---
-    current_user = None
-    current_role = None
+    session = None
     
-    while not current_user:
+    while not session:
         u = input("Login User: ").strip()
         if not u: continue
         p = getpass.getpass("Password: ")
         
         role = db.authenticate(u, p)
         if role:
-            current_user = u
-            current_role = role
+            session = Session(db, u, role)
             print("====================================================")
             print("   ✨ 🔓 ✨ EdSQL v5.0 (Enterprise CLI)  ")
             print(f"✅ Access Granted. Logged in as '{u}' ({role})")
@@ -83,221 +671,16 @@ def main():
     while True:
         try:
             # Context-aware prompt: admin@company_db>
-            prompt = f"\n{current_user}@{db.current_db}> "
+            prompt = f"\n{session.user}@{db.current_db}> "
             line = input(prompt).strip()
         except (EOFError, KeyboardInterrupt):
             print("\nGoodbye!")
             break
             
         if not line: continue
-        parts = line.split()
-        cmd = parts[0].upper()
-        
-        # --- EXIT ---
-        if cmd == "EXIT":
-            print("=" * 42)
-            print("******** GOODBYE FROM EdSQL **************")
-            print("   👋 EdSQL v5.0 (Enterprise CLI)         ")
-            print("   Hoping We'll See You Soon! 🤗")
-            print("=" * 42)
+        if not run_command(session, line):
             break
-            
-        # --- HELP ---
-        elif cmd == "HELP":
-            print("-" * 60)
-            print(" SYSTEM:   CREATE/DROP USER [name] [pass] [role] (Root Only)")
-            print(" DB:       CREATE/DROP DATABASE [name], USE [name], SHOW DATABASES")
-            print(" TABLE:    CREATE TABLE [name] [col:type,col:type]")
-            print("           DROP TABLE [name], SHOW TABLES")
-            print(" DATA:     INSERT INTO [table] [val1,val2]")
-            print("           UPDATE [table] [pk] [col:val]")
-            print("           DELETE FROM [table] [pk]")
-            print(" QUERY:    SELECT * FROM [t1] (WHERE [col] [val])")
-            print(" JOIN:     SELECT * FROM [t1] [LEFT/RIGHT/CROSS] JOIN [t2] ON [k1] [k2]")
-            print("-" * 60)
-            continue
-
-        # --- PERMISSION CHECK ---
-        # Some commands are Root-only regardless of the PERMS list
-        root_only_cmds = ["CREATE_USER", "DROP_USER", "CREATE_DATABASE", "DROP_DATABASE"]
-        
-        # Construct specific action key for granular checks
-        action_key = cmd
-        if len(parts) > 1:
-            if cmd == "CREATE" and parts[1].upper() == "USER": action_key = "CREATE_USER"
-            if cmd == "DROP" and parts[1].upper() == "USER": action_key = "DROP_USER"
-            if cmd == "CREATE" and parts[1].upper() == "DATABASE": action_key = "CREATE_DATABASE"
-            if cmd == "DROP" and parts[1].upper() == "DATABASE": action_key = "DROP_DATABASE"
-
-        if action_key in root_only_cmds and current_role != "root":
-            print("❌ Permission Denied: Root access required.")
-            continue
-            
-        if not check(current_role, cmd):
-            print(f"❌ Permission Denied: Role '{current_role}' cannot perform '{cmd}'.")
-            continue
-
-        # --- EXECUTE COMMANDS ---
-
-        # 1. USER MANAGEMENT
-        if action_key == "CREATE_USER":
-            # CREATE USER bob pass123 read_only
-            try:
-                db.create_user(parts[2], parts[3], parts[4])
-                print(f"User '{parts[2]}' created.")
-            except IndexError: print("Usage: CREATE USER [name] [pass] [role]")
-            except ValueError as e: print(f"Error: {e}")
-
-        elif action_key == "DROP_USER":
-            try:
-                db.drop_user(parts[2])
-                print(f"User '{parts[2]}' deleted.")
-            except ValueError as e: print(f"Error: {e}")
-
-        # 2. DATABASE MANAGEMENT
-        elif action_key == "CREATE_DATABASE":
-            db.create_database(parts[2])
-            print(f"Database '{parts[2]}' created.")
-
-        elif action_key == "DROP_DATABASE":
-            db.drop_database(parts[2])
-            print(f"Database '{parts[2]}' dropped.")
-
-        elif cmd == "USE":
-            db.use_database(parts[1])
-
-        elif cmd == "SHOW" and len(parts) > 1:
-            if parts[1].upper() == "DATABASES":
-                dbs = db.show_databases()
-                print("\nDatabases:")
-                for d in dbs: print(f" - {d}")
-            elif parts[1].upper() == "TABLES":
-                tbls = db.show_tables()
-                print(f"\nTables in {db.current_db}:")
-                if not tbls: print(" (empty)")
-                for t in tbls: print(f" - {t}")
-
-        # 3. TABLE MANAGEMENT
-        elif cmd == "CREATE" and parts[1].upper() == "TABLE":
-            # CREATE TABLE users id:int,name:str
-            if len(parts) < 4:
-                print("Usage: CREATE TABLE [name] [col:type,...]")
-                continue
-            name = parts[2]
-            col_defs = parts[3].split(",")
-            cols = []
-            types = {}
-            for c in col_defs:
-                if ":" in c:
-                    cn, ct = c.split(":")
-                    cols.append(cn)
-                    types[cn] = ct
-                else:
-                    cols.append(c)
-            db.create_table(name, cols, types, primary_key=cols[0])
-            print(f"Table '{name}' created.")
-
-        elif cmd == "DROP" and parts[1].upper() == "TABLE":
-            if db.drop_table(parts[2]):
-                print("Table dropped.")
-            else:
-                print("Table not found.")
-
-        # 4. DATA MANIPULATION
-        elif cmd == "INSERT" and parts[1].upper() == "INTO":
-            # INSERT INTO users 1,Bob
-            if len(parts) < 4:
-                print("Usage: INSERT INTO [table] [val,val]")
-                continue
-            t = db.get_table(parts[2])
-            if t:
-                vals = [v.strip() for v in parts[3].split(",")]
-                try:
-                    t.insert(vals)
-                    print("Row inserted.")
-                except Exception as e:
-                    print(f"❌ Insert Error: {e}")
-            else:
-                print("Table not found.")
-
-        elif cmd == "UPDATE":
-            # UPDATE users 1 role:admin
-            if len(parts) < 4:
-                print("Usage: UPDATE [table] [pk] [col:val]")
-                continue
-            t = db.get_table(parts[1])
-            pk = parts[2]
-            try:
-                col, val = parts[3].split(":", 1)
-                if t and t.update(pk, {col: val}):
-                    print("Row updated.")
-                else:
-                    print("Update failed (ID not found).")
-            except ValueError:
-                print("Error: Use col:val format")
-
-        elif cmd == "DELETE" and parts[1].upper() == "FROM":
-            # DELETE FROM users 1
-            t = db.get_table(parts[2])
-            if t and t.delete(parts[3]):
-                print("Row deleted.")
-            else:
-                print("Delete failed.")
-
-        # 5. QUERYING & JOINS
-        elif cmd == "SELECT":
-            start_time = time.time()
-            
-            # --- JOIN LOGIC ---
-            if "JOIN" in parts:
-                try:
-                    # Syntax: SELECT * FROM t1 LEFT JOIN t2 ON k1 k2
-                    join_idx = parts.index("JOIN")
-                    on_idx = parts.index("ON")
-                    
-                    t1 = parts[3]
-                    t2 = parts[join_idx + 1]
-                    k1 = parts[on_idx + 1]
-                    k2 = parts[on_idx + 2]
-                    
-                    # Detect Join Type
-                    j_type = "INNER"
-                    prev = parts[join_idx - 1].upper()
-                    if prev in ["LEFT", "RIGHT", "FULL", "CROSS"]:
-                        j_type = prev
-                    elif parts[join_idx - 2].upper() == "FULL" and prev == "OUTER":
-                         j_type = "FULL"
-
-                    results = db.join(t1, t2, k1, k2, j_type)
-                    print_table(results)
-                    
-                except ValueError:
-                    print("Syntax Error. Use: SELECT * FROM t1 [TYPE] JOIN t2 ON k1 k2")
-                except Exception as e:
-                    print(f"Join Error: {e}")
-
-            # --- STANDARD SELECT ---
-            else:
-                t_name = parts[3]
-                t = db.get_table(t_name)
-                if t:
-                    if "WHERE" in parts:
-                        try:
-                            idx = parts.index("WHERE")
-                            col = parts[idx + 1]
-                            val = parts[idx + 2]
-                            print_table(t.select_where(col, val))
-                        except:
-                            print("Error parsing WHERE.")
-                    else:
-                        print_table(t.rows)
-                else:
-                    print(f"Table '{t_name}' not found.")
-            
-            print(f"⏱️ Time: {(time.time() - start_time):.5f}s")
-
-        else:
-            print("Unknown command.")
+    return 0
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,405 @@
+"""
+Log-shipping replication for EdSQL.
+
+A Primary numbers every change of a Database with a log sequence number (LSN).
+Changes are row-level insert/update/delete plus CREATE/DROP TABLE,
+CREATE_INDEX and CREATE MATERIALIZED VIEW. Each record is appended to
+<root>/replication.log as one JSON line and streamed to followers over TCP.
+On close the Primary fingerprints every table into <root>/replication.state;
+the next Primary re-ships whatever changed while it was not running.
+
+A Follower asks for everything after its last applied LSN, replays the records
+into its own data folder and serves read-only queries. status() reports how far
+it lags behind the primary.
+
+    primary:   Primary(Database("data"), port=7070).start()
+    follower:  Follower(Database("replica"), "127.0.0.1", 7070).start()
+"""
+import hashlib
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+
+from db import replay
+
+DEFAULT_PORT = 7070
+HEARTBEAT_SECONDS = 1.0
+SNAPSHOT_CHUNK = 500        # rows per "load" record in the initial snapshot
+CHECKPOINT_RECORDS = 1000   # followers persist their LSN at least this often
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def _fingerprint(t):
+    """Digest of a table's definition and rows"""
+    digest = hashlib.sha1(json.dumps(t.schema(), sort_keys=True).encode())
+    for row in t.scan():
+        digest.update(json.dumps(row, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+# --- PRIMARY ---
+class Primary:
+    """Captures the change stream of db and serves it to followers"""
+    def __init__(self, db, host="127.0.0.1", port=DEFAULT_PORT):
+        self.db = db
+        self.host = host
+        self.port = port
+        self.log_file = os.path.join(db.root_folder, "replication.log")
+        self.state_file = os.path.join(db.root_folder, "replication.state")
+        self.lsn = 0
+        self.followers = 0
+        self._lock = threading.Lock()
+        self._appended = threading.Condition(self._lock)
+        self._server = None
+        self._closed = False
+        logged = {}                 # "db/table" -> None (table) or view query, as followers have them
+        if os.path.exists(self.log_file):
+            with open(self.log_file, 'r') as f:
+                for line in f:
+                    if line.endswith("\n"):
+                        record = json.loads(line)
+                        self.lsn = record["lsn"]
+                        key = f"{record['db']}/{record['table']}"
+                        if record["op"] in ("create_table", "create_view"):
+                            logged[key] = (record["new"] or {}).get("query")
+                        elif record["op"] == "drop_table":
+                            logged.pop(key, None)
+        state = {}
+        if os.path.exists(self.state_file):
+            with open(self.state_file, 'r') as f:
+                state = json.load(f)
+            os.remove(self.state_file)  # stale once this Primary logs (or crashes)
+        self._log = open(self.log_file, 'a')
+        # Without a matching state (first start, crash, foreign log) every table is re-shipped
+        self._snapshot(logged, state.get("tables", {}) if state.get("lsn") == self.lsn else {})
+        db.add_listener(self.capture)
+
+    def _snapshot(self, logged, shipped):
+        """Ships every table whose contents differ from what followers got: all of
+        them into an empty log, otherwise those written while no Primary ran"""
+        db = self.db
+        with db.lock:
+            previous = db.current_db
+            try:
+                present = set()
+                for db_name in sorted(db.show_databases()):
+                    db.use_database(db_name)
+                    views = db.materialized_views()
+                    changed = set()
+                    for name in sorted(db.show_tables()):
+                        if name in views:
+                            continue
+                        key = f"{db_name}/{name}"
+                        present.add(key)
+                        t = db.get_table(name)
+                        if key in shipped and shipped[key] == _fingerprint(t):
+                            continue
+                        if key in logged:
+                            self._append({"db": db_name, "table": name, "op": "drop_table", "old": None, "new": None})
+                        self._ship(db_name, name, t)
+                        changed.add(name)
+                    for name, query in views.items():
+                        key = f"{db_name}/{name}"
+                        present.add(key)
+                        if key in logged and logged[key] == query and not changed & set(db.views[name].bases):
+                            continue
+                        if key in logged:
+                            self._append({"db": db_name, "table": name, "op": "drop_table", "old": None, "new": None})
+                        self._append({"db": db_name, "table": name, "op": "create_view", "old": None, "new": {"query": query}})
+                for key in sorted(set(logged) - present):
+                    db_name, name = key.split("/", 1)
+                    self._append({"db": db_name, "table": name, "op": "drop_table", "old": None, "new": None})
+            finally:
+                db.use_database(previous)
+
+    def _ship(self, db_name, name, t):
+        self._append({"db": db_name, "table": name, "op": "create_table", "old": None, "new": t.schema()})
+        chunk = []
+        for row in t.scan():
+            chunk.append(row)
+            if len(chunk) == SNAPSHOT_CHUNK:
+                self._append({"db": db_name, "table": name, "op": "load", "old": None, "new": {"rows": chunk}})
+                chunk = []
+        if chunk:
+            self._append({"db": db_name, "table": name, "op": "load", "old": None, "new": {"rows": chunk}})
+
+    def _save_state(self):
+        """Fingerprints every table as of self.lsn, so the next Primary can spot offline writes"""
+        db = self.db
+        tables = {}
+        with db.lock:
+            previous = db.current_db
+            try:
+                for db_name in sorted(db.show_databases()):
+                    db.use_database(db_name)
+                    views = db.materialized_views()
+                    for name in db.show_tables():
+                        if name not in views:
+                            tables[f"{db_name}/{name}"] = _fingerprint(db.get_table(name))
+            finally:
+                db.use_database(previous)
+        with open(self.state_file, 'w') as f:
+            json.dump({"lsn": self.lsn, "tables": tables}, f)
+
+    def capture(self, table, op, old, new):
+        """Database listener: logs one change"""
+        self._append({"db": os.path.basename(table.folder), "table": table.name, "op": op, "old": old, "new": new})
+
+    def _append(self, record):
+        with self._lock:
+            self.lsn += 1
+            record["lsn"] = self.lsn
+            record["ts"] = time.time()
+            self._log.write(json.dumps(record) + "\n")
+            self._log.flush()
+            self._appended.notify_all()
+
+    def start(self):
+        """Listens for followers in the background (port=0 picks a free port)"""
+        primary = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                primary._serve(self.rfile, self.wfile)
+
+        self._server = _Server((self.host, self.port), Handler)
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="edsql-primary", daemon=True).start()
+        return self
+
+    def _serve(self, rfile, wfile):
+        """Sends the log after the follower's LSN, then tails it (heartbeats while idle)"""
+        try:
+            hello = json.loads(rfile.readline() or "{}")
+        except ValueError:
+            return
+        since = int(hello.get("from_lsn", 0))
+        sent = 0
+        with self._lock:
+            self.followers += 1
+            lsn = self.lsn
+        try:
+            # Tell the follower where the log ends before streaming, so its lag is real from the start
+            wfile.write((json.dumps({"op": "heartbeat", "lsn": lsn, "ts": time.time()}) + "\n").encode())
+            wfile.flush()
+            with open(self.log_file, 'r') as log:
+                pending = ""
+                while not self._closed:
+                    line = log.readline()
+                    if line:
+                        pending += line
+                        if not pending.endswith("\n"):
+                            continue  # the writer is mid-line
+                        sent = json.loads(pending)["lsn"]
+                        if sent > since:
+                            wfile.write(pending.encode())
+                        pending = ""
+                        continue
+                    wfile.flush()
+                    with self._lock:
+                        idle = self.lsn == sent and not self._appended.wait(HEARTBEAT_SECONDS)
+                        lsn = self.lsn
+                    if idle:
+                        wfile.write((json.dumps({"op": "heartbeat", "lsn": lsn, "ts": time.time()}) + "\n").encode())
+                        wfile.flush()
+        except OSError:
+            pass  # follower went away
+        finally:
+            with self._lock:
+                self.followers -= 1
+
+    def status(self):
+        return {"role": "primary", "port": self.port, "lsn": self.lsn, "followers": self.followers}
+
+    def close(self):
+        self._closed = True
+        self.db.remove_listener(self.capture)
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        with self._lock:
+            self._appended.notify_all()
+            self._log.close()
+        self._save_state()
+
+
+# --- FOLLOWER ---
+class Follower:
+    """Replays a primary's change stream into db, whose tables become read-only"""
+    def __init__(self, db, host="127.0.0.1", port=DEFAULT_PORT):
+        self.db = db
+        self.host = host
+        self.port = int(port)
+        db.read_only = True
+        for tables, _ in list(db.catalogs.values()):
+            for t in tables.values():
+                t.read_only = True
+        self.lsn_file = os.path.join(db.root_folder, "replica.lsn")
+        self.applied_lsn = 0
+        if os.path.exists(self.lsn_file):
+            with open(self.lsn_file, 'r') as f:
+                self.applied_lsn = int(f.read().strip() or 0)
+        self.saved_lsn = self.applied_lsn
+        self.primary_lsn = self.applied_lsn
+        self.last_ts = None         # primary time of the last applied record
+        self.connected = False
+        self.error = None
+        self._applied = threading.Condition()
+        self._prepared = set()      # databases switched to batched durability
+        self._closed = False
+        self._sock = None
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="edsql-follower", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        replay.active = True
+        while not self._closed:
+            try:
+                with socket.create_connection((self.host, self.port), timeout=5) as sock:
+                    self._sock = sock
+                    sock.settimeout(HEARTBEAT_SECONDS * 5)
+                    sock.sendall((json.dumps({"from_lsn": self.applied_lsn}) + "\n").encode())
+                    self.connected = True
+                    self.error = None
+                    for line in sock.makefile('r', encoding='utf-8'):
+                        self._receive(json.loads(line))
+                        if self._closed:
+                            break
+            except (OSError, ValueError) as e:
+                if not self._closed:
+                    self.error = str(e)
+            self.connected = False
+            self.checkpoint()
+            if not self._closed:
+                time.sleep(HEARTBEAT_SECONDS)  # reconnect and resume from applied_lsn
+
+    def _receive(self, record):
+        if record["op"] == "heartbeat":
+            self.primary_lsn = max(self.primary_lsn, record["lsn"])
+            if self.applied_lsn != self.saved_lsn:
+                self.checkpoint()
+            return
+        if record["lsn"] <= self.applied_lsn:
+            return  # already applied before a reconnect
+        self.apply(record)
+        with self._applied:
+            self.applied_lsn = record["lsn"]
+            self.primary_lsn = max(self.primary_lsn, record["lsn"])
+            self.last_ts = record["ts"]
+            self._applied.notify_all()
+        if self.applied_lsn - self.saved_lsn >= CHECKPOINT_RECORDS:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Flushes replayed tables, then records the LSN they reflect"""
+        lsn = self.applied_lsn
+        self.db.checkpoint()
+        with open(self.lsn_file, 'w') as f:
+            f.write(str(lsn))
+        self.saved_lsn = lsn
+
+    # --- APPLY ---
+    def apply(self, record):
+        """Replays one record; safe to repeat (records after saved_lsn replay after a crash).
+        The database is selected for the calling thread only, so readers keep their own."""
+        db = self.db
+        previous = db.current_db
+        with db.lock:
+            db.create_database(record["db"])
+        db.use_database(record["db"])
+        try:
+            if record["db"] not in self._prepared:
+                # The primary's log is the source of truth, so replicas flush in the background
+                if db.durability().mode == "strict":
+                    db.set_durability("batched")
+                self._prepared.add(record["db"])
+            self._apply(record)
+        finally:
+            db.use_database(previous)
+
+    def _apply(self, record):
+        db = self.db
+        op, name, old, new = record["op"], record["table"], record["old"], record["new"]
+        if op == "create_table":
+            auto = (new.get("auto_increment") or {}).get("column")
+            page_rows = (new.get("paging") or {}).get("page_rows")
+            t = db.create_table(name, new["columns"], new["types"], new["primary_key"], new["partition"], auto,
+                                page_rows)
+            t.foreign_keys = new["foreign_keys"]
+            t.save()
+            for index in new["indexes"]:
+                spec = new["index_defs"].get(index, {})
+                t.create_index(spec.get("columns", index), spec.get("include"))
+            return
+        if op == "drop_table":
+            db.drop_table(name)
+            return
+        if op == "create_view":
+            if not db.get_table(name):
+                db.create_materialized_view(name, new["query"])
+            return
+        t = db.get_table(name)
+        if t is None:
+            raise ValueError(f"Replication stream references missing table '{record['db']}.{name}'.")
+        if op == "load":
+            for row in new["rows"]:
+                self._upsert(t, row)
+        elif op == "insert":
+            self._upsert(t, new)
+        elif op == "update":
+            t.update(old.get(t.primary_key), new)
+        elif op == "delete":
+            t.delete(old.get(t.primary_key))
+        elif op == "create_index":
+            t.create_index(new["columns"], new["include"])
+
+    def _upsert(self, t, row):
+        try:
+            t.insert([row.get(c) for c in t.columns])
+        except ValueError:
+            # Replayed insert of a row that is already here
+            if not (t.primary_key and t.select_where(t.primary_key, row.get(t.primary_key))):
+                raise
+            t.update(row.get(t.primary_key), row)
+
+    # --- MONITORING ---
+    def wait_for(self, lsn, timeout=5.0):
+        """Blocks until lsn is applied (read-your-writes); returns False on timeout"""
+        with self._applied:
+            return self._applied.wait_for(lambda: self.applied_lsn >= lsn, timeout)
+
+    def status(self):
+        lag = max(0, self.primary_lsn - self.applied_lsn)
+        return {
+            "role": "follower",
+            "primary": f"{self.host}:{self.port}",
+            "connected": self.connected,
+            "applied_lsn": self.applied_lsn,
+            "primary_lsn": self.primary_lsn,
+            "lag_records": lag,
+            "lag_seconds": round(time.time() - self.last_ts, 3) if lag and self.last_ts else 0.0,
+            "error": self.error,
+        }
+
+    def close(self):
+        self._closed = True
+        if self._sock:
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        else:
+            self.checkpoint()
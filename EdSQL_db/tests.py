@@ -1,6 +1,11 @@
+import contextlib
+import io
+import json
 import os
 import shutil
-from db import Database
+import tempfile
+import time
+from db import Database, Table, PARALLEL_MIN_ROWS, PLAN_CACHE_SIZE, SORT_BUFFER_ROWS, AUTOVACUUM_THRESHOLD, AUTOVACUUM_SCALE
 
 def run_tests():
     print("===============================================================")
@@ -181,6 +186,829 @@ def run_tests():
     assert "employees" not in tables_after
     print("   [PASS] DROP TABLE working.")
 
+    #  TEST SUITE 8: PARTITIONED TABLES
+    #  Requirement: Segment files by PK range/hash, pruning on PK lookups
+    print("\n--- TEST SUITE 8: PARTITIONING ---")
+
+    t_log = db.create_table(
+        "audit_log",
+        ["id", "event"],
+        {"id": "int", "event": "str"},
+        primary_key="id",
+        partition={"method": "hash", "count": 4}
+    )
+    for i in range(1, 21):
+        t_log.insert([i, f"event-{i}"])
+    assert len(t_log.rows) == 20
+    assert "audit_log" in db.show_tables()
+    print("   [PASS] Hash partitioned INSERT spread across segments.")
+
+    # A fresh handle only loads the segment that owns the PK
+    reopened = Table("audit_log", [], folder=db.get_db_path())
+    assert reopened.select_where("id", 7)[0]["event"] == "event-7"
+    assert list(reopened.segments) == [reopened.segment_for(7)]
+    print("   [PASS] PK lookup pruned to a single segment.")
+
+    reopened.update(7, {"event": "changed"})
+    reopened.delete(8)
+    reopened.create_index("event")
+    again = Table("audit_log", [], folder=db.get_db_path())
+    assert again.select_where("event", "changed")[0]["id"] == 7
+    assert again.select_where("id", 8) == []
+    assert len(again.rows) == 19
+    print("   [PASS] UPDATE/DELETE/local indexes on segments.")
+
+    # Each segment keeps a PK index: writes find their slot instead of scanning
+    t_ev = db.create_table("events", ["id", "event"], {"id": "int", "event": "str"},
+                           primary_key="id", partition={"method": "hash", "count": 4})
+    for i in range(1, 21):
+        t_ev.insert([i, f"event-{i}"])
+    assert t_ev.update("abc", {"event": "x"}) is False and t_ev.delete("abc") is False
+    try:
+        t_ev.insert([9, "dup"])
+        raise AssertionError("duplicate PK accepted")
+    except ValueError:
+        pass
+    sid = t_ev.segment_for(9)
+    size = len(t_ev._segment(sid))
+    t_ev.delete(9)
+    t_ev.update(10, {"id": 1000})  # moves to another segment, leaves a tombstone
+    assert len(t_ev._segment(sid)) == size and t_ev.tombstones() == 2
+    assert t_ev.select_where("id", 1000)[0]["event"] == "event-10" and t_ev.select_where("id", 10) == []
+    assert t_ev.vacuum() == 2 and t_ev.tombstones() == 0
+    fresh = Table("events", [], folder=db.get_db_path())
+    assert len(fresh.rows) == 19 and fresh.select_where("id", 1000) and not fresh.select_where("id", 9)
+    assert db.drop_table("events")
+    print("   [PASS] Segment PK index, tombstone deletes and VACUUM.")
+
+    t_hist = db.create_table(
+        "history",
+        ["id", "note"],
+        {"id": "int", "note": "str"},
+        primary_key="id",
+        partition={"method": "range", "bounds": [100, 200]}
+    )
+    t_hist.insert([50, "old"])
+    t_hist.insert([150, "mid"])
+    t_hist.insert([250, "new"])
+    assert [t_hist.segment_for(v) for v in (50, 150, 250)] == [0, 1, 2]
+    assert db.drop_table("history")
+    assert not any(f.startswith("history.") for f in os.listdir(db.get_db_path()))
+    print("   [PASS] Range partitions and DROP TABLE removes segments.")
+
+    #  TEST SUITE 9: PARALLEL EXECUTION
+    #  Requirement: Chunked scans / hash-join probes match serial results
+    print("\n--- TEST SUITE 9: PARALLEL EXECUTION ---")
+
+    t_cust = db.create_table("customers", ["id", "tier"], {"id": "int", "tier": "str"}, primary_key="id")
+    t_ord = db.create_table("orders", ["oid", "cust_id"], {"oid": "int", "cust_id": "int"}, primary_key="oid")
+    for i in range(1, 11):
+        t_cust.insert([i, "gold" if i % 3 == 0 else "basic"])
+    for i in range(1, 31):
+        t_ord.insert([i, i % 12])
+
+    serial_scan = t_cust.select_where("tier", "gold")
+    serial_join = db.join("orders", "customers", "cust_id", "id", "FULL")
+
+    db.set_parallelism(2)
+    db.executor.min_rows, db.executor.cpus = 1, 2
+    # The first query of a table version scans serially; the next one shares it
+    assert t_cust.select_where("tier", "gold") == serial_scan and not db.executor._shared
+    assert t_cust.select_where("tier", "gold") == serial_scan and t_cust.filename in db.executor._shared
+    print("   [PASS] Parallel scan matches serial scan.")
+    assert db.join("orders", "customers", "cust_id", "id", "FULL") == serial_join
+    assert len(db.join("orders", "customers", "cust_id", "id", "INNER")) == 26 and t_ord.filename in db.executor._shared
+    print("   [PASS] Parallel hash join matches nested loop join.")
+    t_cust.insert([11, "gold"])
+    assert len(t_cust.select_where("tier", "gold")) == len(serial_scan) + 1
+    assert db.executor._shared[t_cust.filename][0] != t_cust.version
+    print("   [PASS] A write is not re-encoded until its version is queried again.")
+    db.set_parallelism(1)
+    db.executor.min_rows = PARALLEL_MIN_ROWS
+    # Serial executors never count rows (an unanalyzed partitioned table would load every segment)
+    counted = []
+    t_log.cardinality = lambda: counted.append(1) or 0
+    assert t_log.select("event = 'event-3'") and not counted
+    del t_log.cardinality
+    print("   [PASS] Row counts are only taken when the scan could go parallel.")
+
+    #  TEST SUITE 10: COMPOSITE & COVERING INDEXES
+    #  Requirement: (role, tenure) indexes, prefix matching, index-only scans
+    print("\n--- TEST SUITE 10: COMPOSITE INDEXES ---")
+
+    t_staff = db.create_table(
+        "staff",
+        ["id", "name", "role", "tenure"],
+        {"id": "int", "name": "str", "role": "str", "tenure": "int"},
+        primary_key="id",
+        partition={"method": "hash", "count": 2}
+    )
+    t_staff.insert([1, "Alice", "Software Dev", 2])
+    t_staff.insert([2, "Bob", "Software Dev", 4])
+    t_staff.insert([3, "Carol", "Designer", 2])
+    t_staff.insert([4, "Dan", "Software Dev", 2])
+    t_staff.create_index(["role", "tenure"], include=["name"])
+
+    devs = t_staff.select({"role": "Software Dev"})
+    assert sorted(r["id"] for r in devs) == [1, 2, 4]
+    print("   [PASS] Prefix match on leading column.")
+
+    # Covering index answers without loading any segment rows
+    fresh = Table("staff", [], folder=db.get_db_path())
+    names = fresh.select({"role": "Software Dev", "tenure": 2}, columns=["name"])
+    assert sorted(r["name"] for r in names) == ["Alice", "Dan"]
+    assert fresh.segments == {}
+    print("   [PASS] Covering index-only scan (no rows touched).")
+
+    fresh.update(2, {"tenure": 2})
+    names = fresh.select({"role": "Software Dev", "tenure": 2}, columns=["name"])
+    assert sorted(r["name"] for r in names) == ["Alice", "Bob", "Dan"]
+    print("   [PASS] Index entries follow UPDATE.")
+
+    #  TEST SUITE 11: WHERE CLAUSES
+    #  Requirement: Comparisons, IN, LIKE, IS NULL, AND/OR/NOT with typed values
+    print("\n--- TEST SUITE 11: WHERE CLAUSES ---")
+
+    t_pay = db.create_table(
+        "payroll",
+        ["id", "name", "salary", "manager"],
+        {"id": "int", "name": "str", "salary": "int", "manager": "int"},
+        primary_key="id"
+    )
+    t_pay.insert([1, "Alice", "120000", None])   # CLI-style text number
+    t_pay.insert([2, "Bob", 95000, 1])
+    t_pay.insert([3, "Carol", 150000, 1])
+    t_pay.insert([4, "Anne Marie", 60000, 2])
+
+    ids = lambda where: sorted(r["id"] for r in t_pay.select(where))
+    assert ids("salary >= 100000") == [1, 3]
+    assert ids("salary > 95000 AND NOT name LIKE 'C%'") == [1]
+    assert ids("name LIKE 'A%' OR id IN (2, 3)") == [1, 2, 3, 4]
+    assert ids("manager IS NULL") == [1]
+    assert ids("manager IS NOT NULL AND salary != 95000") == [3, 4]
+    assert ids("name = 'Anne Marie'") == [4]
+    assert ids("id 2") == [2]   # legacy WHERE [col] [val]
+    print("   [PASS] Typed comparisons and boolean logic.")
+
+    # Text values are stored in the declared type on INSERT and UPDATE
+    assert t_pay.select_where("id", 1)[0]["salary"] == 120000
+    assert t_pay.update("04", {"manager": "3"}) and t_pay.select_where("id", 4)[0]["manager"] == 3
+    try:
+        t_pay.update(4, {"salary": "lots"})
+        print("   [FAIL] UPDATE accepted text in an INT column.")
+    except ValueError:
+        pass
+    t_pay.update(4, {"manager": 2})
+    print("   [PASS] INSERT/UPDATE convert values to the column types.")
+
+    scanned = [ids("manager = '01'"), ids("id = '02'"), t_pay.select_where("manager", "01")]
+    t_pay.create_index("manager")
+    assert t_pay.explain("manager = '01'")["index"] == "manager"
+    assert [ids("manager = '01'"), ids("id = '02'"), t_pay.select_where("manager", "01")] == scanned
+    assert scanned[:2] == [[2, 3], [2]]
+    print("   [PASS] Index probes compare typed constants like scans.")
+
+    try:
+        t_pay.select("salary >")
+        print("   [FAIL] Malformed WHERE accepted.")
+    except ValueError:
+        print("   [PASS] Malformed WHERE rejected.")
+
+    #  TEST SUITE 12: MATERIALIZED VIEWS
+    #  Requirement: Views stored as tables, maintained from base table deltas
+    print("\n--- TEST SUITE 12: MATERIALIZED VIEWS ---")
+
+    db.create_materialized_view("pay_by_manager",
+        "SELECT manager, COUNT(*), SUM(salary), MAX(salary) FROM payroll WHERE manager IS NOT NULL GROUP BY manager")
+    db.create_materialized_view("orders_gold",
+        "SELECT oid, tier FROM orders JOIN customers ON cust_id id WHERE tier = 'gold'")
+    assert "pay_by_manager" in db.show_tables()
+    rollup = lambda: {r["manager"]: (r["count"], r["sum_salary"], r["max_salary"]) for r in db.get_table("pay_by_manager").rows}
+    assert rollup() == {1: (2, 245000, 150000), 2: (1, 60000, 60000)}
+    print("   [PASS] CREATE MATERIALIZED VIEW (GROUP BY rollup).")
+
+    t_pay.insert([5, "Eve", 70000, 2])
+    t_pay.update(3, {"salary": 40000})
+    t_pay.delete(2)
+    assert rollup() == {1: (1, 40000, 40000), 2: (2, 130000, 70000)}
+    t_pay.update(5, {"salary": 20000})  # lowers the group's MAX: recomputed once, not counted twice
+    assert rollup() == {1: (1, 40000, 40000), 2: (2, 80000, 60000)}
+    t_cust.update(1, {"tier": "gold"})
+    t_ord.delete(3)
+    gold = db.get_table("orders_gold").rows
+    assert sorted(r["oid"] for r in gold) == sorted(
+        r["oid"] for r in db.join("orders", "customers", "cust_id", "id") if r["tier"] == "gold")
+    print("   [PASS] Views maintained from INSERT/UPDATE/DELETE deltas.")
+
+    before = sorted(map(str, db.get_table("orders_gold").rows))
+    db.refresh_materialized_view("orders_gold")
+    assert sorted(map(str, db.get_table("orders_gold").rows)) == before
+    try:
+        db.get_table("orders_gold").insert([1, "gold"])
+        print("   [FAIL] View accepted a direct INSERT.")
+    except ValueError:
+        print("   [PASS] REFRESH matches incremental state; views are read-only.")
+
+    t_big = db.create_table("ledger", ["id", "amount"], {"id": "int", "amount": "int"}, primary_key="id")
+    for i in range(1, 301):
+        t_big.insert([i, i % 7])
+    v_big = db.create_materialized_view("ledger_small", "SELECT id, amount FROM ledger WHERE amount < 3")
+    v_big.create_index("amount")
+    for i in range(1, 201):
+        t_big.delete(i) if i % 2 else t_big.update(i, {"amount": 1})
+    expected = sorted((r["id"], r["amount"]) for r in t_big.rows if r["amount"] < 3)
+    assert sorted((r["id"], r["amount"]) for r in v_big.rows) == expected
+    assert sorted(r["id"] for r in v_big.select("amount = 1")) == [i for i, a in expected if a == 1]
+    assert v_big.tombstones() < 100  # compacted along with its lineage
+    with open(os.path.join(db.get_db_path(), "ledger_small.mv")) as f:
+        assert json.load(f) == {"query": "SELECT id, amount FROM ledger WHERE amount < 3"}
+    with open(v_big.filename) as f:
+        stored = json.load(f)
+    assert len(stored["view"]["lineage"]) == len(stored["rows"])
+    t_big.update(299, {"amount": 0})
+    assert sorted(r["id"] for r in v_big.select("amount = 0")) == [i for i, a in expected if a == 0] + [299]
+    print("   [PASS] View rows, lineage and indexes change in place and commit together.")
+
+    #  TEST SUITE 13: AUTO_INCREMENT SEQUENCES
+    #  Requirement: Engine-generated keys, persisted counter, block reservation
+    print("\n--- TEST SUITE 13: AUTO_INCREMENT ---")
+
+    t_tix = db.create_table("tickets", ["id", "title"], {"id": "int", "title": "str"},
+                            primary_key="id", auto_increment="id")
+    assert t_tix.insert([None, "first"]) == 1
+    assert t_tix.insert(["second"]) == 2
+    t_tix.insert([10, "explicit"])
+    assert t_tix.insert([None, "after"]) == 11
+    print("   [PASS] INSERT returns generated keys; explicit ids advance the sequence.")
+
+    block = t_tix.reserve_ids(5)
+    assert list(block) == [12, 13, 14, 15, 16]
+    for tid in block:
+        t_tix.insert([tid, f"batch{tid}"])
+    reopened = Table("tickets", [], folder=db.get_db_path())
+    assert reopened.auto_increment["next"] == 17
+    assert reopened.insert([None, "reloaded"]) == 17
+    print("   [PASS] Block reservation and counter persisted across reloads.")
+
+    import threading
+    keys = []
+    workers = [threading.Thread(target=lambda: keys.append(reopened.insert([None, "concurrent"]))) for _ in range(10)]
+    for w in workers: w.start()
+    for w in workers: w.join()
+    assert len(set(keys)) == 10 and min(keys) == 18
+    print("   [PASS] Concurrent inserts receive unique keys.")
+
+    #  TEST SUITE 14: DURABILITY MODES
+    #  Requirement: strict / batched / memory write policies, clean flush
+    print("\n--- TEST SUITE 14: DURABILITY ---")
+
+    live_on_disk = lambda t: [r for r in json.load(open(t.filename))["rows"] if r is not None]  # deletes leave null slots
+    on_disk = lambda t: len(live_on_disk(t))
+    db.create_database("cache_db")
+    db.use_database("cache_db")
+    db.set_durability("memory")
+    t_kv = db.create_table("kv", ["k", "v"], {"k": "int", "v": "str"}, primary_key="k")
+    for k in range(50):
+        t_kv.insert([k, f"v{k}"])
+    assert on_disk(t_kv) == 0 and len(db.get_table("kv").rows) == 50
+    db.use_database("cache_db")
+    assert db.get_table("kv") is t_kv  # unflushed tables are served from memory
+    assert db.checkpoint() == 1 and on_disk(t_kv) == 50
+    print("   [PASS] memory mode defers writes until CHECKPOINT.")
+
+    db.set_durability("batched", interval_ms=20, max_writes=10)
+    assert json.load(open(os.path.join(db.get_db_path(), "durability.cfg")))["mode"] == "batched"
+    t_kv = db.get_table("kv")
+    for k in range(50, 75):
+        t_kv.insert([k, f"v{k}"])
+    deadline = time.time() + 5
+    while db.durability().dirty and time.time() < deadline:
+        time.sleep(0.01)
+    assert on_disk(t_kv) == 75
+    print("   [PASS] batched mode flushed by the background writer.")
+
+    def full_disk(sync=False):
+        raise OSError(28, "No space left on device")
+    t_kv.flush = full_disk
+    t_kv.update(74, {"v": "retry"})
+    deadline = time.time() + 5
+    while not db.durability().error and time.time() < deadline:
+        time.sleep(0.01)
+    assert "No space left" in db.durability().stats()["error"] and db.durability()._thread.is_alive()
+    del t_kv.flush
+    while db.durability().dirty and time.time() < deadline:
+        time.sleep(0.01)
+    assert live_on_disk(t_kv)[-1]["v"] == "retry"
+    print("   [PASS] A failed background flush is reported and retried.")
+
+    db.set_durability("strict")
+    t_kv.delete(0)
+    assert on_disk(t_kv) == 74 and not os.path.exists(t_kv.filename + ".tmp")
+    db.set_durability("memory")
+    t_kv.update(1, {"v": "changed"})
+    db.close()
+    assert live_on_disk(t_kv)[0]["v"] == "changed"
+    print("   [PASS] strict mode writes through; close() flushes pending tables.")
+
+    #  TEST SUITE 15: STREAMING EXPORT & DUMP
+    #  Requirement: Chunked NDJSON/CSV export, consistent database snapshot
+    print("\n--- TEST SUITE 15: EXPORT & DUMP ---")
+
+    chunks = list(t_kv.export("ndjson", chunk_rows=10))
+    assert len(chunks) == 8 and sum(c.count("\n") for c in chunks) == 74
+    assert json.loads(chunks[0].splitlines()[0]) == t_kv.rows[0]
+    csv_text = "".join(t_kv.export("csv"))
+    assert csv_text.splitlines()[0] == "k,v" and len(csv_text.splitlines()) == 75
+    try:
+        t_kv.export("xml")
+        print("   [FAIL] Unknown export format accepted.")
+    except ValueError:
+        print("   [PASS] NDJSON/CSV export streams in chunks.")
+
+    db.use_database("company_db")
+    cold = Table("audit_log", [], folder=db.get_db_path())
+    assert sum(1 for _ in cold.scan()) == 19 and cold.segments == {}
+    print("   [PASS] Partitioned scan streams segments without caching them.")
+
+    manifest = db.dump(os.path.join("test_env", "backup"), "cache_db")
+    assert db.current_db == "company_db"
+    assert manifest["tables"]["kv"]["rows"] == 74 and manifest["tables"]["kv"]["primary_key"] == "k"
+    with open(os.path.join("test_env", "backup", "kv.ndjson")) as f:
+        assert [json.loads(line) for line in f] == t_kv.rows
+    assert os.path.exists(os.path.join("test_env", "backup", "manifest.json"))
+    print("   [PASS] DUMP DATABASE writes a snapshot of every table.")
+
+    #  TEST SUITE 16: ANALYZE & COST-BASED PLANNING
+    #  Requirement: Column stats drive index vs scan, join sides, EXPLAIN estimates
+    print("\n--- TEST SUITE 16: ANALYZE & EXPLAIN ---")
+
+    t_ev = db.create_table("events", ["id", "kind", "amount"], {"id": "int", "kind": "str", "amount": "int"}, primary_key="id")
+    for i in range(1, 1001):
+        t_ev.insert([i, "click" if i % 10 else f"buy_{i}", i if i % 50 else None])
+    t_ev.create_index("kind")
+    assert t_ev.explain("kind = 'click'")["access"] == "index"  # no stats: any index is used
+    stats = db.analyze("events")["events"]["columns"]
+    assert stats["kind"]["distinct"] == 101 and stats["amount"]["null_frac"] == 0.02
+    assert stats["amount"]["min"] == 1 and stats["amount"]["max"] == 999
+    assert os.path.exists(os.path.join(db.get_db_path(), "events.stats"))
+    print("   [PASS] ANALYZE collects distinct/null/min/max/histogram stats.")
+
+    assert t_ev.explain("kind = 'click'")["access"] == "scan"
+    assert t_ev.explain("kind = 'buy_10'")["access"] == "index"
+    assert len(t_ev.select("kind = 'click'")) == 900 and len(t_ev.select_where("kind", "click")) == 900
+    est = t_ev.explain("amount < 200")
+    assert 150 <= est["estimated_rows"] <= 250 and t_ev.explain("amount > 5000")["estimated_rows"] == 0
+    print("   [PASS] Skewed values scan, rare values use the index; range estimates.")
+
+    t_tag = db.create_table("tags", ["event_id", "tag"], {"event_id": "int", "tag": "str"}, primary_key="event_id")
+    for i in range(10, 1001, 10):
+        t_tag.insert([i, f"t{i}"])
+    plan = db.explain("SELECT * FROM events JOIN tags ON id event_id")
+    assert plan["algorithm"] == "hash" and plan["build"] == "tags" and plan["estimated_rows"] == 100
+    plan = db.explain("SELECT * FROM tags LEFT JOIN events ON event_id id")
+    assert plan["build"] == "tags" and plan["build_side"] == "left"
+    for a, b, k1, k2, jt in (("events", "tags", "id", "event_id", "INNER"), ("tags", "events", "event_id", "id", "LEFT"),
+                             ("tags", "events", "event_id", "id", "RIGHT")):
+        rows1, rows2 = db.get_table(a).rows, db.get_table(b).rows
+        expected = [{**r1, **r2} for r1 in rows1 for r2 in rows2 if str(r1[k1]) == str(r2[k2])]
+        got = db.join(a, b, k1, k2, jt)
+        assert got[:len(expected)] == expected
+        assert len(got) == len(expected) + (len(rows2) - len(expected) if jt == "RIGHT" else 0)
+    print("   [PASS] Joins hash the smaller side and keep nested-loop results.")
+
+    #  TEST SUITE 17: REPLICATION
+    #  Requirement: Primary ships row-level changes, followers replay read-only
+    print("\n--- TEST SUITE 17: REPLICATION ---")
+
+    from replication import Primary, Follower
+    p_db = Database(root_folder=os.path.join("test_env", "repl_primary"))
+    p_db.create_database("shop")
+    p_db.use_database("shop")
+    t_item = p_db.create_table("items", ["id", "name", "qty"], {"id": "int", "name": "str", "qty": "int"}, primary_key="id")
+    for i in range(1, 21):
+        t_item.insert([i, f"item{i}", i % 5])
+    # "audit" sorts (and is shipped) before its parent "items"
+    t_audit = p_db.create_table("audit", ["id", "item_id"], {"id": "int", "item_id": "int"}, primary_key="id")
+    t_audit.foreign_keys = {"item_id": "items"}
+    t_audit.save()
+    t_audit.insert([1, 2])
+    primary = Primary(p_db, port=0).start()
+    r_db = Database(root_folder=os.path.join("test_env", "repl_replica"))
+    follower = Follower(r_db, "127.0.0.1", primary.port).start()
+    t_item.create_index("name")
+    t_item.update(3, {"qty": 0})
+    t_item.delete(4)
+    t_item.insert([21, "late", 2])
+    assert follower.wait_for(primary.lsn)
+    r_db.use_database("shop")
+    replica = r_db.get_table("items")
+    assert replica.rows == t_item.rows and "name" in replica.indexes
+    assert r_db.get_table("audit").rows == [{"id": 1, "item_id": 2}]
+    assert follower.status()["lag_records"] == 0 and primary.status()["followers"] == 1
+    print("   [PASS] Snapshot + live changes replayed on the follower.")
+
+    r_db.use_database("default_db")
+    t_item.insert([22, "while reading", 1])
+    assert follower.wait_for(primary.lsn)
+    assert r_db.current_db == "default_db" and r_db.get_table("items") is None
+    r_db.use_database("shop")
+    assert r_db.get_table("items") is replica and replica.select("id = 22")
+    print("   [PASS] Replay selects databases per thread, not for the reading session.")
+
+    try:
+        replica.insert([99, "rogue", 1])
+        print("   [FAIL] Replica accepted a client write.")
+    except ValueError:
+        print("   [PASS] Follower tables are read-only.")
+
+    follower.close()
+    primary.close()
+    primary = Primary(p_db, port=0).start()
+    t_item.delete(5)
+    follower = Follower(Database(root_folder=os.path.join("test_env", "repl_replica")), "127.0.0.1", primary.port).start()
+    assert follower.applied_lsn > 0 and follower.wait_for(primary.lsn)
+    follower.db.use_database("shop")
+    assert follower.db.get_table("items").rows == t_item.rows
+    follower.close()
+    primary.close()
+    print("   [PASS] Restarted follower resumes from its saved LSN.")
+
+    # Writes made while no Primary runs are re-shipped by the next one
+    lsn = primary.lsn
+    t_item.update(6, {"qty": 42})
+    t_item.delete(7)
+    p_db.create_table("offline", ["id"], {"id": "int"}, primary_key="id").insert([1])
+    primary = Primary(p_db, port=0).start()
+    follower = Follower(Database(root_folder=os.path.join("test_env", "repl_replica")), "127.0.0.1", primary.port).start()
+    assert primary.lsn > lsn and follower.wait_for(primary.lsn)
+    follower.db.use_database("shop")
+    assert follower.db.get_table("items").rows == t_item.rows and follower.db.get_table("offline").rows == [{"id": 1}]
+    follower.close()
+    stuck = Follower(Database(root_folder=os.path.join("test_env", "repl_stuck")), "127.0.0.1", primary.port)
+    stuck.apply = lambda record: int("cannot apply")
+    stuck.start()
+    for _ in range(100):
+        if stuck.error:
+            break
+        time.sleep(0.05)
+    assert stuck.error and stuck.status()["lag_records"] == primary.lsn
+    stuck.close()
+    print("   [PASS] A follower that cannot apply reports its real lag.")
+    primary.close()
+    lsn = primary.lsn
+    primary = Primary(p_db, port=0)
+    assert primary.lsn == lsn  # nothing changed since close, nothing re-shipped
+    primary.close()
+    print("   [PASS] Writes made while no Primary ran are caught up on restart.")
+
+    #  TEST SUITE 18: PREPARED STATEMENTS & PLAN CACHE
+    #  Requirement: ? parameters, cached plans, invalidation on schema change, LRU eviction
+    print("\n--- TEST SUITE 18: PREPARED STATEMENTS ---")
+
+    db.create_database("prep_db")
+    db.use_database("prep_db")
+    t_acc = db.create_table("accounts", ["id", "owner", "tier"], {"id": "int", "owner": "str", "tier": "int"}, primary_key="id")
+    for i in range(1, 201):
+        t_acc.insert([i, f"owner {i}", i % 5])
+    stmt = db.prepare("SELECT owner FROM accounts WHERE id = ?")
+    assert stmt.execute(7) == [{"owner": "owner 7"}] and stmt.execute("8") == [{"owner": "owner 8"}]
+    assert db.prepare("SELECT owner FROM accounts WHERE id = ?") is stmt and stmt.replans == 1
+    assert db.execute("SELECT * FROM accounts WHERE tier = ? AND owner LIKE ?", 3, "owner 1%") == \
+        [r for r in t_acc.rows if r["tier"] == 3 and r["owner"].startswith("owner 1")]
+    assert db.execute("SELECT * FROM accounts WHERE tier IN (?, ?)", 1, 2) == t_acc.select("tier IN (1, 2)")
+    print("   [PASS] Prepared SELECT binds ? parameters and reuses the cached plan.")
+
+    tiered = db.prepare("SELECT * FROM accounts WHERE tier = ?")
+    assert tiered.plan is None and len(tiered.execute(4)) == 40 and tiered.plan["access"][0] is None
+    t_acc.create_index("tier")
+    assert len(tiered.execute(4)) == 40 and tiered.plan["access"][0] == "tier" and tiered.replans == 2
+    db.drop_table("accounts")
+    try:
+        tiered.execute(4)
+        assert False, "Dropped table should not be queryable"
+    except ValueError:
+        pass
+    t_acc = db.create_table("accounts", ["id", "owner", "tier"], {"id": "int", "owner": "str", "tier": "int"}, primary_key="id")
+    assert tiered.execute(4) == [] and tiered.replans == 3
+    print("   [PASS] CREATE_INDEX / DROP TABLE invalidate cached plans.")
+
+    assert db.execute("INSERT INTO accounts (id, owner) VALUES (?, ?)", 1, "Lee, Ann") is True
+    db.execute("INSERT INTO accounts VALUES (2, 'Van der Berg', 1)")
+    assert t_acc.select("id = 1") == [{"id": 1, "owner": "Lee, Ann", "tier": None}]
+    assert db.execute("UPDATE accounts SET tier = ?, owner = 'O Neil' WHERE tier IS NULL", 9) == 1
+    assert t_acc.select("tier = 9") == [{"id": 1, "owner": "O Neil", "tier": 9}]
+    assert db.execute("DELETE FROM accounts WHERE owner = ?", "Van der Berg") == 1 and len(t_acc.rows) == 1
+    for sql, args in (("SELECT * FROM accounts WHERE id = ?", ()), ("SELECT * FROM accounts", (1,))):
+        try:
+            db.execute(sql, *args)
+            assert False, "Parameter count should be checked"
+        except ValueError:
+            pass
+    try:
+        t_acc.select("id = ?")
+        assert False, "Unprepared ? should be rejected"
+    except ValueError:
+        pass
+    print("   [PASS] INSERT/UPDATE/DELETE with quoted values and parameters.")
+
+    first = db.prepare("SELECT * FROM accounts WHERE id = 0")
+    for i in range(1, PLAN_CACHE_SIZE + 1):
+        db.prepare(f"SELECT * FROM accounts WHERE id = {i}")
+    assert len(db.plan_cache) == PLAN_CACHE_SIZE and db.prepare("SELECT * FROM accounts WHERE id = 0") is not first
+    named = db.prepare("SELECT * FROM accounts WHERE owner = ?")
+    for i in range(PLAN_CACHE_SIZE + 1):
+        db.execute(f"UPDATE accounts SET tier = {i} WHERE id = 1")
+    assert db.prepare("SELECT * FROM accounts WHERE owner = ?") is named
+    assert not [key for key in db.plan_cache if key[1].startswith("UPDATE")]
+    db.drop_database("prep_db")
+    assert not [key for key in db.plan_cache if key[0] == "prep_db"]
+    print("   [PASS] Plan cache evicts least recently used statements (one-off literals skip it).")
+
+    #  TEST SUITE 19: SCRIPT RUNNER & BATCHED EXECUTION
+    #  Requirement: main.py --file runs scripts; --batch defers persistence to the end (or every N)
+    print("\n--- TEST SUITE 19: SCRIPT RUNNER ---")
+    from main import Session, run_command, run_script
+
+    db.create_database("script_db")
+    db.use_database("script_db")
+    t_log = db.create_table("log", ["id", "msg"], {"id": "int", "msg": "str"}, primary_key="id")
+    log_file = os.path.join(db.get_db_path(), "log.json")
+    db.defer_writes()
+    for i in range(1, 6):
+        t_log.insert([i, f"entry {i}"])
+    with open(log_file, 'r') as f:
+        assert json.load(f)["rows"] == []  # strict mode, yet nothing written while deferred
+    assert db.defer_writes(False) == 1
+    with open(log_file, 'r') as f:
+        assert len(json.load(f)["rows"]) == 5
+    t_log.insert([6, "entry 6"])
+    with open(log_file, 'r') as f:
+        assert len(json.load(f)["rows"]) == 6
+    print("   [PASS] defer_writes() holds strict commits until the checkpoint.")
+
+    session = Session(db, "admin", "root", timing=False)
+    script = io.StringIO("""-- seed script
+CREATE TABLE notes id:int,body:str
+
+INSERT INTO notes VALUES (1, 'hello, world');
+INSERT INTO notes (id, body) VALUES (2, 'second note');
+UPDATE notes SET body = 'edited' WHERE id = 2;
+SELECT * FROM notes WHERE id = 1
+""")
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        assert run_script(session, script, batch=2) == 5
+    assert "Script complete: 5 statement(s)" in out.getvalue() and "hello, world" in out.getvalue()
+    assert not db.deferred and not db.durability().dirty
+    reopened = Table("notes", [], folder=db.get_db_path())
+    assert [r["body"] for r in reopened.rows] == ["hello, world", "edited"]
+    print("   [PASS] run_script skips comments, strips ';' and flushes batched writes.")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert run_command(Session(db, "viewer", "read_only"), "DELETE FROM notes WHERE id = 1")
+        assert run_script(Session(db, "viewer", "read_only"), ["SHOW TABLES", "EXIT", "SHOW TABLES"]) == 2
+    db.use_database("script_db")
+    assert len(db.get_table("notes").rows) == 2
+    print("   [PASS] Scripts respect role permissions and stop at EXIT.")
+
+    viewer = Session(db, "viewer", "read_only")
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        for line in ("SET DURABILITY memory", "SET BUFFER POOL 1", "SET AUTOVACUUM OFF", "SET PARALLEL 1"):
+            run_command(viewer, line)
+    assert out.getvalue().count("Permission Denied") == 3 and "Parallelism set" in out.getvalue()
+    assert db.durability().mode == "strict" and db.autovacuum.enabled
+    print("   [PASS] read_only may only SET PARALLEL; server-wide settings need rw.")
+
+    editor = Session(db, "editor", "rw")
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        run_command(viewer, "DUMP DATABASE script_db TO viewer_dump")
+        run_command(editor, "DUMP DATABASE script_db TO ../escaped")
+        run_command(editor, "DUMP DATABASE script_db TO nightly")
+    assert "Permission Denied" in out.getvalue() and "Error: Dump target" in out.getvalue()
+    assert os.path.exists(os.path.join(db.root_folder, "_dumps", "nightly", "manifest.json"))
+    assert not os.path.exists(os.path.join(db.root_folder, "escaped")) and "_dumps" not in db.show_databases()
+    print("   [PASS] DUMP needs rw; non-root dumps stay inside the dump folder.")
+
+    #  TEST SUITE 20: PAGED TABLES & BUFFER POOL
+    #  Requirement: page files, bounded memory, LRU eviction, write-back of dirty pages
+    print("\n--- TEST SUITE 20: BUFFER POOL ---")
+
+    db.create_database("pool_db")
+    db.use_database("pool_db")
+    db.set_durability("memory")
+    t_hist = db.create_table("history", ["id", "kind", "amount"], {"id": "int", "kind": "str", "amount": "int"},
+                             primary_key="id", page_rows=100)
+    for i in range(1, 2001):
+        t_hist.insert([i, f"k{i % 4}", i])
+    assert t_hist.paging["pages"] == 20 and t_hist.cardinality() == 2000 and "id" in t_hist.indexes
+    db.set_buffer_pool(0.05)
+    pool = db.buffer_pool
+    assert pool.used <= pool.budget and 0 < len(t_hist.segments) < 20 and pool.writebacks > 0
+    assert db.checkpoint() == 1
+    assert os.path.exists(os.path.join(db.get_db_path(), "history.19.page"))
+    print("   [PASS] Paged table stays within the buffer pool budget (dirty pages written back).")
+
+    pool.evict()
+    misses = pool.misses
+    assert t_hist.select("id = 1234") == [{"id": 1234, "kind": "k2", "amount": 1234}]
+    assert pool.misses - misses <= 1  # PK index -> only the page holding the row
+    assert len(t_hist.select("amount > 1990")) == 10 and len(t_hist.select("kind = 'k1'")) == 500
+    assert sum(1 for _ in t_hist.scan()) == 2000 and pool.used <= pool.budget
+    assert t_hist.update(1234, {"amount": -1}) and t_hist.delete(1235) and not t_hist.delete(1235)
+    try:
+        t_hist.insert([5, "k0", 5])
+        assert False, "Duplicate PK should be rejected"
+    except ValueError:
+        pass
+    assert t_hist.cardinality() == 1999 and t_hist.select("id = 1235") == []
+    print("   [PASS] Lookups touch one page; scans stream; update/delete keep positions.")
+
+    db.checkpoint()
+    reopened = Table("history", [], folder=db.get_db_path())
+    assert reopened.paging["live"] == 1999 and len(reopened.segments) == 0
+    assert reopened.select("id = 1234")[0]["amount"] == -1 and len(reopened.segments) == 1
+    assert len(reopened.rows) == 1999 and reopened.select("id = 1235") == []
+    assert pool.stats()["index_mb"] > 0
+    idx_files = {f: os.path.getmtime(os.path.join(db.get_db_path(), f))
+                 for f in os.listdir(db.get_db_path()) if f.startswith("history.") and f.endswith(".idx")}
+    assert len(idx_files) == 20
+    time.sleep(0.01)
+    t_hist.update(150, {"amount": 0})
+    db.checkpoint()
+    changed = [f for f, mtime in idx_files.items() if os.path.getmtime(os.path.join(db.get_db_path(), f)) != mtime]
+    assert changed == ["history.1.idx"]
+    print("   [PASS] The index is stored per page; a commit rewrites only its page's part.")
+    db.drop_table("history")
+    assert not [f for f in os.listdir(db.get_db_path()) if f.startswith("history.")]
+    db.set_buffer_pool(256)
+    db.set_durability("strict")
+    print("   [PASS] Pages and the table-wide index persist; DROP removes every page.")
+
+    #  TEST SUITE 21: ORDER BY & LIMIT
+    #  Requirement: typed multi-key sorts, top-K heap, external sort, ordered index walks
+    print("\n--- TEST SUITE 21: ORDER BY ---")
+
+    db.create_database("sort_db")
+    db.use_database("sort_db")
+    db.set_durability("memory")
+    t_pay = db.create_table("payroll", ["id", "name", "dept", "salary"],
+                            {"id": "int", "name": "str", "dept": "int", "salary": "int"}, primary_key="id")
+    for i in range(1, 301):
+        # Passed as strings (as the CLI does): stored as ints, so 10000 sorts above 9000
+        t_pay.insert([i, f"emp{i % 37}", str(i % 5), None if i % 60 == 0 else str((i * 7919) % 20000)])
+    with_pay = [r for r in t_pay.rows if r["salary"] is not None]
+    by_pay = sorted(with_pay, key=lambda r: (-int(r["salary"]), r["id"]))
+    result = t_pay.select(order_by="salary DESC, id")
+    assert result[:len(with_pay)] == by_pay and all(r["salary"] is None for r in result[len(with_pay):])
+    assert t_pay.select(order_by="salary")[-1]["salary"] is None
+    mixed = t_pay.select("salary IS NOT NULL", ["dept", "name", "id"], order_by=[["dept", "DESC"], ["name", "ASC"], ["id", "DESC"]])
+    assert mixed == sorted(([{"dept": r["dept"], "name": r["name"], "id": r["id"]} for r in with_pay]),
+                           key=lambda r: (-int(r["dept"]), r["name"], -r["id"]))
+    print("   [PASS] Multi-key ASC/DESC compares declared types; NULLs sort last.")
+
+    assert t_pay.select(order_by="salary DESC, id", limit=10) == by_pay[:10]
+    assert t_pay.explain(order_by="salary DESC", limit=10)["order"] == "top-10 heap"
+    assert db.execute("SELECT id FROM payroll WHERE dept = ? ORDER BY salary DESC, id LIMIT ?", 2, 3) == \
+        [{"id": r["id"]} for r in by_pay if r["dept"] == 2][:3]
+    assert len(t_pay.select(limit=4)) == 4
+    try:
+        t_pay.select(order_by="bonus")
+        assert False, "Unknown ORDER BY column should be rejected"
+    except ValueError:
+        pass
+    print("   [PASS] LIMIT keeps a bounded heap (also as a prepared '?').")
+
+    spilled = []
+    real_temp = tempfile.TemporaryFile
+    def counting_temp(*args, **kwargs):
+        spilled.append(1)
+        return real_temp(*args, **kwargs)
+    tempfile.TemporaryFile = counting_temp
+    try:
+        t_pay.sort_buffer_rows = 50
+        assert t_pay.select(order_by="salary DESC, id") == result
+        assert list(t_pay.stream(order_by="salary DESC, id", limit=100)) == result[:100]
+    finally:
+        tempfile.TemporaryFile = real_temp
+        t_pay.sort_buffer_rows = SORT_BUFFER_ROWS
+    assert len(spilled) >= 12
+    print("   [PASS] Sorts over the memory limit merge sorted runs from temp files.")
+
+    t_pay.create_index("salary")
+    assert t_pay.explain(order_by="salary DESC", limit=5)["order"] == "index salary (no sort)"
+    assert t_pay.select(order_by="salary DESC, id") == result
+    assert t_pay.select(order_by="salary DESC, id", limit=10) == by_pay[:10]
+    t_pay.insert([999, "new", "4", "25000"])
+    assert t_pay.select(order_by="salary DESC", limit=1)[0]["id"] == 999
+    assert t_pay.select(order_by="salary, id", limit=1) == by_pay[-1:]
+    print("   [PASS] An index on the sort column returns rows in order without sorting.")
+
+    # New leading keys are slotted into the cached key order (no re-sort), and the
+    # string "None" is a value, not NULL
+    t_pay.create_index("name")
+    names = [r["name"] for r in t_pay.select(order_by="name DESC")]
+    cached = t_pay._key_order["name"][True]
+    t_pay.insert([1000, "None", "1", "100"])
+    t_pay.insert([1001, None, "1", "100"])
+    t_pay.insert([1002, "a-new", "1", "100"])
+    assert t_pay._key_order["name"][True] is cached
+    assert [r["name"] for r in t_pay.select(order_by="name DESC")] == \
+        sorted(names + ["None", "a-new"], reverse=True) + [None] * (names.count(None) + 1)
+    assert t_pay.select(order_by="name", limit=1)[0]["name"] == "None"
+    t_pay.indexes["name"]["None"] += t_pay.indexes["name"].pop("\x00NULL")  # as older versions saved it
+    t_pay.flush()
+    legacy = Table("payroll", [], folder=db.get_db_path())
+    assert len(legacy.indexes["name"]["None"]) == 1 and legacy.select(order_by="name DESC")[-1]["name"] is None
+    print("   [PASS] Writes keep the cached index order; NULL keys differ from 'None'.")
+
+    db.create_table("depts", ["dept", "title"], {"dept": "int", "title": "str"}, primary_key="dept")
+    for d in range(5):
+        db.get_table("depts").insert([d, f"D{d}"])
+    joined = db.execute("SELECT id, title FROM payroll JOIN depts ON dept = dept ORDER BY title DESC, id LIMIT 3")
+    assert [r["title"] for r in joined] == ["D4", "D4", "D4"] and [r["id"] for r in joined] == [4, 9, 14]
+    try:
+        db.create_materialized_view("top_pay", "SELECT dept, MAX(salary) FROM payroll GROUP BY dept ORDER BY dept")
+        assert False, "ORDER BY in a materialized view should be rejected"
+    except ValueError:
+        pass
+    db.set_durability("strict")
+    print("   [PASS] Joins sort and limit their output; views reject ORDER BY.")
+
+    #  TEST SUITE 22: TOMBSTONE DELETES & VACUUM
+    #  Requirement: O(1) deletes with stable positions, VACUUM and background compaction
+    print("\n--- TEST SUITE 22: VACUUM ---")
+
+    db.create_database("vacuum_db")
+    db.use_database("vacuum_db")
+    db.set_durability("memory")
+    db.set_autovacuum(False)
+    t_staff = db.create_table("staff", ["id", "team"], {"id": "int", "team": "int"}, primary_key="id")
+    t_staff.create_index("id")
+    t_staff.create_index("team")
+    for i in range(1, 201):
+        t_staff.insert([i, i % 4])
+    team_index = t_staff.indexes["team"]
+    for i in range(2, 201, 2):
+        assert t_staff.delete(i)
+    assert not t_staff.delete(2) and t_staff.indexes["team"] is team_index  # no index rebuild
+    assert t_staff.tombstones() == 100 and t_staff.cardinality() == 100 and len(t_staff.rows) == 100
+    assert [r["id"] for r in t_staff.select("team = 1")] == list(range(1, 201, 4))
+    assert t_staff.select("team = 2") == [] and t_staff.select("id = 7") == [{"id": 7, "team": 3}]
+    assert sum(1 for _ in t_staff.scan()) == 100 and t_staff.needs_vacuum()
+    rows_seen = t_staff.scan()
+    next(rows_seen)
+    assert t_staff.delete(199) and t_staff.insert([199, 3])  # slot tombstoned mid-scan
+    assert None not in list(rows_seen) and None not in t_staff.rows
+    try:
+        t_staff.insert([3, 0])
+        assert False, "Duplicate PK should be rejected"
+    except ValueError:
+        pass
+    assert t_staff.insert([2, 0]) and t_staff.update(2, {"team": 1}) and t_staff.select("id = 2")[0]["team"] == 1
+    db.checkpoint()
+    reopened = Table("staff", [], folder=db.get_db_path())
+    assert reopened.tombstones() == 101 and reopened.select("team = 3")[0]["id"] == 3
+    print("   [PASS] Deletes leave tombstones; indexes and positions stay valid.")
+
+    before = t_staff.select("team = 1")
+    with contextlib.redirect_stdout(io.StringIO()) as out:
+        run_command(Session(db, "admin", "root"), "VACUUM staff")
+    assert "101 dead row(s)" in out.getvalue()
+    assert t_staff.tombstones() == 0 and len(t_staff._rows) == 101 and t_staff.select("team = 1") == before
+    assert t_staff.vacuum() == 0 and t_staff.delete(1) and t_staff.select("id = 1") == []
+    db.checkpoint()
+    assert Table("staff", [], folder=db.get_db_path()).tombstones() == 1
+    print("   [PASS] VACUUM compacts rows and rebuilds indexes in one pass.")
+
+    t_log = db.create_table("log", ["id", "msg"], {"id": "int", "msg": "str"}, primary_key="id", page_rows=50)
+    for i in range(1, 501):
+        t_log.insert([i, f"m{i}"])
+    for i in range(1, 501):
+        if i % 5:
+            t_log.delete(i)
+    assert db.vacuum("log") == {"log": 400}
+    assert t_log.paging["pages"] == 2 and t_log.cardinality() == 100
+    assert not os.path.exists(os.path.join(db.get_db_path(), "log.2.page"))
+    assert t_log.select("id = 250") == [{"id": 250, "msg": "m250"}] and t_log.select("id = 251") == []
+    reopened = Table("log", [], folder=db.get_db_path())
+    assert [r["id"] for r in reopened.scan()] == list(range(5, 501, 5))
+    print("   [PASS] VACUUM rewrites paged tables into fewer pages.")
+
+    db.set_autovacuum(True)
+    t_temp = db.create_table("temps", ["id"], {"id": "int"}, primary_key="id")
+    t_temp.create_index("id")
+    for i in range(300):
+        t_temp.insert([i])
+    for i in range(200):
+        t_temp.delete(i)
+    assert db.autovacuum.wait() and db.autovacuum.stats()["runs"] >= 1
+    assert t_temp.tombstones() < AUTOVACUUM_THRESHOLD + AUTOVACUUM_SCALE * 300
+    assert [r["id"] for r in t_temp.rows] == list(range(200, 300)) and t_temp.select("id = 250") == [{"id": 250}]
+    db.set_durability("strict")
+    print("   [PASS] Autovacuum compacts tables past the dead-row threshold in the background.")
+
     print("\n✅✅✅ COMPLIANCE CHECK COMPLETE: ALL SYSTEMS ARE A GO 🥳. ✅✅✅")
 
 if __name__ == "__main__":